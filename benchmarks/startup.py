@@ -0,0 +1,231 @@
+"""
+Cold-start benchmark for the command-line and GUI entry points.
+
+    python -m benchmarks.startup run [--repeat 5] [--output startup.json]
+    python -m benchmarks.startup compare baseline.json candidate.json
+
+Every measurement runs in a fresh interpreter, so nothing is already imported. For each entry point
+it records the import time, the total process wall time and which heavy modules got loaded; the GUI
+is additionally timed from interpreter start to the first map of its window (skipped without a
+display or without customtkinter installed). `run` exits with status 1 if an entry point loads a
+module it must not, or exceeds its time budget.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Entry point -> (module imported, modules that must stay unloaded, import budget in ms)
+ENTRY_POINTS = {
+    "cli": ("main", ("tkinter", "customtkinter", "PIL", "requests"), 250),
+    "jobstore": ("src.jobstore", ("tkinter", "customtkinter", "PIL", "requests"), 250),
+    "watcher": ("src.watcher", ("tkinter", "customtkinter", "PIL", "requests"), 250),
+    "gui": ("ui.gui", ("PIL", "requests"), 800),
+}
+FIRST_PAINT_BUDGET_MS = 2000
+FIRST_PAINT_FORBIDDEN = ("PIL", "requests")  # Previews and icons load after the window is up
+HEAVY_MODULES = ("tkinter", "customtkinter", "PIL", "requests", "sqlite3", "ctypes")
+
+REGRESSION = 0.20  # compare: a time more than 20% above the baseline
+
+
+def _import_in_child(module):
+    start = time.perf_counter()
+    try:
+        __import__(module)
+    except ModuleNotFoundError as e:
+        if (e.name or "").split(".")[0] in ("main", "src", "ui", "benchmarks"):
+            raise
+        print(json.dumps({"skipped": f"{e.name} is not installed"}))  # Optional dependency (customtkinter)
+        return
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "import_ms": round(elapsed * 1000, 2),
+        "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def _first_paint_in_child(start):
+    """ start: time.time() of the parent just before spawning us, so interpreter startup is included. """
+    try:
+        from ui.gui import VideoCompressorGUI
+        app = VideoCompressorGUI()
+    except Exception as e:  # No display, or customtkinter missing
+        print(json.dumps({"skipped": f"{type(e).__name__}: {e}"}))
+        return
+    painted = {}
+
+    def on_map(event):
+        if event.widget is app and not painted:
+            painted["ms"] = round((time.time() - start) * 1000, 2)
+            painted["loaded"] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    app.bind("<Map>", on_map, add="+")
+    deadline = time.time() + 30
+    while not painted and time.time() < deadline:
+        app.update()
+    app.on_close()
+    if not painted:
+        print(json.dumps({"skipped": "window was never mapped"}))
+        return
+    print(json.dumps({"first_paint_ms": painted["ms"], "loaded": painted["loaded"]}))
+
+
+def _run_child(*args):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", *args],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    try:
+        record = json.loads(completed.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"error": (completed.stderr or "no output").strip()[-500:]}
+    record["wall_ms"] = round(wall_ms, 2)
+    return record
+
+
+def measure_entry_point(name, repeat):
+    """ Fastest of `repeat` cold imports of an entry point, with budget and forbidden-module checks. """
+    module, forbidden, budget_ms = ENTRY_POINTS[name]
+    runs = [_run_child("_import", module) for _ in range(repeat)]
+    errors = [run["error"] for run in runs if "error" in run]
+    skipped = next((run["skipped"] for run in runs if "skipped" in run), None)
+    if skipped:
+        return {"id": name, "module": module, "skipped": skipped, "problems": []}
+    if errors:
+        return {"id": name, "module": module, "error": errors[0], "problems": [f"{name}: import failed"]}
+    best = min(runs, key=lambda run: run["import_ms"])
+    record = {"id": name, "module": module, "import_ms": best["import_ms"], "wall_ms": best["wall_ms"],
+              "loaded": best["loaded"], "budget_ms": budget_ms, "problems": []}
+    for loaded in sorted(set(best["loaded"]) & set(forbidden)):
+        record["problems"].append(f"{name}: imports {loaded}")
+    if best["import_ms"] > budget_ms:
+        record["problems"].append(f"{name}: import {best['import_ms']:.0f} ms over the {budget_ms} ms budget")
+    return record
+
+
+def measure_first_paint(repeat):
+    runs = [_run_child("_paint", repr(time.time())) for _ in range(repeat)]
+    painted = [run for run in runs if "first_paint_ms" in run]
+    if not painted:
+        reason = next((run.get("skipped") or run.get("error") for run in runs), "no runs")
+        return {"id": "gui_first_paint", "skipped": reason, "problems": []}
+    best = min(painted, key=lambda run: run["first_paint_ms"])
+    record = {"id": "gui_first_paint", "first_paint_ms": best["first_paint_ms"], "loaded": best["loaded"],
+              "budget_ms": FIRST_PAINT_BUDGET_MS, "problems": []}
+    for loaded in sorted(set(best["loaded"]) & set(FIRST_PAINT_FORBIDDEN)):
+        record["problems"].append(f"gui_first_paint: {loaded} loaded before the first paint")
+    if best["first_paint_ms"] > FIRST_PAINT_BUDGET_MS:
+        record["problems"].append(
+            f"gui_first_paint: {best['first_paint_ms']:.0f} ms over the {FIRST_PAINT_BUDGET_MS} ms budget"
+        )
+    return record
+
+
+def run_startup(output_path, repeat=5, log=print):
+    results = []
+    for name in ENTRY_POINTS:
+        record = measure_entry_point(name, repeat)
+        results.append(record)
+        if "skipped" in record:
+            log(f"{name:<16} skipped ({record['skipped']})")
+        elif "error" in record:
+            log(f"{name:<16} FAILED: {record['error'].splitlines()[-1]}")
+        else:
+            log(f"{name:<16} import {record['import_ms']:7.1f} ms  process {record['wall_ms']:7.1f} ms  "
+                f"loads: {', '.join(record['loaded']) or '-'}")
+    paint = measure_first_paint(repeat)
+    results.append(paint)
+    if "skipped" in paint:
+        log(f"{'gui_first_paint':<16} skipped ({paint['skipped']})")
+    else:
+        log(f"{'gui_first_paint':<16} {paint['first_paint_ms']:7.1f} ms from interpreter start")
+
+    document = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    return document
+
+
+def compare_results(baseline, candidate):
+    """
+    :return: List of regression descriptions (empty if none).
+    """
+    base_cases = {record["id"]: record for record in baseline["results"]}
+    regressions = []
+    for record in candidate["results"]:
+        base = base_cases.get(record["id"])
+        if base is None:
+            continue
+        for key in ("import_ms", "first_paint_ms"):
+            if key in base and key in record and record[key] > base[key] * (1 + REGRESSION):
+                regressions.append(f"{record['id']}: {key} {base[key]:.1f} -> {record[key]:.1f}")
+        newly_loaded = sorted(set(record.get("loaded", ())) - set(base.get("loaded", ())))
+        if newly_loaded:
+            regressions.append(f"{record['id']}: now loads {', '.join(newly_loaded)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the entry points.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Measure and check the startup budgets")
+    run_parser.add_argument("--output", default="startup_results.json")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Runs per entry point; the fastest is kept")
+
+    compare_parser = subparsers.add_parser("compare", help="Flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    import_parser = subparsers.add_parser("_import")  # Internal: one cold import in a fresh process
+    import_parser.add_argument("module")
+    paint_parser = subparsers.add_parser("_paint")  # Internal: time to the GUI's first paint
+    paint_parser.add_argument("start", type=float)
+
+    args = parser.parse_args(argv)
+    if args.command == "_import":
+        _import_in_child(args.module)
+        return 0
+    if args.command == "_paint":
+        _first_paint_in_child(args.start)
+        return 0
+    if args.command == "run":
+        document = run_startup(args.output, repeat=max(1, args.repeat))
+        problems = [problem for record in document["results"] for problem in record["problems"]]
+        for problem in problems:
+            print(f"BUDGET {problem}")
+        print(f"Results written to {args.output}")
+        return 1 if problems else 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    regressions = compare_results(baseline, candidate)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("No regressions.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
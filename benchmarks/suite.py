@@ -0,0 +1,387 @@
+"""
+Reproducible encoding benchmark for compress_video.
+
+    python -m benchmarks.suite run [--quick] [--output results.json]
+    python -m benchmarks.suite compare baseline.json candidate.json
+
+Inputs are generated from ffmpeg's lavfi sources with bit-exact flags, so every run on the same
+ffmpeg build encodes identical clips. Each case runs in its own Python process with an empty cache
+directory: no learned rate statistics, pass logs or probe results leak between cases, and the peak
+RSS of the ffmpeg processes it spawned can be read from RUSAGE_CHILDREN.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+INPUT_DIR = os.path.join(ROOT, "benchmarks", "inputs")
+
+# Synthetic clips: lavfi video source, size, frame rate, duration and target size.
+# Motion/entropy levels range from a slow zoom (mandelbrot) to full-frame temporal noise.
+CLIPS = {
+    "testsrc2_720p30": {"source": "testsrc2=size=1280x720:rate=30", "duration": 20, "target_mb": 3},
+    "testsrc2_1080p60": {"source": "testsrc2=size=1920x1080:rate=60", "duration": 20, "target_mb": 6},
+    "mandelbrot_720p30": {"source": "mandelbrot=size=1280x720:rate=30", "duration": 20, "target_mb": 3},
+    "noise_low_720p30": {
+        "source": "color=c=gray:size=1280x720:rate=30,noise=alls=12:allf=u:all_seed=42",
+        "duration": 20, "target_mb": 4,
+    },
+    "noise_high_720p30": {
+        "source": "color=c=gray:size=1280x720:rate=30,noise=alls=40:allf=t+u:all_seed=42",
+        "duration": 20, "target_mb": 8,
+    },
+    "testsrc2_480p30_long": {"source": "testsrc2=size=854x480:rate=30", "duration": 90, "target_mb": 8},
+    # Gameplay-like: 6 s of calm picture, then 4 s of heavy motion, repeating
+    "mixed_motion_720p30": {
+        "source": "testsrc2=size=1280x720:rate=30,noise=alls=35:allf=t+u:all_seed=42:enable='gte(mod(t,10),6)'",
+        "duration": 40, "target_mb": 6,
+    },
+}
+QUICK_CLIPS = ("testsrc2_720p30", "noise_high_720p30", "mixed_motion_720p30")
+
+# CPU encoder paths: (codec, preset, rate mode, content_aware).
+# Rate modes: "1pass", "2pass" or "predictive" (one capped CRF pass from a sampled size/quality curve).
+# Predictive cases only run on clips long enough for compress_video to use the mode.
+MODES = [
+    ("h264", "medium", "1pass", False),
+    ("h264", "medium", "2pass", False),
+    ("h264", "medium", "2pass", True),
+    ("h264", "medium", "predictive", False),
+    ("h264", "veryfast", "1pass", False),
+    ("h264", "veryfast", "2pass", False),
+    ("h265", "medium", "1pass", False),
+    ("h265", "medium", "2pass", False),
+    ("h265", "medium", "2pass", True),
+    ("h265", "medium", "predictive", False),
+    ("h265", "fast", "2pass", False),
+]
+QUICK_MODES = [
+    ("h264", "veryfast", "1pass", False),
+    ("h264", "veryfast", "2pass", False),
+    ("h264", "veryfast", "2pass", True),
+    ("h264", "veryfast", "predictive", False),
+    ("h265", "fast", "2pass", False),
+]
+
+# compare: relative/absolute changes that count as regressions
+TIME_REGRESSION = 0.10  # Wall time up by more than 10%
+RSS_REGRESSION = 0.20  # Peak RSS up by more than 20%
+SIZE_ERROR_REGRESSION = 2.0  # |size error| worse by more than 2 percentage points
+SSIM_REGRESSION = 0.005  # SSIM down by more than this
+
+
+def _ffmpeg():
+    from src.paths import FFMPEG_PATH
+    return FFMPEG_PATH
+
+
+def clip_path(name):
+    return os.path.join(INPUT_DIR, f"{name}.mp4")
+
+
+def generate_clip(name, force=False):
+    """
+    Render a synthetic clip (with a sine tone for audio) once and keep it in benchmarks/inputs.
+    The intermediate is high quality x264 with bitexact flags, so it is identical across runs.
+    """
+    spec = CLIPS[name]
+    path = clip_path(name)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    tmp_path = path + ".tmp.mp4"
+    cmd = [
+        _ffmpeg(), "-hide_banner", "-nostats", "-loglevel", "error",
+        "-f", "lavfi", "-i", spec["source"],
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+        "-t", str(spec["duration"]),
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "8", "-g", "60", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "192k",
+        "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+        "-y", tmp_path,
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def case_id(clip, codec, preset, rate, content_aware=False):
+    return f"{clip}/{codec}/{preset}/{rate}" + ("/aware" if content_aware else "")
+
+
+def runs_mode(clip, rate):
+    """ Predictive mode falls back to bitrate mode below MIN_PREDICTIVE_DURATION, which would mislabel the case. """
+    from src.predictor import MIN_PREDICTIVE_DURATION
+    return rate != "predictive" or CLIPS[clip]["duration"] >= MIN_PREDICTIVE_DURATION
+
+
+def measure_ssim(output_path, reference_path):
+    """
+    Mean SSIM of an output against its source; the output is scaled to the reference size first.
+    :return: SSIM (0-1), or None if ffmpeg couldn't compute it.
+    """
+    cmd = [
+        _ffmpeg(), "-hide_banner", "-nostats",
+        "-i", output_path, "-i", reference_path,
+        "-lavfi", "[0:v][1:v]scale2ref=flags=bicubic[out][ref];[out][ref]ssim",
+        "-f", "null", "-",
+    ]
+    completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    match = re.search(r"All:([0-9.]+)", completed.stderr or "")
+    return float(match.group(1)) if match else None
+
+
+def _run_case_in_child(spec):
+    """
+    Body of a case, executed in the child process started by run_case(). Prints one JSON line.
+    """
+    from src.compressor import compress_video
+    from src.passlog import PassLogCache
+    from src.rate_control import RateController
+
+    workdir = spec["workdir"]
+    result = compress_video(
+        spec["input"], spec["output"], spec["target_mb"], use_gpu=False, use_two_pass=spec["rate"] == "2pass",
+        use_predictive=spec["rate"] == "predictive", codec=spec["codec"], preset=spec["preset"], log=None, allow_fast_paths=False, auto_scale=False,
+        use_output_cache=False, use_complexity=spec["content_aware"],
+        rate_controller=RateController(stats_path=os.path.join(workdir, "rate_stats.json")),
+        passlog_cache=PassLogCache(directory=os.path.join(workdir, "passlogs")),
+    )
+    analysis = next(
+        (match for match in (re.match(r"Complexity analysis took ([0-9.]+)s", m) for m in result.messages) if match), None
+    )
+    try:
+        import resource
+    except ImportError:  # Windows
+        peak_mb = None
+    else:
+        # ru_maxrss is the largest peak of any waited-for child: KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    print(json.dumps({
+        "success": result.success,
+        "error": result.error,
+        "encoder": result.encoder,
+        "attempts": result.attempts,
+        "elapsed": result.elapsed,
+        "output_size": result.output_size,
+        "peak_rss_mb": peak_mb,
+        "analysis_seconds": float(analysis.group(1)) if analysis else None,
+    }))
+
+
+def run_case(clip, codec, preset, rate, content_aware, workdir):
+    spec = CLIPS[clip]
+    input_path = clip_path(clip)
+    case_dir = tempfile.mkdtemp(prefix="case-", dir=workdir)
+    output_path = os.path.join(case_dir, "output.mp4")
+    child_spec = {
+        "input": input_path, "output": output_path, "target_mb": spec["target_mb"],
+        "codec": codec, "preset": preset, "rate": rate, "content_aware": content_aware, "workdir": case_dir,
+    }
+    env = dict(os.environ, COMPRESSOR_CACHE_DIR=os.path.join(case_dir, "cache"))
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "_case", json.dumps(child_spec)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    wall = time.perf_counter() - start
+    record = {
+        "id": case_id(clip, codec, preset, rate, content_aware), "clip": clip, "codec": codec, "preset": preset,
+        "rate": rate, "content_aware": content_aware, "target_mb": spec["target_mb"], "wall": round(wall, 3),
+    }
+    try:
+        child = json.loads(completed.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        record.update(success=False, error=(completed.stderr or "benchmark child produced no result").strip()[-500:])
+        return record
+
+    record.update(success=child["success"], error=child["error"], encoder=child["encoder"],
+                  attempts=child["attempts"], encode_seconds=round(child["elapsed"], 3),
+                  peak_rss_mb=round(child["peak_rss_mb"], 1) if child["peak_rss_mb"] is not None else None,
+                  analysis_seconds=child.get("analysis_seconds"))
+    if child["success"] and child["output_size"]:
+        frames = spec["duration"] * _clip_fps(spec)
+        size_mb = child["output_size"] / (1024 * 1024)
+        record.update(
+            encode_fps=round(frames / child["elapsed"], 2) if child["elapsed"] else None,
+            size_mb=round(size_mb, 4),
+            size_error_pct=round((size_mb - spec["target_mb"]) / spec["target_mb"] * 100, 2),
+            ssim=measure_ssim(output_path, input_path),
+        )
+    shutil.rmtree(case_dir, ignore_errors=True)
+    return record
+
+
+def _clip_fps(spec):
+    match = re.search(r"rate=([0-9.]+)", spec["source"])
+    return float(match.group(1)) if match else 25.0
+
+
+def _ffmpeg_version():
+    try:
+        completed = subprocess.run([_ffmpeg(), "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return completed.stdout.splitlines()[0] if completed.stdout else None
+    except OSError:
+        return None
+
+
+def run_suite(clips, modes, output_path, repeat=1, log=print):
+    """
+    Generate inputs, run every clip x mode case and write the results as JSON.
+    :param repeat: Runs per case; the fastest wall time is kept to reduce scheduler noise.
+    :return: The results document.
+    """
+    for clip in clips:
+        generate_clip(clip)
+    workdir = tempfile.mkdtemp(prefix="compressor-bench-")
+    results = []
+    try:
+        for clip in clips:
+            for codec, preset, rate, content_aware in modes:
+                if not runs_mode(clip, rate):
+                    continue
+                runs = [run_case(clip, codec, preset, rate, content_aware, workdir) for _ in range(repeat)]
+                best = min(runs, key=lambda record: record["wall"] if record["success"] else float("inf"))
+                results.append(best)
+                if log:
+                    if best["success"]:
+                        log(f"{best['id']:<48} {best['wall']:7.2f}s  {best.get('encode_fps') or 0:7.1f} fps  "
+                            f"{best.get('peak_rss_mb') or 0:7.1f} MB RSS  {best.get('size_error_pct', 0):+6.2f}%  "
+                            f"SSIM {best.get('ssim') if best.get('ssim') is not None else 'n/a'}")
+                    else:
+                        log(f"{best['id']:<48} FAILED: {best['error']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    gains = content_aware_gains(results)
+    if log:
+        for gain in gains:
+            log(f"{gain['id']:<48} content-aware: SSIM {gain['ssim_delta']:+.4f}, size {gain['size_delta_pct']:+.2f}%, "
+                f"analysis {gain['analysis_share'] * 100:.1f}% of encode time")
+
+    document = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ffmpeg": _ffmpeg_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": results,
+        "content_aware": gains,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    return document
+
+
+def content_aware_gains(results):
+    """
+    Pair every content-aware case with the same case using even allocation.
+    :return: List of {"id", "ssim_delta", "size_delta_pct", "analysis_share"} for pairs where both succeeded.
+    """
+    cases = {record["id"]: record for record in results}
+    gains = []
+    for record in results:
+        if not record.get("content_aware"):
+            continue
+        even = cases.get(case_id(record["clip"], record["codec"], record["preset"], record["rate"]))
+        if not (even and even["success"] and record["success"]) or None in (even.get("ssim"), record.get("ssim")):
+            continue
+        gains.append({
+            "id": record["id"],
+            "ssim_delta": round(record["ssim"] - even["ssim"], 5),
+            "size_delta_pct": round((record["size_mb"] - even["size_mb"]) / even["size_mb"] * 100, 2),
+            "analysis_share": round((record.get("analysis_seconds") or 0) / record["encode_seconds"], 4)
+            if record["encode_seconds"] else 0.0,
+        })
+    return gains
+
+
+def compare_results(baseline, candidate):
+    """
+    Compare two result documents case by case.
+    :return: List of regression descriptions (empty if none).
+    """
+    base_cases = {record["id"]: record for record in baseline["results"]}
+    regressions = []
+    for record in candidate["results"]:
+        base = base_cases.get(record["id"])
+        if base is None:
+            continue
+        case = record["id"]
+        if base["success"] and not record["success"]:
+            regressions.append(f"{case}: now fails ({record['error']})")
+            continue
+        if not (base["success"] and record["success"]):
+            continue
+        # Encode time excludes the child interpreter's startup, so it is the less noisy figure
+        time_key = "encode_seconds" if "encode_seconds" in base and "encode_seconds" in record else "wall"
+        if record[time_key] > base[time_key] * (1 + TIME_REGRESSION):
+            regressions.append(f"{case}: encode time {base[time_key]:.2f}s -> {record[time_key]:.2f}s")
+        if base.get("peak_rss_mb") and (record.get("peak_rss_mb") or 0) > base["peak_rss_mb"] * (1 + RSS_REGRESSION):
+            regressions.append(f"{case}: peak RSS {base['peak_rss_mb']:.1f} MB -> {record['peak_rss_mb']:.1f} MB")
+        if "size_error_pct" not in base or "size_error_pct" not in record:
+            continue
+        base_error, new_error = abs(base["size_error_pct"]), abs(record["size_error_pct"])
+        if new_error > base_error + SIZE_ERROR_REGRESSION or (record["size_error_pct"] > 0 >= base["size_error_pct"]):
+            regressions.append(f"{case}: size error {base['size_error_pct']:+.2f}% -> {record['size_error_pct']:+.2f}%")
+        if base.get("ssim") is not None and record.get("ssim") is not None and record["ssim"] < base["ssim"] - SSIM_REGRESSION:
+            regressions.append(f"{case}: SSIM {base['ssim']:.4f} -> {record['ssim']:.4f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark compress_video on synthetic clips.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark suite")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--quick", action="store_true", help="Small subset of clips and modes")
+    run_parser.add_argument("--clip", action="append", choices=sorted(CLIPS), help="Only these clips (repeatable)")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is kept")
+
+    compare_parser = subparsers.add_parser("compare", help="Flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    case_parser = subparsers.add_parser("_case")  # Internal: one case in a fresh process
+    case_parser.add_argument("spec")
+
+    args = parser.parse_args(argv)
+    if args.command == "_case":
+        _run_case_in_child(json.loads(args.spec))
+        return 0
+    if args.command == "run":
+        clips = args.clip or (QUICK_CLIPS if args.quick else list(CLIPS))
+        modes = QUICK_MODES if args.quick else MODES
+        run_suite(clips, modes, args.output, repeat=max(1, args.repeat))
+        print(f"Results written to {args.output}")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    regressions = compare_results(baseline, candidate)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("No regressions.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,77 +1,206 @@
 import os
-from src.compressor import compress_video
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def generate_output_filename(input_video, target_size, custom_name=None, output_dir=None):
-    """
-    Generates an output filename based on user input or defaults to original filename with compression details.
-    Preserves the original file extension.
-    """
-    filename, ext = os.path.splitext(os.path.basename(input_video))
+from src.batch import BatchCompressor
+from src.helpers import generate_output_filename
+from src.metrics import JsonLinesHook, MetricsAggregator, add_hook, write_prometheus
+from src.probe import probe_media, ProbeError
+from src.ranges import parse_ranges
+from src.watcher import VIDEO_EXTENSIONS
 
-    # Ensure custom name has an extension (preserve original extension)
-    if custom_name and not os.path.splitext(custom_name)[1]:
-        custom_name += ext  
 
-    # Use custom name or auto-generate filename
-    output_filename = custom_name if custom_name else f"{filename}_{target_size}MB_compressed{ext}"
+def log(message):
+    """ Status messages go to stderr so stdout carries only the JSON summary. """
+    print(message, file=sys.stderr, flush=True)
 
-    # Use selected output directory or default to input file's directory
-    output_folder = output_dir or os.path.dirname(input_video)
 
-    return os.path.join(output_folder, output_filename)
+def expand_inputs(patterns, recursive=False):
+    """
+    Turn command-line arguments into a list of input files.
+    Files are taken as given, globs are expanded, and directories contribute the videos inside them
+    (skipping earlier outputs). Duplicates are dropped, keeping the first occurrence.
+    :param recursive: Descend into subdirectories (also enables ** in globs).
+    :return: (paths, list of (argument, error) for arguments that matched nothing).
+    """
+    paths, missing = [], []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = []
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                matches.extend(
+                    os.path.join(root, name) for name in sorted(files)
+                    if name.lower().endswith(VIDEO_EXTENSIONS) and not os.path.splitext(name)[0].endswith("_compressed")
+                )
+                if not recursive:
+                    break
+        elif glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=recursive) if os.path.isfile(path))
+        else:
+            matches = [pattern]
+        if not matches:
+            missing.append((pattern, "no videos matched"))
+        paths.extend(matches)
+
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique, missing
 
-def validate_input_file(input_video):
-    """ Validates the input file exists before compressing. """
-    if not os.path.exists(input_video):
-        print(f"Error: Input video '{input_video}' not found.")
-        exit(1)
 
-if __name__ == "__main__":
-    # Video file selected via GUI (drag-and-drop or browse)
-    input_video = "C:/Users/imti/Documents/Programming/Compressor/clips/ezgame.mp4"  # Example, replace via GUI
-    
-    validate_input_file(input_video)
-
-    # Optional User-selected output folder (None = same folder as input)
-    custom_output_folder = None  
-
-    # Optional User-defined output filename (None = auto-generated)
-    custom_output_name = None  
-
-    # Compression parameters
-    target_size = 10  # Target size in MB
-    use_gpu = True  # Enable GPU encoding if available
-    use_h265 = True  # Use H.265 encoding if available (H.264 will be used if False or unsupported)
-    use_two_pass = True  # Enable two-pass encoding where supported
-
-    # Select codec based on user preference
-    codec = "h265" if use_h265 else "h264"  
-
-    # Convert empty values to None to prevent unintended behavior
-    custom_output_folder = custom_output_folder or None
-    custom_output_name = custom_output_name or None
-
-    # Generate output filename
-    output_video = generate_output_filename(input_video, target_size, custom_output_name, custom_output_folder)
-
-    # Print selected options for confirmation
-    print(f"Compressing: {input_video} → {output_video}")
-    print(f"Input Video: {input_video}")
-    print(f"Output Video: {output_video}")
-    print(f"Target Size: {target_size} MB")
-    print(f"Using GPU: {'Yes' if use_gpu else 'No'}")
-    print(f"Codec: {codec}")
-    print(f"Two-Pass Encoding: {'Enabled' if use_two_pass else 'Disabled'}")
-
-    # Call the compression function
-    compress_video(
-        input_path=input_video,
-        output_path=output_video,
-        target_size_mb=target_size,
-        use_gpu=use_gpu,
-        use_two_pass=use_two_pass,
-        codec=codec,
+def validate_input_file(input_video):
+    """
+    Check that an input can be compressed: it exists and ffprobe finds a video stream with a duration.
+    :return: Error message, or None if the input is usable.
+    """
+    if not os.path.isfile(input_video):
+        return "input video not found"
+    try:
+        media_info = probe_media(input_video)
+    except ProbeError as e:
+        return f"unreadable: {e}"
+    if media_info.video is None:
+        return "no video stream"
+    if not media_info.duration:
+        return "unknown duration"
+    return None
+
+
+def validate_inputs(paths, workers=8):
+    """
+    Probe all inputs in parallel (results are cached for the encodes that follow).
+    :return: (valid paths, list of (path, error) for rejected ones), both in input order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(validate_input_file, paths))
+    valid = [path for path, error in zip(paths, errors) if error is None]
+    rejected = [(path, error) for path, error in zip(paths, errors) if error is not None]
+    return valid, rejected
+
+
+def range_argument(text):
+    try:
+        return parse_ranges(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def result_summary(job, result):
+    return {
+        "input": job.input_path,
+        "output": job.output_path,
+        "success": result.success,
+        "cache_hit": result.cache_hit,
+        "encoder": result.encoder,
+        "input_size": os.path.getsize(job.input_path) if os.path.exists(job.input_path) else None,
+        "output_size": result.output_size,
+        "target_size_mb": job.target_size_mb,
+        "target_met": result.target_met,
+        "video_bitrate_kbps": result.video_bitrate_kbps,
+        "audio_bitrate_kbps": result.audio_bitrate_kbps,
+        "attempts": result.attempts,
+        "elapsed": round(result.elapsed, 3),
+        "error": result.error,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compress videos to a target size. Prints a JSON summary on stdout.",
     )
+    parser.add_argument("inputs", nargs="+", help="Video files, globs or directories")
+    parser.add_argument("-t", "--target-size", type=float, default=10, help="Target size in MB (default 10)")
+    parser.add_argument("-o", "--output-dir", default=None, help="Output folder (default: next to each input)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into subdirectories")
+    parser.add_argument("--codec", default=None, choices=("h264", "h265"),
+                        help="Output codec (default h265; an input that already fits may be kept as it is)")
+    parser.add_argument("--no-gpu", action="store_true", help="Only use CPU encoders")
+    parser.add_argument("--single-pass", action="store_true", help="Disable two-pass encoding")
+    parser.add_argument("--predictive", action="store_true", help="Constant-quality encode from sample predictions")
+    parser.add_argument("--content-aware", action="store_true",
+                        help="Give high-motion segments more bitrate (x264/x265; one quick analysis pass)")
+    parser.add_argument("--ranges", type=range_argument, default=None, metavar="START-END[,START-END...]",
+                        help="Only keep these time ranges (seconds or m:ss), joined in order, e.g. 1:00-1:20,2:05-2:15")
+    parser.add_argument("--segments", type=int, default=None, metavar="N",
+                        help="Encode long videos as N chunks in parallel CPU encodes (0 = one per four cores)")
+    parser.add_argument("--cpu-workers", type=int, default=None, help="Concurrent CPU encodes (default: cores / 4)")
+    parser.add_argument("--summary", default=None, help="Also write the JSON summary to this file")
+    parser.add_argument("--metrics-jsonl", default=None, metavar="PATH",
+                        help="Append per-job metrics with per-stage timings to this JSON lines file")
+    parser.add_argument("--metrics-prom", default=None, metavar="PATH",
+                        help="Write metrics in Prometheus text format to this file (node_exporter textfile collector)")
+    args = parser.parse_intermixed_args(argv)  # Options may come between inputs
+
+    start = time.perf_counter()
+    aggregator = MetricsAggregator()
+    add_hook(aggregator)
+    if args.metrics_jsonl:
+        add_hook(JsonLinesHook(args.metrics_jsonl))
+    paths, rejected = expand_inputs(args.inputs, recursive=args.recursive)
+    valid, bad = validate_inputs(paths)
+    rejected += bad
+
+    # Two inputs with the same name would overwrite each other's output in a shared output folder
+    outputs = {}
+    jobs_to_add = []
+    for path in valid:
+        output_path = generate_output_filename(path, args.target_size, output_dir=args.output_dir)
+        key = os.path.abspath(output_path)
+        if key in outputs:
+            rejected.append((path, f"output {output_path} already used by {outputs[key]}"))
+            continue
+        outputs[key] = path
+        jobs_to_add.append((path, output_path))
+    for path, error in rejected:
+        log(f"Rejected {path}: {error}")
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    limits = {"cpu": args.cpu_workers} if args.cpu_workers else None
+
+    def on_result(job, result):
+        status = "cached" if result.cache_hit else "done" if result.success else f"failed: {result.error}"
+        log(f"[{status}] {job.input_path} -> {job.output_path} ({result.elapsed:.1f}s)")
+
+    batch = BatchCompressor(limits=limits, on_result=on_result)
+    for path, output_path in jobs_to_add:
+        batch.add_job(
+            path, output_path, args.target_size, use_gpu=not args.no_gpu, use_two_pass=not args.single_pass,
+            codec=args.codec, use_predictive=args.predictive, use_complexity=args.content_aware, ranges=args.ranges,
+            segments=args.segments,
+        )
+    if batch.jobs:
+        log(f"Compressing {len(batch.jobs)} video(s) to {args.target_size} MB...")
+    results = batch.run() if batch.jobs else []
+
+    files = [result_summary(job, result) for job, result in zip(batch.jobs, results)]
+    summary = {
+        "target_size_mb": args.target_size,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "succeeded": sum(1 for f in files if f["success"]),
+        "failed": sum(1 for f in files if not f["success"]),
+        "rejected": [{"input": path, "error": error} for path, error in rejected],
+        "files": files,
+        "metrics": aggregator.summary(),
+    }
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.metrics_prom:
+        write_prometheus(aggregator, args.metrics_prom)
+    return 0 if not rejected and summary["failed"] == 0 else 1
+
 
-    print("Done.")
-    
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.compressor import compress_video
+from src.scheduler import DEFAULT_LIMITS, ThroughputScheduler
+
+
+@dataclass
+class BatchJob:
+    input_path: str
+    output_path: str
+    target_size_mb: float
+    use_gpu: bool = True
+    use_two_pass: bool = True
+    codec: Optional[str] = None  # None: DEFAULT_CODEC, keeping inputs that already fit in their codec
+    use_predictive: bool = False
+    use_complexity: bool = False
+    ranges: Optional[List[Tuple[float, Optional[float]]]] = None  # (start, end) seconds to keep
+    segments: Optional[int] = None  # Encode in parallel chunks (0 = automatic count); CPU only
+
+
+class BatchCompressor:
+    """
+    Run many compression jobs concurrently, with a separate worker limit per encoder class.
+    Hardware and CPU encoders work through the batch together: each job goes to whichever encoder is
+    expected to finish it soonest (see ThroughputScheduler), longest jobs first.
+    """
+
+    def __init__(self, limits=None, ffmpeg_path=None, on_result=None, on_progress=None):
+        """
+        :param limits: Dict of encoder class ("cpu", "nvenc", "amf", "qsv") -> max concurrent jobs.
+        :param ffmpeg_path: ffmpeg executable whose working encoders are scheduled.
+        :param on_result: Optional callable(job, result) invoked as each job finishes (from a worker thread).
+        :param on_progress: Optional callable(job, ProgressEvent) invoked as jobs encode (from worker threads).
+        """
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.ffmpeg_path = ffmpeg_path
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def add_job(self, input_path, output_path, target_size_mb, use_gpu=True, use_two_pass=True, codec=None,
+                use_predictive=False, use_complexity=False, ranges=None, segments=None):
+        # Segmented jobs always run on CPU encoders, so they are only scheduled there
+        use_gpu = use_gpu and (segments is None or bool(ranges))
+        job = BatchJob(input_path, output_path, target_size_mb, use_gpu, use_two_pass, codec, use_predictive,
+                       use_complexity, ranges, segments)
+        self.jobs.append(job)
+        return job
+
+    def _run_job(self, job, encoder):
+        on_progress = None
+        if self.on_progress:
+            def on_progress(event):
+                with self._lock:
+                    self.on_progress(job, event)
+        result = compress_video(
+            input_path=job.input_path,
+            output_path=job.output_path,
+            target_size_mb=job.target_size_mb,
+            use_gpu=job.use_gpu,
+            use_two_pass=job.use_two_pass,
+            codec=job.codec,
+            use_predictive=job.use_predictive,
+            use_complexity=job.use_complexity,
+            encoder=encoder,
+            ranges=job.ranges,
+            segments=job.segments,
+            log=None,
+            on_progress=on_progress,
+        )
+        if self.on_result:
+            with self._lock:
+                self.on_result(job, result)
+        return result
+
+    def run(self):
+        """
+        Run all added jobs and wait for them to finish.
+        :return: List of CompressionResult, in the order the jobs were added.
+        """
+        scheduler = ThroughputScheduler(self._run_job, limits=self.limits, ffmpeg_path=self.ffmpeg_path)
+        return scheduler.run(self.jobs)
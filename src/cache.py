@@ -0,0 +1,182 @@
+import os
+import json
+import atexit
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get("COMPRESSOR_CACHE_DIR", "cache")  # Directory for on-disk caches
+FLUSH_DELAY = 2.0  # Seconds DiskCache batches changes before rewriting its file
+
+
+def file_fingerprint(path):
+    """
+    Cheap identity of a file on disk: absolute path, size and modification time.
+    Any edit or replacement of the file changes the fingerprint.
+    :param path: Path to the file.
+    :return: Fingerprint string, e.g. "/clips/a.mp4|1048576|1712345678000000000".
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def content_fingerprint(path, sample_bytes=1024 * 1024):
+    """
+    Identity of a file's contents, independent of its path and mtime: SHA-256 of the size plus
+    the first and last sample_bytes. Cheap for large videos, and stable across copies and moves.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        digest.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(max(sample_bytes, size - sample_bytes))
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """
+    Hardlink src to dst (copying where the filesystem can't link), replacing dst atomically.
+    """
+    tmp = f"{dst}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)  # Filesystems without hardlinks
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+def atomic_write_json(path, data):
+    """
+    Write JSON to a temp file next to the target and rename it into place,
+    so readers never see a half-written file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DiskCache:
+    """
+    Small JSON-file key/value store with LRU eviction.
+    Entries are kept in memory in access order. Writes are batched: the file is rewritten atomically
+    FLUSH_DELAY seconds after the first change, on flush(), and at exit, so probing a large batch costs
+    a handful of rewrites instead of one per entry.
+    Safe to share between threads; concurrent processes fall back to last-writer-wins,
+    which only ever costs a cache miss.
+    """
+
+    def __init__(self, path, max_entries=10000, flush_delay=None):
+        """
+        :param flush_delay: Seconds to batch writes for (defaults to FLUSH_DELAY); 0 writes through on every change.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_delay = FLUSH_DELAY if flush_delay is None else flush_delay
+        self._entries = None
+        self._dirty = False
+        self._timer = None
+        # A cache whose folder existed and later disappeared (a temp dir that was cleaned up) is not recreated
+        # by a delayed write
+        self._had_directory = os.path.isdir(os.path.dirname(path) or ".")
+        self._lock = threading.Lock()
+        atexit.register(self._flush_deferred)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Stored oldest-first, so insertion order restores the LRU order
+            for key, value in data:
+                self._entries[key] = value
+        except (OSError, ValueError, TypeError):
+            pass  # Missing or corrupt cache: start empty
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            self._dirty = True
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._load()
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # Evict least recently used
+            self._dirty = True
+            self._schedule_save()
+
+    def delete(self, key):
+        with self._lock:
+            self._load()
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+                self._schedule_save()
+
+    def items(self):
+        with self._lock:
+            self._load()
+            return list(self._entries.items())
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def flush(self):
+        """ Write pending changes (including access-order changes made by get()) now. """
+        with self._lock:
+            if self._entries is not None and self._dirty:
+                self._save()
+
+    def _schedule_save(self):
+        # Called with the lock held
+        if self.flush_delay <= 0:
+            self._save()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self._flush_deferred)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_deferred(self):
+        with self._lock:
+            self._timer = None
+            if self._entries is None or not self._dirty:
+                return
+            if self._had_directory and not os.path.isdir(os.path.dirname(self.path) or "."):
+                self._dirty = False
+                return
+            self._save()
+
+    def _save(self):
+        try:
+            atomic_write_json(self.path, list(self._entries.items()))
+            self._dirty = False
+            self._had_directory = True
+        except OSError as e:
+            print(f"Error writing cache {self.path}: {e}")
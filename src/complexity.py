@@ -0,0 +1,177 @@
+import re
+import subprocess
+from collections import deque
+
+from src.paths import FFMPEG_PATH
+from src.probe import store_media_info
+from src.runner import EncodeCancelled, popen_ffmpeg, wait_process
+
+ZONE_ENCODERS = ("libx264", "libx265")  # Encoders that accept per-range bitrate multipliers (zones=)
+SEGMENT_SECONDS = 4.0  # Length of each complexity segment
+ANALYSIS_HEIGHT = 144  # Frames are analysed at this height; motion survives downscaling, detail costs decode time
+SCENE_THRESHOLD = 10.0  # scdet score (0-100) counted as a scene cut
+CUT_COST = 4.0  # A cut costs about as much as this much extra mean luma difference over the segment
+ALLOCATION_EXPONENT = 0.5  # Bits follow complexity^exponent: busy segments get more, but not proportionally more
+MIN_WEIGHT = 0.5
+MAX_WEIGHT = 2.0
+WEIGHT_STEP = 0.1  # Weights are rounded to this, so neighbouring segments with similar content merge into one zone
+
+_PTS_TIME = re.compile(r"pts_time:(-?[0-9.]+)")
+_YDIF = re.compile(r"lavfi\.signalstats\.YDIF=([0-9.]+)")
+_SCENE = re.compile(r"lavfi\.scd\.score=([0-9.]+)")
+
+
+def supports_zones(encoder):
+    return encoder in ZONE_ENCODERS
+
+
+def build_analysis_command(ffmpeg_path, input_path):
+    """
+    Decode only reference frames at low resolution and print per-frame motion (signalstats YDIF,
+    the mean luma difference to the previous analysed frame) and scene-change scores.
+    """
+    filters = (
+        f"scale=-2:{ANALYSIS_HEIGHT}:flags=fast_bilinear,"
+        f"signalstats,scdet=threshold={SCENE_THRESHOLD:g},metadata=mode=print"
+    )
+    return [
+        ffmpeg_path, "-hide_banner", "-nostats",
+        "-skip_frame", "noref",  # Skip decoding non-reference frames entirely
+        "-i", input_path,
+        "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-vf", filters,
+        "-f", "null", "-",
+    ]
+
+
+def parse_analysis_output(lines, duration, segment_seconds=SEGMENT_SECONDS):
+    """
+    Fold per-frame metadata lines into fixed-length segments.
+    :param lines: Iterable of ffmpeg log lines from build_analysis_command().
+    :return: Profile as a list of [start, end, score]; higher scores need more bits.
+    """
+    count = max(1, int(-(-duration // segment_seconds)))
+    motion = [0.0] * count
+    frames = [0] * count
+    cuts = [0] * count
+    index = 0
+    for line in lines:
+        match = _PTS_TIME.search(line)
+        if match:
+            index = min(count - 1, max(0, int(float(match.group(1)) // segment_seconds)))
+            continue
+        match = _YDIF.search(line)
+        if match:
+            motion[index] += float(match.group(1))
+            frames[index] += 1
+            continue
+        match = _SCENE.search(line)
+        if match and float(match.group(1)) >= SCENE_THRESHOLD:
+            cuts[index] += 1
+
+    analysed = [i for i in range(count) if frames[i]]
+    if not analysed:
+        return []
+    overall = sum(motion[i] / frames[i] for i in analysed) / len(analysed)
+    profile = []
+    for i in range(count):
+        score = motion[i] / frames[i] if frames[i] else overall  # No reference frame decoded in this segment
+        profile.append([i * segment_seconds, min(duration, (i + 1) * segment_seconds), score + CUT_COST * cuts[i]])
+    return profile
+
+
+def analyze_complexity(media_info, ffmpeg_path=None, cancel_token=None):
+    """
+    Per-segment complexity profile of a video, computed once and stored with its probe data.
+    :param media_info: MediaInfo from probe_media(); the profile is saved on it and written back to the probe cache.
+    :param cancel_token: Optional CancelToken that can stop the analysis.
+    :return: Profile as from parse_analysis_output() (empty if no frames could be analysed).
+    :raises subprocess.CalledProcessError: If ffmpeg fails.
+    :raises EncodeCancelled: If the token was cancelled.
+    """
+    if media_info.complexity is not None:
+        return media_info.complexity
+
+    cmd = build_analysis_command(ffmpeg_path or FFMPEG_PATH, media_info.path)
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    process = popen_ffmpeg(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if cancel_token:
+        cancel_token.register(process)
+    tail = deque(maxlen=20)
+
+    def lines():
+        for line in process.stderr:
+            tail.append(line)
+            yield line
+
+    try:
+        profile = parse_analysis_output(lines(), media_info.duration)
+    finally:
+        process.stderr.close()
+        returncode = wait_process(process)
+        if cancel_token:
+            cancel_token.unregister(process)
+    if cancel_token and cancel_token.cancelled:
+        raise EncodeCancelled()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr="".join(tail))
+
+    media_info.complexity = profile
+    store_media_info(media_info)
+    return profile
+
+
+def segment_weights(profile):
+    """
+    Bitrate multiplier per segment, averaging 1.0 over the whole duration so the total size is unchanged.
+    """
+    if not profile:
+        return []
+    lengths = [end - start for start, end, _ in profile]
+    total = sum(lengths) or 1.0
+    weights = [max(score, 0.01) ** ALLOCATION_EXPONENT for _, _, score in profile]
+    for _ in range(2):  # Clamping shifts the mean; a second round brings it back close to 1
+        mean = sum(w * length for w, length in zip(weights, lengths)) / total
+        weights = [min(MAX_WEIGHT, max(MIN_WEIGHT, w / mean)) for w in weights]
+    return weights
+
+
+def slice_profile(profile, ranges):
+    """
+    Profile of the output when only some time ranges are encoded: the segments overlapping each range,
+    shifted onto the output timeline (ranges follow each other in order).
+    """
+    sliced = []
+    offset = 0.0
+    for range_start, range_end in ranges:
+        for start, end, score in profile:
+            first, last = max(start, range_start), min(end, range_end)
+            if last > first:
+                sliced.append([offset + first - range_start, offset + last - range_start, score])
+        offset += range_end - range_start
+    return sliced
+
+
+def complexity_zones(profile, fps):
+    """
+    x264/x265 zones string ("start,end,b=multiplier/...") from a complexity profile.
+    :param fps: Output frame rate, to convert segment times to frame numbers.
+    :return: Zones string, or None if the content is even enough that zones would change nothing.
+    """
+    if not profile or not fps:
+        return None
+    zones = []
+    for (start, end, _), weight in zip(profile, segment_weights(profile)):
+        weight = round(round(weight / WEIGHT_STEP) * WEIGHT_STEP, 2)
+        first, last = int(round(start * fps)), int(round(end * fps)) - 1
+        if last < first:
+            continue
+        if zones and zones[-1][2] == weight and zones[-1][1] == first - 1:
+            zones[-1][1] = last
+        else:
+            zones.append([first, last, weight])
+    zones = [zone for zone in zones if zone[2] != 1.0]
+    if not zones:
+        return None
+    return "/".join(f"{first},{last},b={weight:g}" for first, last, weight in zones)
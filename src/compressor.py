@@ -1,183 +1,582 @@
 import os
+import time
+import uuid
+import shutil
 import subprocess
-from src.helpers import get_video_duration, calculate_bitrate, detect_gpu_encoders, get_audio_bitrate
+from dataclasses import dataclass, field, replace
+from typing import List, Optional
 
+from src.complexity import analyze_complexity, complexity_zones, slice_profile, supports_zones
+from src.encoders import DEFAULT_CODEC, select_encoder
+from src.helpers import calculate_bitrate
+from src.ladder import choose_rung, ladder_filters
+from src.metrics import instrument_job, mark_stage
+from src.fast_path import DEFAULT_AUDIO_KBPS, audio_budget_kbps, can_copy_audio, plan_fast_path
+from src.output_cache import default_output_cache, output_cache_key
+from src.passlog import default_passlog_cache, passlog_key
+from src.paths import FFMPEG_PATH
+from src.probe import probe_media, ProbeError
+from src.predictor import MIN_PREDICTIVE_DURATION, measure_quality_curve, quality_video_args, supports_predictive
+from src.ranges import concat_filter, normalize_ranges, range_input_args, selected_duration
+from src.rate_control import RateController, container_for, rate_mode, MB
+from src.runner import run_ffmpeg, EncodeCancelled
+from src.throughput import default_throughput_store
 
-def compress_video(input_path, output_path, target_size_mb, use_gpu=True, use_two_pass=True, codec="h265"):
-    """
-    Compress a video to a target size using FFMPEG.
-    Supports GPU acceleration, two-pass encoding, and H.264 or H.265 selection.
-    Includes audio compression by dynamically adjusting bitrate allocation.
-    """
-    ffmpeg_path = "ffmpeg_bin/ffmpeg.exe"
+NULL_OUTPUT = "NUL" if os.name == "nt" else "/dev/null"
+default_rate_controller = RateController()
+
+
+@dataclass
+class CompressionResult:
+    input_path: str
+    output_path: str
+    success: bool = False
+    encoder: Optional[str] = None
+    video_bitrate_kbps: Optional[int] = None
+    audio_bitrate_kbps: Optional[int] = None
+    output_size: Optional[int] = None  # Bytes
+    elapsed: float = 0.0  # Seconds
+    error: Optional[str] = None
+    cancelled: bool = False
+    target_met: Optional[bool] = None  # Output landed inside the rate controller's tolerance band
+    video_filters: Optional[str] = None  # Scale/fps filters applied by the resolution ladder
+    attempts: int = 0  # Encodes run, including corrective re-encodes
+    cache_hit: bool = False  # Output was served from the output cache without encoding
+    messages: List[str] = field(default_factory=list)
 
-    # Get the duration of the video
-    duration = get_video_duration(input_path)
-    if duration == 0:
-        print("Unable to fetch video duration. Exiting.")
-        return
-
-    # Get the audio bitrate
-    audio_bitrate_kbps = get_audio_bitrate(input_path)
-    if audio_bitrate_kbps is None:
-        print("Unable to fetch audio bitrate. Defaulting to 128 kbps.")
-        audio_bitrate_kbps = 128
-
-    # Calculate video bitrate kbps
-    video_bitrate_kbps = calculate_bitrate(target_size_mb - 0.5, duration, audio_bitrate_kbps=audio_bitrate_kbps)
-
-    # Detect GPU encoders
-    gpu_encoder = None
-    if use_gpu:
-        gpu_encoders = detect_gpu_encoders(ffmpeg_path)
-        if codec == "h265" and "hevc_nvenc" in gpu_encoders:
-            gpu_encoder = "hevc_nvenc"
-        elif codec == "h264" and "h264_nvenc" in gpu_encoders:
-            gpu_encoder = "h264_nvenc"
-        elif codec == "h265" and "hevc_amf" in gpu_encoders:
-            gpu_encoder = "hevc_amf"
-        elif codec == "h264" and "h264_amf" in gpu_encoders:
-            gpu_encoder = "h264_amf"
-        elif codec == "h265" and "hevc_qsv" in gpu_encoders:
-            gpu_encoder = "hevc_qsv"
-        elif codec == "h264" and "h264_qsv" in gpu_encoders:
-            gpu_encoder = "h264_qsv"
-
-    # Choose encoder based on GPU availability or fallback to CPU
-    if gpu_encoder:
-        encoder = gpu_encoder
-    elif codec == "h265":
-        encoder = "libx265"  # CPU fallback for H.265
-    else:
-        encoder = "libx264"  # CPU fallback for H.264
 
-    print(f"Selected encoder: {encoder}")
+def supports_two_pass(encoder):
+    """ NVIDIA and AMD H.265 use single-pass quality-based rate control instead. """
+    return encoder not in ("hevc_nvenc", "hevc_amf")
 
-    # Construct FFMPEG command based on the encoder and vendor-specific settings
-    if gpu_encoder == "hevc_nvenc":  # NVIDIA H.265
+
+def encoder_video_args(encoder, video_bitrate_kbps, preset=None, zones=None):
+    """
+    Vendor-specific video encoder arguments for a target bitrate.
+    :param preset: Encoder preset overriding the default (e.g. "veryfast" for libx264).
+    :param zones: x264/x265 zones string with per-range bitrate multipliers (content-aware allocation).
+    """
+    if encoder == "hevc_nvenc":  # NVIDIA H.265
         # NVIDIA supports single-pass CRF encoding for H.265
-        cmd = [
-            ffmpeg_path,
-            "-i", input_path,
+        args = [
             "-c:v", encoder,
             "-crf", "23",  # CRF for quality control
             "-b:v", f"{video_bitrate_kbps}k",  # Target bitrate
             "-maxrate", f"{int(video_bitrate_kbps * 1.5)}k",  # Set max bitrate
             "-bufsize", f"{int(video_bitrate_kbps * 2)}k",  # Set buffer size
             "-preset", "p6",  # High-quality preset for NVIDIA
-            "-c:a", "aac",  # Audio codec
-            "-b:a", f"{audio_bitrate_kbps}k",  # Target audio bitrate
-            "-y",
-            output_path,
         ]
-    elif gpu_encoder == "hevc_amf":  # AMD H.265
+    elif encoder == "hevc_amf":  # AMD H.265
         # AMD uses quality-based encoding with constant quality (CQ)
-        cmd = [
-            ffmpeg_path,
-            "-i", input_path,
+        args = [
             "-c:v", encoder,
             "-cq", "23",  # Constant Quality for AMD
             "-b:v", f"{video_bitrate_kbps}k",  # Target bitrate for better control
             "-preset", "quality",  # AMD-specific preset
-            "-c:a", "aac",
-            "-b:a", f"{audio_bitrate_kbps}k",
-            "-y",
-            output_path,
         ]
-    elif gpu_encoder == "hevc_qsv":  # Intel H.265
-        if use_two_pass:
-            # Intel supports two-pass encoding for better quality
-            cmd_pass_1 = [
-                ffmpeg_path,
-                "-i", input_path,
-                "-b:v", f"{video_bitrate_kbps}k",
-                "-c:v", encoder,
-                "-preset", "balanced",  # Intel-specific preset
-                "-pass", "1",
-                "-an",  # Disable audio in first pass
-                "-f", "null",  # Ensures not saved as file
-                "NUL" if os.name == "nt" else "/dev/null",
-            ]
-
-            cmd_pass_2 = [
-                ffmpeg_path,
-                "-i", input_path,
-                "-b:v", f"{video_bitrate_kbps}k",
-                "-c:v", encoder,
-                "-preset", "balanced",
-                "-pass", "2",
-                "-c:a", "aac",
-                "-b:a", f"{audio_bitrate_kbps}k",
-                "-y",
-                output_path,
-            ]
-
-            try:
-                print(f"Running first pass: {' '.join(cmd_pass_1)}")
-                subprocess.run(cmd_pass_1, check=True)
-
-                print(f"Running second pass: {' '.join(cmd_pass_2)}")
-                subprocess.run(cmd_pass_2, check=True)
-
-                print(f"Compressed {input_path} to {output_path} successfully with two-pass encoding.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error during two-pass compression: {e}")
-            return
-    elif use_two_pass:
-        # Two-pass encoding for CPU or fallback scenarios
-        cmd_pass_1 = [
-            ffmpeg_path,
-            "-i", input_path,
-            "-b:v", f"{video_bitrate_kbps}k",
+    elif encoder == "hevc_qsv":  # Intel H.265
+        args = [
             "-c:v", encoder,
-            "-preset", "medium",
-            "-pass", "1",
-            "-an",
-            "-f", "null",
-            "NUL" if os.name == "nt" else "/dev/null",
-        ]
-
-        cmd_pass_2 = [
-            ffmpeg_path,
-            "-i", input_path,
             "-b:v", f"{video_bitrate_kbps}k",
+            "-preset", "balanced",  # Intel-specific preset
+        ]
+    else:  # CPU encoders and remaining GPU encoders
+        args = [
             "-c:v", encoder,
+            "-b:v", f"{video_bitrate_kbps}k",
             "-preset", "medium",
-            "-pass", "2",
-            "-c:a", "aac",
-            "-b:a", f"{audio_bitrate_kbps}k",
-            "-y",
-            output_path,
         ]
+    if preset:
+        args[args.index("-preset") + 1] = preset
+    if zones and supports_zones(encoder):
+        args += ["-x264-params" if encoder == "libx264" else "-x265-params", f"zones={zones}"]
+    return args
 
-        try:
-            print(f"Running first pass: {' '.join(cmd_pass_1)}")
-            subprocess.run(cmd_pass_1, check=True)
 
-            print(f"Running second pass: {' '.join(cmd_pass_2)}")
-            subprocess.run(cmd_pass_2, check=True)
+def encoder_preset(encoder, preset=None):
+    """ Preset used by encoder_video_args(), or None if the encoder has none. """
+    args = encoder_video_args(encoder, 0, preset)
+    return args[args.index("-preset") + 1] if "-preset" in args else None
+
 
-            print(f"Compressed {input_path} to {output_path} successfully with two-pass encoding.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error during two-pass compression: {e}")
-        return  # Exit after two-pass encoding
+def build_ffmpeg_commands(ffmpeg_path, input_path, output_path, encoder, video_bitrate_kbps, audio_bitrate_kbps, use_two_pass,
+                          passlogfile=None, skip_first_pass=False, copy_audio=False, quality=None, video_filters=None,
+                          preset=None, zones=None, ranges=None):
+    """
+    Build the FFMPEG command(s) for one encode.
+    :param passlogfile: Prefix for two-pass statistics files (ffmpeg defaults to ffmpeg2pass in the working directory).
+    :param skip_first_pass: Pass-1 statistics already exist at passlogfile; only build pass 2.
+    :param copy_audio: Stream-copy the source audio instead of re-encoding it.
+    :param quality: CRF/CQ value for a single constant-quality pass capped at video_bitrate_kbps (predictive mode).
+    :param video_filters: Video filter chain (e.g. from the resolution ladder), applied in every pass.
+    :param preset: Encoder preset overriding the default.
+    :param zones: Per-range bitrate multipliers for x264/x265 (ignored in constant-quality mode).
+    :param ranges: (start, end) times to encode instead of the whole input; several are joined in order.
+        Audio can't be copied when joining.
+    :return: List of commands; two (pass 1, pass 2) for two-pass encoding, otherwise one.
+    """
+    base = [ffmpeg_path, "-hide_banner", "-nostats"]
+    base += range_input_args(input_path, ranges) if ranges else ["-i", input_path]
+    joined = ranges is not None and len(ranges) > 1
+
+    def streams(with_audio):
+        if not joined:
+            return []
+        graph, maps = concat_filter(len(ranges), with_audio, video_filters)
+        return ["-filter_complex", graph] + maps
+    if quality is not None:
+        video_args = quality_video_args(encoder, quality, video_bitrate_kbps, encoder_preset(encoder, preset))
+        use_two_pass = False
     else:
-        # Single-pass encoding for fallback scenarios
-        cmd = [
-            ffmpeg_path,
-            "-i", input_path,
-            "-b:v", f"{video_bitrate_kbps}k",
-            "-c:v", encoder,
-            "-preset", "medium",
-            "-c:a", "aac",
-            "-b:a", f"{audio_bitrate_kbps}k",
-            "-y",
-            output_path,
+        video_args = encoder_video_args(encoder, video_bitrate_kbps, preset, zones)
+    if video_filters and not joined:
+        video_args += ["-vf", video_filters]
+    if copy_audio:
+        audio_args = ["-c:a", "copy"]
+    elif audio_bitrate_kbps:
+        audio_args = ["-c:a", "aac", "-b:a", f"{audio_bitrate_kbps}k"]
+    else:
+        audio_args = ["-an"]  # No audio in the input
+
+    if use_two_pass and supports_two_pass(encoder):
+        if passlogfile:
+            video_args += ["-passlogfile", passlogfile]
+        cmd_pass_1 = base + streams(False) + video_args + [
+            "-pass", "1",
+            "-an",  # Disable audio in first pass
+            "-f", "null",  # Ensures not saved as file
+            NULL_OUTPUT,
         ]
+        cmd_pass_2 = base + streams(bool(audio_bitrate_kbps)) + video_args + ["-pass", "2"] + audio_args
+        cmd_pass_2 += ["-y", output_path]
+        return [cmd_pass_2] if skip_first_pass else [cmd_pass_1, cmd_pass_2]
+
+    return [base + streams(bool(audio_bitrate_kbps)) + video_args + audio_args + ["-y", output_path]]
+
+
+def plan_bitrates(media_info, target_size_mb, log=print, encoder="libx264", container="mp4", two_pass=False, rate_controller=None,
+                  predictive=False):
+    """
+    Split the target size between video and audio.
+    The video share accounts for predicted mux overhead and the encoder's learned size error.
+    :return: (video_bitrate_kbps, audio_bitrate_kbps); audio is 0 if the input has no audio.
+    """
+    if media_info.audio is not None and media_info.audio_bitrate_kbps is None and log:
+        log(f"Unable to fetch audio bitrate. Defaulting to {DEFAULT_AUDIO_KBPS} kbps.")
+    audio_bitrate_kbps = audio_budget_kbps(media_info, target_size_mb)
+
+    rate_controller = rate_controller or default_rate_controller
+    video_bitrate_kbps = rate_controller.plan_video_bitrate(
+        target_size_mb, media_info.duration, audio_bitrate_kbps, encoder, container, rate_mode(two_pass, predictive)
+    )
+    return video_bitrate_kbps, audio_bitrate_kbps
+
+
+def fast_path_command(ffmpeg_path, input_path, output_path, fast_path, audio_bitrate_kbps):
+    """
+    Stream-copy command for a "remux" or "copy_video" fast path.
+    """
+    cmd = [ffmpeg_path, "-hide_banner", "-nostats", "-i", input_path, "-map", "0:v:0", "-map", "0:a:0?"]
+    if fast_path == "remux":
+        cmd += ["-c", "copy"]
+    else:
+        cmd += ["-c:v", "copy", "-c:a", "aac", "-b:a", f"{audio_bitrate_kbps}k"]
+    return cmd + ["-y", output_path]
+
+
+def partial_output_path(output_path):
+    """
+    Hidden temp file next to the output, with the same extension so ffmpeg picks the same muxer.
+    Encodes write here and are renamed into place only once they are complete.
+    """
+    directory, name = os.path.split(output_path)
+    base, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{base}.tmp-{uuid.uuid4().hex[:8]}{ext}")
+
 
+def remove_partial_outputs(output_path):
+    """
+    Delete an unfinished output file.
+    """
     try:
-        print(f"Running command: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
-        print(f"Compressed {input_path} to {output_path} successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during compression: {e}")
+        os.remove(output_path)
+    except OSError:
+        pass
+
+
+def _stderr_tail(stderr, lines=5):
+    return " | ".join((stderr or "").strip().splitlines()[-lines:])
+
+
+@instrument_job
+def compress_video(input_path, output_path, target_size_mb, use_gpu=True, use_two_pass=True, codec=None, log=print,
+                   on_progress=None, cancel_token=None, rate_controller=None, passlog_cache=None, allow_fast_paths=True,
+                   use_predictive=False, auto_scale=True, resolution=None, framerate=None, preset=None, on_stage=None,
+                   use_output_cache=True, output_cache=None, use_complexity=False, encoder=None, ranges=None,
+                   segments=None, throughput_store=None):
+    """
+    Compress a video to a target size using FFMPEG.
+    Supports GPU acceleration, two-pass encoding, and H.264 or H.265 selection.
+    Includes audio compression by dynamically adjusting bitrate allocation.
+    If the output misses the target size, it is re-encoded at a corrected bitrate
+    (up to the rate controller's max_attempts).
+    :param codec: "h264" or "h265". None encodes to DEFAULT_CODEC but lets an input that already fits be
+        copied in whatever codec it has; an explicit codec (like resolution, framerate and preset) only
+        allows fast paths when the source video already matches.
+    :param log: Callable receiving progress messages (print by default).
+    :param on_progress: Optional callable(ProgressEvent) receiving streamed encoder progress.
+    :param cancel_token: Optional CancelToken; cancelling kills ffmpeg and removes partial files.
+    :param rate_controller: RateController to use (defaults to the shared one with learned statistics).
+    :param passlog_cache: PassLogCache for two-pass statistics (defaults to the shared cache directory).
+    :param allow_fast_paths: Copy or remux inputs that already fit, and stream-copy streams that need no re-encode.
+    :param use_predictive: Instead of two passes, fit a size/quality curve on short samples and run one
+        constant-quality pass capped at the target bitrate (falls back to the normal path where unsupported).
+    :param auto_scale: Lower resolution/framerate when the budget is too small for every source pixel.
+    :param resolution: Explicit output height (short side), e.g. 720; overrides auto_scale. Never upscales.
+    :param framerate: Explicit output framerate; overrides auto_scale. Never raises the source rate.
+    :param preset: Encoder preset overriding the default for the selected encoder.
+    :param on_stage: Optional callable(stage) told when the job enters "probing", "pass1" or "pass2"
+        (single-pass encodes and fast paths only report "pass1"). Finer stages are recorded as metrics spans
+        (see src.metrics).
+    :param use_output_cache: Return the earlier output when the same clip was already compressed with the same
+        target and settings, and keep new outputs for next time.
+    :param output_cache: OutputCache to use (defaults to the shared cache directory).
+    :param use_complexity: Analyse motion and scene cuts once per input and give busy segments a larger share
+        of the bitrate (x264/x265 bitrate modes; the profile is cached with the probe data).
+    :param encoder: Encoder to use instead of selecting one from codec and use_gpu (e.g. chosen by a scheduler).
+    :param ranges: List of (start, end) seconds to keep (end None = to the end); several ranges are joined in
+        one encode. Frames before each range are skipped by input seeking, and the target size is spent on
+        the selected duration only. Fast paths and predictive mode are not used with ranges.
+    :param segments: Encode a long video as this many keyframe-aligned chunks in parallel CPU encodes and join
+        them (0 = one chunk per four CPU cores); see src.segmented. Only codec, use_two_pass and the
+        progress/cancel callbacks apply in that mode; it is not used together with ranges.
+    :param throughput_store: ThroughputStore that full encodes are recorded in (defaults to the shared one
+        the estimator and scheduler read).
+    :return: CompressionResult describing the outcome (cancelled=True if stopped).
+    """
+    requested_codec = codec
+    codec = codec or DEFAULT_CODEC
+    if segments is not None and ranges:
+        if log:
+            log("Segmented mode can't keep a time range; encoding in one piece.")
+    elif segments is not None:
+        from src.segmented import compress_video_segmented  # src.segmented builds on this module
+        return compress_video_segmented(
+            input_path, output_path, target_size_mb, use_two_pass=use_two_pass, codec=codec, segments=segments or None,
+            log=log, on_progress=on_progress, cancel_token=cancel_token, encoder=encoder,
+        )
+
+    ffmpeg_path = FFMPEG_PATH
+    rate_controller = rate_controller or default_rate_controller
+    throughput_store = throughput_store or default_throughput_store
+    mark_stage("encoder_detection")
+    encoder = encoder or select_encoder(codec, use_gpu=use_gpu, ffmpeg_path=ffmpeg_path)
+    passlog_cache = passlog_cache or default_passlog_cache
+    start = time.perf_counter()
+    result = CompressionResult(input_path=input_path, output_path=output_path)
+    # Everything is written to a temp file and renamed over output_path only when complete,
+    # so a crash or cancel never leaves a truncated output behind
+    work_path = partial_output_path(output_path)
+
+    def report(message):
+        result.messages.append(message)
+        if log:
+            log(message)
+
+    def fail(message):
+        report(message)
+        result.error = message
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def stage(name, span=None):
+        mark_stage(span or name)
+        if on_stage:
+            on_stage(name)
+
+    def finish():
+        try:
+            os.replace(work_path, output_path)
+        except OSError as e:
+            remove_partial_outputs(work_path)
+            return False, f"Error moving output into place: {e}"
+        return True, None
+
+    def remember():
+        if cache_key and result.target_met:
+            output_cache.store(cache_key, output_path, {
+                name: getattr(result, name) for name in (
+                    "encoder", "video_bitrate_kbps", "audio_bitrate_kbps", "output_size", "target_met",
+                    "video_filters", "attempts", "elapsed",
+                )
+            })
+
+    # A clip already compressed with the same target and settings is served from the output cache.
+    # The key holds what was asked for, not the encoder picked for this run: a scheduler may place an
+    # identical rerun on another device.
+    cache_key = None
+    if use_output_cache:
+        mark_stage("cache_lookup")
+        output_cache = output_cache or default_output_cache
+        plan = {
+            "codec": requested_codec, "use_gpu": use_gpu, "two_pass": use_two_pass,
+            "predictive": use_predictive, "fast_paths": allow_fast_paths, "auto_scale": auto_scale,
+            "resolution": resolution, "framerate": framerate, "preset": preset, "complexity": use_complexity,
+            "ranges": ranges and [list(time_range) for time_range in ranges],
+        }
+        try:
+            cache_key = output_cache_key(input_path, target_size_mb, container_for(output_path), plan)
+        except OSError:
+            pass  # Unreadable input; probing reports it
+        cached = cache_key and output_cache.lookup(cache_key, output_path)
+        if cached:
+            for name, value in cached.items():
+                setattr(result, name, value)
+            result.cache_hit = True
+            result.success = True
+            result.elapsed = time.perf_counter() - start
+            report(f"Compressed {input_path} to {output_path} from the output cache.")
+            return result
+
+    # Probe the input once; duration and audio bitrate both come from the same (cached) ffprobe result
+    stage("probing")
+    try:
+        media_info = probe_media(input_path)
+    except ProbeError as e:
+        return fail(f"Error probing input: {e}")
+
+    # Get the duration of the video
+    duration = media_info.duration
+    if not duration:
+        return fail("Unable to fetch video duration. Exiting.")
+
+    # A time selection is budgeted as if it were the whole video; the probe result itself stays untouched
+    source_info = media_info
+    if ranges:
+        try:
+            ranges = normalize_ranges(ranges, duration)
+        except ValueError as e:
+            return fail(f"Invalid time range: {e}")
+        duration = selected_duration(ranges)
+        media_info = replace(media_info, duration=duration)
+        text = ", ".join(f"{start:.1f}-{end:.1f}s" for start, end in ranges)
+        report(f"Compressing {duration:.1f}s of {source_info.duration:.1f}s ({text}).")
+
+    container = container_for(output_path)
+
+    # Decide whether the video needs encoding at all
+    if allow_fast_paths and not ranges:  # A copy would keep the whole video
+        audio_kbps = audio_budget_kbps(media_info, target_size_mb)
+        overhead_bytes = rate_controller.predict_overhead_bytes(container, duration)
+        fast_path = plan_fast_path(
+            media_info, target_size_mb, output_path, audio_kbps, overhead_bytes, codec=requested_codec,
+            resolution=resolution, framerate=framerate, preset=preset,
+        )
+        if fast_path == "copy" and os.path.abspath(input_path) == os.path.abspath(output_path):
+            fast_path = None  # Never overwrite the input with a copy of itself; re-encode instead
+        if fast_path:
+            report(f"Input needs no video encode; taking the '{fast_path}' fast path.")
+            stage("pass1", span="fast_path")
+            try:
+                if fast_path == "copy":
+                    shutil.copyfile(input_path, work_path)
+                else:
+                    cmd = fast_path_command(ffmpeg_path, input_path, work_path, fast_path, audio_kbps)
+                    report(f"Running command: {' '.join(cmd)}")
+                    run_ffmpeg(cmd, duration=duration, on_progress=on_progress, cancel_token=cancel_token)
+            except EncodeCancelled:
+                remove_partial_outputs(work_path)
+                result.cancelled = True
+                return fail("Compression cancelled.")
+            except (subprocess.CalledProcessError, OSError) as e:
+                remove_partial_outputs(work_path)
+                report(f"Fast path failed ({e}); encoding instead.")
+            else:
+                result.output_size = os.path.getsize(work_path)
+                moved, error = finish() if result.output_size <= target_size_mb * MB else (False, None)
+                if error:
+                    return fail(error)
+                if moved:
+                    result.encoder = "copy"
+                    result.audio_bitrate_kbps = audio_kbps if fast_path == "copy_video" else media_info.audio_bitrate_kbps
+                    result.attempts = 1
+                    result.target_met = True
+                    result.success = True
+                    result.elapsed = time.perf_counter() - start
+                    remember()
+                    report(f"Compressed {input_path} to {output_path} successfully without re-encoding video.")
+                    return result
+                remove_partial_outputs(work_path)
+                report("Fast path output is over the target; encoding instead.")
+
+    # The encoder comes from the cached capability registry (GPU if it passed a test encode, else CPU)
+    mark_stage("planning")
+    report(f"Selected encoder: {encoder}")
+
+    # Pick the highest resolution/framerate rung the budget can feed at a watchable bits-per-pixel
+    video_filters = None
+    out_width, out_height, out_fps = media_info.width, media_info.height, media_info.fps
+    if auto_scale or resolution or framerate:
+        budget_kbps = calculate_bitrate(target_size_mb, duration, audio_budget_kbps(media_info, target_size_mb))
+        rung = choose_rung(
+            media_info.width, media_info.height, media_info.fps, budget_kbps, encoder,
+            resolution=resolution, framerate=framerate,
+        )
+        video_filters = ladder_filters(rung, media_info.width, media_info.height, media_info.fps)
+        if video_filters:
+            out_width, out_height, out_fps = rung.width, rung.height, rung.fps or out_fps
+            fps_text = f" at {rung.fps:g} fps" if rung.fps else ""
+            report(f"Encoding at {rung.width}x{rung.height}{fps_text} to fit a {budget_kbps}k video budget.")
+    result.video_filters = video_filters
+
+    # Predictive mode: a few seconds of sample encodes replace the first pass
+    curve = None
+    if use_predictive and ranges:
+        report("Predictive mode samples the whole input; using bitrate mode for a time range.")
+    elif use_predictive:
+        if not supports_predictive(encoder) or duration < MIN_PREDICTIVE_DURATION:
+            report(f"Predictive mode needs a constant-quality encoder and at least {MIN_PREDICTIVE_DURATION}s of video; "
+                   "using bitrate mode.")
+        else:
+            mark_stage("sampling")
+            try:
+                curve = measure_quality_curve(
+                    ffmpeg_path, input_path, encoder, duration, preset=encoder_preset(encoder, preset),
+                    video_filters=video_filters, cancel_token=cancel_token, log=report,
+                )
+            except EncodeCancelled:
+                result.cancelled = True
+                return fail("Compression cancelled.")
+            except (subprocess.CalledProcessError, OSError) as e:
+                report(f"Sample encode failed ({e}); using bitrate mode.")
+            else:
+                if curve is None:
+                    report("Sample sizes don't follow the quality setting; using bitrate mode.")
+    predictive = curve is not None
+    two_pass = use_two_pass and supports_two_pass(encoder) and not predictive
+    mode = rate_mode(two_pass, predictive)
+
+    # Content-aware allocation: a quick low-resolution pass over reference frames finds the busy segments
+    zones = None
+    if use_complexity and not predictive:
+        if not supports_zones(encoder):
+            report(f"{encoder} has no per-segment rate control; spreading the bitrate evenly.")
+        else:
+            mark_stage("analysis")
+            try:
+                analysis_start = time.perf_counter()
+                profile = analyze_complexity(source_info, ffmpeg_path=ffmpeg_path, cancel_token=cancel_token)
+            except EncodeCancelled:
+                result.cancelled = True
+                return fail("Compression cancelled.")
+            except (subprocess.CalledProcessError, OSError) as e:
+                report(f"Complexity analysis failed ({e}); spreading the bitrate evenly.")
+            else:
+                zones = complexity_zones(slice_profile(profile, ranges) if ranges else profile, out_fps)
+                report(f"Complexity analysis took {time.perf_counter() - analysis_start:.1f}s; "
+                       + (f"allocating over {zones.count('/') + 1} zones." if zones else "content is even."))
+
+    # Get the audio bitrate and plan the video bitrate from the learned overhead/error model
+    video_bitrate_kbps, audio_bitrate_kbps = plan_bitrates(
+        media_info, target_size_mb, log=report, encoder=encoder, container=container, two_pass=two_pass,
+        rate_controller=rate_controller, predictive=predictive,
+    )
+    joined = ranges and len(ranges) > 1  # Joined ranges pass through the concat filter; audio can't be copied
+    copy_audio = allow_fast_paths and not joined and can_copy_audio(media_info, output_path, audio_bitrate_kbps)
+    # What the audio really costs in the output: a copied track keeps the source bitrate, below the budget
+    output_audio_kbps = media_info.audio.bit_rate_kbps if copy_audio else audio_bitrate_kbps
+    if copy_audio:
+        report("Source audio fits the budget; copying it without re-encoding.")
+    result.encoder = encoder
+    result.audio_bitrate_kbps = output_audio_kbps
+
+    # Two-pass stats live in the managed pass-log cache under a per-job prefix. Stats published by an
+    # earlier encode of the same clip/encoder/options let us skip pass 1 entirely.
+    passlogfile = None
+    reusable_stats = have_stats = False
+    if two_pass:
+        passlog_key_value = passlog_key(
+            input_path, encoder, encoder_video_args(encoder, 0, preset, zones), video_filters, ranges=ranges
+        )
+        passlogfile = passlog_cache.new_job_prefix(passlog_key_value)
+        reusable_stats = passlog_cache.is_reusable(encoder)
+        have_stats = reusable_stats and passlog_cache.checkout(passlog_key_value, passlogfile)
+        if have_stats:
+            report("Reusing cached first-pass statistics; skipping pass 1.")
+    try:
+        for attempt in range(1, rate_controller.max_attempts + 1):
+            result.video_bitrate_kbps = video_bitrate_kbps
+
+            # Construct FFMPEG command(s) based on the encoder and vendor-specific settings
+            quality = curve.quality_for(video_bitrate_kbps) if predictive else None
+            if predictive:
+                report(f"Predicted quality {quality:g} for {video_bitrate_kbps}k")
+            commands = build_ffmpeg_commands(
+                ffmpeg_path, input_path, work_path, encoder, video_bitrate_kbps, audio_bitrate_kbps, two_pass,
+                passlogfile=passlogfile, skip_first_pass=have_stats, copy_audio=copy_audio, quality=quality,
+                video_filters=video_filters, preset=preset, zones=zones, ranges=ranges,
+            )
+            first_pass = 1 if two_pass and not have_stats else 2
+            encode_seconds = 0.0
+            for pass_index, cmd in enumerate(commands):
+                label = f"pass {pass_index + first_pass}" if two_pass else "command"
+                stage(f"pass{pass_index + first_pass}" if two_pass else "pass1")
+                report(f"Running {label}: {' '.join(cmd)}")
+                try:
+                    encode_seconds += run_ffmpeg(
+                        cmd, duration=duration, on_progress=on_progress, pass_index=pass_index,
+                        pass_count=len(commands), cancel_token=cancel_token,
+                    )
+                except subprocess.CalledProcessError as e:
+                    remove_partial_outputs(work_path)
+                    kind = "two-pass compression" if two_pass else "compression"
+                    return fail(f"Error during {kind}: {e} {_stderr_tail(e.stderr)}".rstrip())
+                except OSError as e:
+                    remove_partial_outputs(work_path)
+                    return fail(f"Error running FFMPEG: {e}")
+                except EncodeCancelled:
+                    remove_partial_outputs(work_path)
+                    result.cancelled = True
+                    return fail("Compression cancelled.")
+
+            if len(commands) == (2 if two_pass else 1):
+                # Full encodes only: a reused pass 1 would make this machine look faster than it is
+                megapixels = (out_width or 0) * (out_height or 0) * (out_fps or 30) * duration / 1e6
+                throughput_store.record(encoder, mode, megapixels, encode_seconds)
+            if reusable_stats and not have_stats:
+                passlog_cache.publish(passlog_key_value, passlogfile)
+                have_stats = True  # Corrective re-encodes only need pass 2
+
+            # Check the real size against the target and learn from the error
+            result.output_size = os.path.getsize(work_path)
+            observed_ratio = rate_controller.observe(
+                work_path, video_bitrate_kbps, duration, output_audio_kbps, encoder, container, mode
+            )
+            result.attempts = attempt
+            result.target_met = rate_controller.within_target(result.output_size, target_size_mb)
+            retry = rate_controller.should_retry(result.output_size, target_size_mb, observed_ratio)
+            if not retry or attempt == rate_controller.max_attempts:
+                break
+            video_bitrate_kbps = rate_controller.correct_bitrate(
+                target_size_mb, duration, output_audio_kbps, container, observed_ratio
+            )
+            report(
+                f"Output is {result.output_size / MB:.2f} MB for a {target_size_mb} MB target; "
+                f"re-encoding at {video_bitrate_kbps}k (attempt {attempt + 1}/{rate_controller.max_attempts})"
+            )
+    finally:
+        if passlogfile:
+            passlog_cache.release(passlogfile)
+
+    mark_stage("finalize")
+    moved, error = finish()
+    if not moved:
+        return fail(error)
+    if not result.target_met:
+        report(f"Warning: output is {result.output_size / MB:.2f} MB, outside the {target_size_mb} MB target band.")
+    result.success = True
+    result.elapsed = time.perf_counter() - start
+    remember()
+    suffix = " with two-pass encoding" if two_pass else " with predictive quality" if predictive else ""
+    report(f"Compressed {input_path} to {output_path} successfully{suffix}.")
+    return result
@@ -1,40 +1,246 @@
 import os
-import requests
-import zipfile
+import sys
+import json
+import time
 import shutil
+import hashlib
+import zipfile
+import argparse
+import tempfile
+from urllib.parse import urlparse
+
+from src.cache import atomic_write_json
+from src.paths import FFMPEG_DIR
+
+# Both URLs can be pointed elsewhere (a mirror, or a local server for testing)
+FFMPEG_URL = os.environ.get(
+    "COMPRESSOR_FFMPEG_URL",
+    "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip",
+)
+CHECKSUM_URL = os.environ.get("COMPRESSOR_FFMPEG_CHECKSUM_URL")
+BINARIES = ("ffmpeg", "ffprobe")  # Only these are taken from the archive
+VERSION_FILE = "VERSION"  # JSON record of the installed archive; written last, so it marks a complete install
+CHUNK_SIZE = 1024 * 1024  # Download/copy buffer
+MAX_ATTEMPTS = 5  # Download attempts, each resuming where the previous one stopped
+TIMEOUT = (10, 60)  # Connect/read timeouts in seconds
+
+
+def default_checksum_url(url):
+    """ BtbN publishes "<sha256>  <file name>" lines for every asset of a release in checksums.sha256. """
+    return url.rsplit("/", 1)[0] + "/checksums.sha256"
 
-FFMPEG_URL = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
-FFMPEG_DIR = "ffmpeg_bin"  # Directory to store FFMPEG binaries
 
-def download_ffmpeg():
-    if not os.path.exists(FFMPEG_DIR):
-        os.makedirs(FFMPEG_DIR)
+class InstallError(Exception):
+    """ Raised when FFMPEG cannot be downloaded, verified or installed. """
 
-    zip_path = os.path.join(FFMPEG_DIR, "ffmpeg.zip")
 
-    # Download FFMPEG zip
-    print("Downloading FFMPEG...")
-    with requests.get(FFMPEG_URL, stream=True) as response:
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_expected_sha256(session, checksum_url, filename):
+    """
+    Look up the published SHA-256 of an archive in a checksum list ("<hash>  <name>" per line).
+    """
+    import requests
+
+    try:
+        response = session.get(checksum_url, timeout=TIMEOUT)
         response.raise_for_status()
-        with open(zip_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+    except requests.RequestException as e:
+        raise InstallError(f"Unable to fetch checksums from {checksum_url}: {e}") from e
+    for line in response.text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].lstrip("*") == filename:
+            return parts[0].lower()
+    raise InstallError(f"No checksum for {filename} in {checksum_url}")
+
+
+def installed_version(install_dir=FFMPEG_DIR):
+    """
+    :return: The VERSION record of a complete install ({"sha256": ..., "url": ...}), or None.
+    """
+    try:
+        with open(os.path.join(install_dir, VERSION_FILE), "r", encoding="utf-8") as f:
+            version = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for name in version.get("files", []):
+        if not os.path.exists(os.path.join(install_dir, name)):
+            return None
+    return version
+
+
+def download(session, url, path, attempts=MAX_ATTEMPTS, log=print):
+    """
+    Download url to path, resuming a partial file with an HTTP Range request.
+    The server's ETag/Last-Modified is kept next to the partial file and sent as If-Range, so a file
+    that changed on the server is restarted from zero instead of being spliced.
+    :return: True if any bytes were resumed from an earlier attempt.
+    """
+    import requests  # Only needed for the download; keeps it out of every other import
+
+    meta_path = path + ".json"
+    resumed = False
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    validator = json.load(f).get("validator")
+            except (OSError, ValueError):
+                validator = None
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code == 416:
+                    return resumed  # Nothing left to fetch; the checksum decides whether the file is good
+                response.raise_for_status()
+                length = int(response.headers.get("Content-Length") or 0)
+                if response.status_code == 206:
+                    log(f"Resuming download at {offset / (1024 * 1024):.1f} MB...")
+                    mode, expected_size = "ab", offset + length
+                    resumed = True
+                else:
+                    mode, expected_size = "wb", length
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                atomic_write_json(meta_path, {"url": url, "validator": validator})
+                with open(path, mode, buffering=CHUNK_SIZE) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            size = os.path.getsize(path)
+            if expected_size and size != expected_size:
+                raise OSError(f"connection closed at {size} of {expected_size} bytes")
+            return resumed
+        except (requests.RequestException, OSError) as e:
+            if attempt == attempts:
+                raise InstallError(f"Download failed after {attempts} attempts: {e}") from e
+            delay = min(30, 2 ** attempt)
+            log(f"Download interrupted ({e}); retrying in {delay}s...")
+            time.sleep(delay)
+
+
+def extract_binaries(archive_path, directory):
+    """
+    Copy only the ffmpeg/ffprobe members of a zip into directory, streaming each member.
+    :return: Names of the extracted files.
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = {}
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                stem, ext = os.path.splitext(name)
+                if not info.is_dir() and stem in BINARIES and ext.lower() in ("", ".exe"):
+                    members[stem] = info
+            missing = [name for name in BINARIES if name not in members]
+            if missing:
+                raise InstallError(f"Archive does not contain {', '.join(missing)}")
+            names = []
+            for info in members.values():
+                name = os.path.basename(info.filename)
+                target = os.path.join(directory, name)
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.chmod(target, 0o755)
+                names.append(name)
+            return names
+    except zipfile.BadZipFile as e:
+        raise InstallError(f"Corrupt archive: {e}") from e
+
+
+def install(staging_dir, install_dir, names, version):
+    """
+    Move extracted binaries into place with atomic renames, then record the version.
+    The old VERSION is removed first, so an interrupted install is never mistaken for a complete one.
+    """
+    try:
+        os.remove(os.path.join(install_dir, VERSION_FILE))
+    except FileNotFoundError:
+        pass
+    for name in names:
+        os.replace(os.path.join(staging_dir, name), os.path.join(install_dir, name))
+    atomic_write_json(os.path.join(install_dir, VERSION_FILE), dict(version, files=names))
+
+
+def download_ffmpeg(url=FFMPEG_URL, sha256=None, checksum_url=CHECKSUM_URL, install_dir=FFMPEG_DIR, force=False,
+                    log=print):
+    """
+    Install ffmpeg and ffprobe from a release zip.
+    Skips the download when the installed archive has the expected checksum. Interrupted downloads resume,
+    the archive is verified against its SHA-256 before anything is extracted, and the binaries are
+    swapped in with atomic renames.
+    :param sha256: Expected archive checksum; fetched from checksum_url if not given.
+    :param checksum_url: Checksum list (defaults to checksums.sha256 next to url).
+    :param force: Reinstall even if the installed version matches.
+    :return: The installed VERSION record.
+    :raises InstallError: If the download, verification or installation fails.
+    """
+    import requests
+
+    filename = os.path.basename(urlparse(url).path) or "ffmpeg.zip"
+    with requests.Session() as session:
+        checksum_url = checksum_url or default_checksum_url(url)
+        expected = (sha256 or fetch_expected_sha256(session, checksum_url, filename)).lower()
+        current = installed_version(install_dir)
+        if current and current.get("sha256") == expected and not force:
+            log(f"FFMPEG is up to date in {install_dir}")
+            return current
+
+        download_dir = os.path.join(install_dir, ".download")
+        os.makedirs(download_dir, exist_ok=True)
+        archive_path = os.path.join(download_dir, filename + ".part")
+        log(f"Downloading {url}...")
+        resumed = download(session, url, archive_path, log=log)
+        actual = sha256_file(archive_path)
+        if actual != expected and resumed:
+            # The resumed bytes may belong to an older upload; start over once from scratch
+            log("Checksum mismatch after resuming; downloading again from the start...")
+            os.remove(archive_path)
+            download(session, url, archive_path, log=log)
+            actual = sha256_file(archive_path)
+        if actual != expected:
+            shutil.rmtree(download_dir, ignore_errors=True)
+            raise InstallError(f"Checksum mismatch for {filename}: expected {expected}, got {actual}")
+
+    log("Extracting FFMPEG...")
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=install_dir)
+    try:
+        names = extract_binaries(archive_path, staging_dir)
+        version = {"url": url, "sha256": expected, "installed_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        install(staging_dir, install_dir, names, version)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    shutil.rmtree(download_dir, ignore_errors=True)
+    log(f"FFMPEG installed in {install_dir}")
+    return installed_version(install_dir)
 
-    # Extract the zip file
-    print("Extracting FFMPEG...")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(FFMPEG_DIR)
 
-    # Move the binaries to the main folder
-    extracted_folder = os.path.join(FFMPEG_DIR, os.listdir(FFMPEG_DIR)[0], "bin")
-    for filename in os.listdir(extracted_folder):
-        shutil.move(os.path.join(extracted_folder, filename), FFMPEG_DIR)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download and install ffmpeg/ffprobe.")
+    parser.add_argument("--url", default=FFMPEG_URL, help="Release zip to install")
+    parser.add_argument("--sha256", default=None, help="Expected archive checksum (default: from --checksum-url)")
+    parser.add_argument("--checksum-url", default=CHECKSUM_URL,
+                        help="Checksum list (default: checksums.sha256 next to --url)")
+    parser.add_argument("--dir", default=FFMPEG_DIR, help=f"Install directory (default: {FFMPEG_DIR})")
+    parser.add_argument("--force", action="store_true", help="Reinstall even if up to date")
+    args = parser.parse_args(argv)
 
-    # Cleanup
-    shutil.rmtree(os.path.join(FFMPEG_DIR, os.listdir(FFMPEG_DIR)[0]))
-    os.remove(zip_path)
+    os.makedirs(args.dir, exist_ok=True)
+    try:
+        download_ffmpeg(args.url, sha256=args.sha256, checksum_url=args.checksum_url, install_dir=args.dir, force=args.force)
+    except InstallError as e:
+        print(f"Error installing FFMPEG: {e}")
+        return 1
+    return 0
 
-    print(f"FFMPEG installed in {FFMPEG_DIR}")
 
 if __name__ == "__main__":
-    download_ffmpeg()
+    sys.exit(main())
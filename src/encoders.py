@@ -0,0 +1,197 @@
+import os
+import time
+import shutil
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+
+from src.cache import CACHE_DIR, DiskCache
+from src.paths import FFMPEG_PATH
+
+HARDWARE_ENCODERS = ["h264_nvenc", "hevc_nvenc", "h264_amf", "hevc_amf", "h264_qsv", "hevc_qsv"]
+CPU_ENCODERS = ["libx264", "libx265"]
+
+# Preferred hardware encoders per codec, in selection order (NVIDIA, then AMD, then Intel)
+GPU_ENCODER_PREFERENCE = {
+    "h265": ["hevc_nvenc", "hevc_amf", "hevc_qsv"],
+    "h264": ["h264_nvenc", "h264_amf", "h264_qsv"],
+}
+CPU_ENCODER_FALLBACK = {"h265": "libx265", "h264": "libx264"}
+DEFAULT_CODEC = "h265"  # Output codec when the caller doesn't ask for one
+
+TEST_ENCODE_TIMEOUT = 20  # Seconds before a test encode is considered hung
+# Compiled-in encoders that failed their test encode are tried again after this long; the failure may have
+# been transient (all NVENC sessions busy, driver still loading)
+FAILED_RETEST_SECONDS = 15 * 60
+_capability_cache = DiskCache(os.path.join(CACHE_DIR, "encoder_capabilities.json"), max_entries=16)
+
+
+@dataclass
+class EncoderCapabilities:
+    ffmpeg_path: str
+    mtime_ns: int
+    version: str
+    compiled: List[str] = field(default_factory=list)  # Listed by `ffmpeg -encoders`
+    working: List[str] = field(default_factory=list)  # Passed a test encode on this machine
+    test_seconds: Dict[str, float] = field(default_factory=dict)  # Wall time of each test encode
+    tested_at: float = 0.0  # Unix time of the last test encodes
+
+    @property
+    def failed(self):
+        """ Encoders that are compiled in but failed their test encode. """
+        return [name for name in self.compiled if name not in self.working]
+
+
+def _resolve_binary(ffmpeg_path):
+    if os.path.exists(ffmpeg_path):
+        return os.path.realpath(ffmpeg_path)
+    found = shutil.which(ffmpeg_path)
+    return os.path.realpath(found) if found else ffmpeg_path
+
+
+def _binary_key(ffmpeg_path):
+    """
+    Identity of an ffmpeg binary without running it.
+    The version string is recorded alongside each entry; it can only change together with the mtime.
+    """
+    real_path = _resolve_binary(ffmpeg_path)
+    stat = os.stat(real_path)
+    return real_path, f"{real_path}|{stat.st_size}|{stat.st_mtime_ns}", stat.st_mtime_ns
+
+
+def parse_encoder_list(output):
+    """
+    Parse `ffmpeg -encoders` output into encoder names.
+    :return: List of encoder names, in listing order.
+    """
+    names = []
+    in_list = False
+    for line in output.splitlines():
+        if line.strip().startswith("------"):
+            in_list = True
+            continue
+        parts = line.split()
+        if in_list and len(parts) >= 2:
+            names.append(parts[1])
+    return names
+
+
+def test_encoder(ffmpeg_path, encoder):
+    """
+    Run a tiny lavfi test encode to check an encoder actually works (driver present, session available).
+    :return: Wall time in seconds if the encode succeeded, otherwise None.
+    """
+    cmd = [
+        ffmpeg_path,
+        "-hide_banner",
+        "-v", "error",
+        "-f", "lavfi",
+        "-i", "color=c=black:s=256x256:r=30:d=1",
+        "-frames:v", "10",
+        "-c:v", encoder,
+        "-f", "null",
+        "-",
+    ]
+    start = time.perf_counter()
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=TEST_ENCODE_TIMEOUT)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return None
+    return round(time.perf_counter() - start, 4)
+
+
+def _run_tests(ffmpeg_path, capabilities, encoders):
+    for encoder in encoders:
+        elapsed = test_encoder(ffmpeg_path, encoder)
+        if elapsed is not None:
+            capabilities.working.append(encoder)
+            capabilities.test_seconds[encoder] = elapsed
+    capabilities.working.sort(key=capabilities.compiled.index)
+    capabilities.tested_at = time.time()
+
+
+def build_capabilities(ffmpeg_path):
+    """
+    Query an ffmpeg binary for its version and encoders, and test-encode every encoder we can use.
+    """
+    real_path, _, mtime_ns = _binary_key(ffmpeg_path)
+    try:
+        version_output = subprocess.check_output([ffmpeg_path, "-hide_banner", "-version"], universal_newlines=True)
+        version = version_output.splitlines()[0] if version_output else "unknown"
+        encoders_output = subprocess.check_output([ffmpeg_path, "-hide_banner", "-encoders"], universal_newlines=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error querying FFMPEG encoders: {e}")
+        return EncoderCapabilities(ffmpeg_path=real_path, mtime_ns=mtime_ns, version="unknown")
+
+    listed = set(parse_encoder_list(encoders_output))
+    compiled = [name for name in CPU_ENCODERS + HARDWARE_ENCODERS if name in listed]
+    capabilities = EncoderCapabilities(ffmpeg_path=real_path, mtime_ns=mtime_ns, version=version, compiled=compiled)
+    _run_tests(ffmpeg_path, capabilities, compiled)
+    return capabilities
+
+
+def get_encoder_capabilities(ffmpeg_path=None, refresh=False):
+    """
+    Encoder capabilities for an ffmpeg binary, built once and cached on disk.
+    Entries are keyed by the binary's real path, size and mtime, so upgrading ffmpeg triggers a rebuild.
+    Encoders that failed their test encode are re-tested once the entry is FAILED_RETEST_SECONDS old.
+    :param ffmpeg_path: ffmpeg executable (defaults to the bundled/PATH one).
+    :param refresh: Ignore the cache and re-run the capability tests.
+    :return: EncoderCapabilities; empty lists if the binary is missing.
+    """
+    ffmpeg_path = ffmpeg_path or FFMPEG_PATH
+    try:
+        _, key, _ = _binary_key(ffmpeg_path)
+    except OSError:
+        print(f"FFMPEG not found at {ffmpeg_path}.")
+        return EncoderCapabilities(ffmpeg_path=ffmpeg_path, mtime_ns=0, version="unknown")
+
+    if not refresh:
+        cached = _capability_cache.get(key)
+        if cached is not None:
+            capabilities = EncoderCapabilities(**cached)
+            if not capabilities.failed or time.time() - capabilities.tested_at < FAILED_RETEST_SECONDS:
+                return capabilities
+            _run_tests(ffmpeg_path, capabilities, capabilities.failed)
+            _capability_cache.put(key, asdict(capabilities))
+            return capabilities
+
+    capabilities = build_capabilities(ffmpeg_path)
+    if capabilities.compiled:
+        _capability_cache.put(key, asdict(capabilities))
+    return capabilities
+
+
+def encoder_class(encoder):
+    """
+    Scheduling class of an encoder: "cpu" for software encoders, otherwise the hardware vendor family.
+    """
+    for family in ("nvenc", "amf", "qsv"):
+        if encoder.endswith(family):
+            return family
+    return "cpu"
+
+
+def select_encoder(codec, use_gpu=True, ffmpeg_path=None):
+    """
+    Pick the encoder for a codec from the cached capabilities; spawns nothing once the cache is warm.
+    Hardware encoders are only chosen if they passed a test encode.
+    :param codec: "h264" or "h265".
+    :param use_gpu: Allow hardware encoders.
+    :return: Encoder name, falling back to libx264/libx265.
+    """
+    if use_gpu:
+        working = get_encoder_capabilities(ffmpeg_path).working
+        for encoder in GPU_ENCODER_PREFERENCE.get(codec, []):
+            if encoder in working:
+                return encoder
+    return CPU_ENCODER_FALLBACK.get(codec, "libx264")
+
+
+if __name__ == "__main__":
+    caps = get_encoder_capabilities(refresh=True)
+    print(f"FFMPEG: {caps.ffmpeg_path}")
+    print(f"Version: {caps.version}")
+    for name in caps.compiled:
+        status = f"OK ({caps.test_seconds[name]:.2f}s)" if name in caps.working else "FAILED"
+        print(f"  {name}: {status}")
@@ -0,0 +1,129 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from src.compressor import default_rate_controller, supports_two_pass
+from src.encoders import get_encoder_capabilities, select_encoder
+from src.fast_path import DEFAULT_AUDIO_KBPS, audio_budget_kbps, plan_fast_path
+from src.helpers import calculate_bitrate
+from src.ladder import choose_rung
+from src.predictor import MIN_PREDICTIVE_DURATION, supports_predictive
+from src.probe import probe_media
+from src.ranges import normalize_ranges, selected_duration
+from src.rate_control import container_for, rate_mode, MB
+from src.throughput import default_throughput_store
+
+
+@dataclass
+class Estimate:
+    encoder: str
+    output_size_mb: float
+    video_bitrate_kbps: int
+    audio_bitrate_kbps: int
+    width: Optional[int]
+    height: Optional[int]
+    fps: Optional[float]
+    encode_seconds: float
+    fast_path: Optional[str] = None  # Set if the input would be copied/remuxed instead of encoded
+
+
+class Estimator:
+    """
+    Output size and encode time predictions for one loaded video.
+    probe() does the slow work once (probe, encoder capabilities); estimate() is pure arithmetic,
+    cheap enough to run on every change of a GUI control.
+    """
+
+    def __init__(self, throughput_store=None, rate_controller=None, ffmpeg_path=None):
+        self.throughput_store = throughput_store or default_throughput_store
+        self.rate_controller = rate_controller or default_rate_controller
+        self.ffmpeg_path = ffmpeg_path
+        self.media_info = None
+        self._encoders = {}
+
+    def probe(self, input_path):
+        """
+        Probe a video (cached) and warm the encoder registry. Blocking; call it off the UI thread.
+        :return: MediaInfo of the video.
+        :raises ProbeError: If the file can't be probed.
+        """
+        media_info = probe_media(input_path)
+        get_encoder_capabilities(self.ffmpeg_path)
+        return media_info
+
+    def set_media(self, media_info):
+        """ Make a probed video the subject of estimate(). """
+        self.media_info = media_info
+
+    def load(self, input_path):
+        """ probe() and set_media() in one blocking call. """
+        self.set_media(self.probe(input_path))
+        return self.media_info
+
+    def encoder_for(self, codec, use_gpu):
+        key = (codec, use_gpu)
+        if key not in self._encoders:
+            self._encoders[key] = select_encoder(codec, use_gpu=use_gpu, ffmpeg_path=self.ffmpeg_path)
+        return self._encoders[key]
+
+    def estimate(self, target_size_mb=None, video_bitrate_kbps=None, codec="h264", use_gpu=False, use_two_pass=False,
+                 use_predictive=False, resolution=None, framerate=None, output_path=None, ranges=None):
+        """
+        Predict the result of compressing the loaded video with these settings.
+        :param target_size_mb: Target size, as passed to compress_video.
+        :param video_bitrate_kbps: Fixed video bitrate instead of a target size.
+        :param ranges: Time ranges to encode, as passed to compress_video.
+        :return: Estimate, or None if no video is loaded, neither size nor bitrate is given, or the ranges
+            select nothing.
+        """
+        info = self.media_info
+        if info is None or not info.duration or not (target_size_mb or video_bitrate_kbps):
+            return None
+        if ranges:
+            try:
+                info = replace(info, duration=selected_duration(normalize_ranges(ranges, info.duration)))
+            except ValueError:
+                return None
+        duration = info.duration
+        output_path = output_path or info.path
+        container = container_for(output_path)
+        encoder = self.encoder_for(codec, use_gpu)
+        predictive = (use_predictive and not ranges and supports_predictive(encoder)
+                      and duration >= MIN_PREDICTIVE_DURATION)
+        mode = rate_mode(use_two_pass and supports_two_pass(encoder) and not predictive, predictive)
+
+        if target_size_mb:
+            audio_kbps = audio_budget_kbps(info, target_size_mb)
+            overhead = self.rate_controller.predict_overhead_bytes(container, duration)
+            fast_path = None if ranges else plan_fast_path(
+                info, target_size_mb, output_path, audio_kbps, overhead, codec=codec, resolution=resolution,
+                framerate=framerate,
+            )
+            if fast_path:
+                size_mb = info.size / MB if fast_path in ("copy", "remux") else min(info.size / MB, target_size_mb)
+                return Estimate(
+                    encoder="copy", output_size_mb=size_mb, video_bitrate_kbps=info.video_bitrate_kbps or 0,
+                    audio_bitrate_kbps=audio_kbps, width=info.width, height=info.height, fps=info.fps,
+                    encode_seconds=0.0, fast_path=fast_path,
+                )
+            budget_kbps = calculate_bitrate(target_size_mb, duration, audio_kbps)
+            video_kbps = self.rate_controller.plan_video_bitrate(
+                target_size_mb, duration, audio_kbps, encoder, container, mode
+            )
+            # The rate controller aims for the middle of its tolerance band
+            size_mb = target_size_mb * (1 - self.rate_controller.tolerance / 2)
+        else:
+            audio_kbps = info.audio_bitrate_kbps or (DEFAULT_AUDIO_KBPS if info.audio else 0)
+            budget_kbps = video_kbps = video_bitrate_kbps
+            overhead = self.rate_controller.predict_overhead_bytes(container, duration)
+            size_mb = ((video_kbps + audio_kbps) * 1000 / 8 * duration + overhead) / MB
+
+        width, height, fps = info.width, info.height, info.fps
+        rung = choose_rung(width, height, fps, budget_kbps, encoder, resolution=resolution, framerate=framerate)
+        if rung:
+            width, height, fps = rung.width, rung.height, rung.fps or fps
+        megapixels = (width or 0) * (height or 0) * (fps or 30) * duration / 1e6
+        return Estimate(
+            encoder=encoder, output_size_mb=size_mb, video_bitrate_kbps=video_kbps, audio_bitrate_kbps=audio_kbps,
+            width=width, height=height, fps=fps,
+            encode_seconds=self.throughput_store.estimate_seconds(encoder, mode, megapixels),
+        )
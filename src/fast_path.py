@@ -0,0 +1,114 @@
+import os
+
+from src.rate_control import MB, container_for
+
+DEFAULT_AUDIO_KBPS = 128  # Used when the source doesn't report an audio bitrate
+MIN_AUDIO_KBPS = 32
+AUDIO_MAX_SHARE = 0.25  # Audio never takes more than this share of the total bitrate
+
+# Codecs each output container can carry without re-encoding
+COPYABLE_VIDEO = {
+    "mp4": {"h264", "hevc", "av1", "vp9", "mpeg4"},
+    "webm": {"vp8", "vp9", "av1"},
+}
+COPYABLE_AUDIO = {
+    "mp4": {"aac", "mp3", "alac", "ac3", "eac3"},
+    "webm": {"opus", "vorbis"},
+}
+CODEC_NAMES = {"h264": "h264", "h265": "hevc"}  # Requested codec -> ffprobe codec_name
+FPS_TOLERANCE = 0.01
+
+
+def _output_family(output_path):
+    # WebM is Matroska with a restricted codec list
+    if os.path.splitext(output_path)[1].lower() == ".webm":
+        return "webm"
+    return container_for(output_path)
+
+
+def can_copy_stream(codec_name, output_path, table):
+    family = _output_family(output_path)
+    if family == "matroska":
+        return codec_name is not None  # Matroska carries anything
+    return codec_name in table.get(family, set())
+
+
+def audio_budget_kbps(media_info, target_size_mb):
+    """
+    Audio bitrate to spend: the source bitrate, capped at a share of the total budget.
+    :return: Audio kbps, or 0 if the input has no audio.
+    """
+    if media_info.audio is None:
+        return 0
+    source_kbps = media_info.audio_bitrate_kbps or DEFAULT_AUDIO_KBPS
+    total_kbps = target_size_mb * MB * 8 / 1000 / media_info.duration
+    return max(MIN_AUDIO_KBPS, min(source_kbps, int(total_kbps * AUDIO_MAX_SHARE)))
+
+
+def can_copy_audio(media_info, output_path, audio_kbps):
+    """ The source audio already fits the budget and the output container can carry it. """
+    audio = media_info.audio
+    return (
+        audio is not None
+        and audio.bit_rate_kbps is not None
+        and audio.bit_rate_kbps <= audio_kbps
+        and can_copy_stream(audio.codec_name, output_path, COPYABLE_AUDIO)
+    )
+
+
+def video_matches(media_info, codec=None, resolution=None, framerate=None):
+    """
+    The source video already is what an explicit request asks for: the codec, and no more than the
+    resolution (short side) and framerate (outputs are never upscaled).
+    """
+    video = media_info.video
+    if video is None:
+        return False
+    if codec and video.codec_name != CODEC_NAMES.get(codec, codec):
+        return False
+    if resolution and min(media_info.width or 0, media_info.height or 0) > resolution:
+        return False
+    if framerate and (media_info.fps or 0) > framerate + FPS_TOLERANCE:
+        return False
+    return True
+
+
+def plan_fast_path(media_info, target_size_mb, output_path, audio_kbps, overhead_bytes, codec=None, resolution=None,
+                   framerate=None, preset=None):
+    """
+    Decide whether an input can skip the video encode.
+    An explicit codec, resolution, framerate or preset is a request for that output: a preset always means
+    an encode, and otherwise only "copy_video" is allowed, when the source video already matches.
+    :param audio_kbps: Audio budget from audio_budget_kbps().
+    :param overhead_bytes: Predicted mux overhead for the output.
+    :param codec: Explicitly requested codec ("h264"/"h265"), or None for any.
+    :param resolution: Explicitly requested output height (short side), or None.
+    :param framerate: Explicitly requested output framerate, or None.
+    :param preset: Explicitly requested encoder preset, or None.
+    :return: One of
+        "copy"        - the file already fits and is in the right container; copy it as-is,
+        "remux"       - the file already fits; change container with stream copy only,
+        "copy_video"  - only the audio is too big; copy video and re-encode audio to audio_kbps,
+        None          - a full encode is needed.
+    """
+    explicit = codec or resolution or framerate or preset
+    if explicit and (preset or not video_matches(media_info, codec, resolution, framerate)):
+        return None
+    target_bytes = target_size_mb * MB
+    same_container = os.path.splitext(media_info.path)[1].lower() == os.path.splitext(output_path)[1].lower()
+    video = media_info.video
+    video_copyable = video is not None and can_copy_stream(video.codec_name, output_path, COPYABLE_VIDEO)
+    audio_copyable = media_info.audio is None or can_copy_stream(media_info.audio_codec, output_path, COPYABLE_AUDIO)
+
+    if media_info.size <= target_bytes and not explicit:
+        if same_container:
+            return "copy"
+        if video_copyable and audio_copyable:
+            return "remux"
+
+    if video_copyable and media_info.video_bitrate_kbps and media_info.audio is not None:
+        video_bytes = media_info.video_bitrate_kbps * 1000 / 8 * media_info.duration
+        audio_bytes = audio_kbps * 1000 / 8 * media_info.duration
+        if video_bytes + audio_bytes + overhead_bytes <= target_bytes:
+            return "copy_video"
+    return None
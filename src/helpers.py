@@ -1,49 +1,27 @@
-import subprocess
-import json
 import os
 
+from src.encoders import get_encoder_capabilities, HARDWARE_ENCODERS
+from src.probe import probe_media, ProbeError
+
 
 def detect_gpu_encoders(ffmpeg_path):
     """
     Detect available GPU encoders from FFMPEG.
+    Uses the cached capability registry, so only encoders that passed a test encode are returned.
     :return: List of supported GPU encoders.
     """
-    try:
-        cmd = [ffmpeg_path, "-hide_banner", "-encoders"]
-        output = subprocess.check_output(cmd, universal_newlines=True)
-        encoders = []
-        if "h264_nvenc" in output:
-            encoders.append("h264_nvenc")
-        if "hevc_nvenc" in output:
-            encoders.append("hevc_nvenc")
-        if "h264_amf" in output:
-            encoders.append("h264_amf")
-        if "hevc_amf" in output:
-            encoders.append("hevc_amf")
-        if "h264_qsv" in output:
-            encoders.append("h264_qsv")
-        if "hevc_qsv" in output:
-            encoders.append("hevc_qsv")
-        return encoders
-    except subprocess.CalledProcessError:
-        return []
+    capabilities = get_encoder_capabilities(ffmpeg_path)
+    return [name for name in capabilities.working if name in HARDWARE_ENCODERS]
 
 
 def get_video_duration(input_path):
-    ffprobe_path = "C:/Users/imti/Documents/Programming/Compressor/ffmpeg_bin/ffprobe.exe"
-    cmd = [
-        ffprobe_path,
-        "-v", "error",  # Suppresses unnecessary logs 
-        "-show_entries", "format=duration",  # Fetches only duration field
-        "-of", "json",  # Output as JSON, easy parsing
-        input_path
-    ]
+    """
+    Get the duration of a video file in seconds.
+    :return: Duration in seconds, or 0 if unavailable.
+    """
     try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
-        # Parse JSON output, get duration
-        duration = json.loads(result.stdout)["format"]["duration"]
-        return float(duration)
-    except Exception as e:
+        return probe_media(input_path).duration
+    except ProbeError as e:
         print(f"Error fetching video duration: {e}")
         return 0
 
@@ -63,20 +41,37 @@ def get_audio_bitrate(input_path):
     :param input_path: Path to the video file.
     :return: Audio bitrate in kbps or None if unavailable.
     """
-    ffprobe_path = "C:/Users/imti/Documents/Programming/Compressor/ffmpeg_bin/ffprobe.exe"
-    cmd = [
-        ffprobe_path,
-        "-v", "error",
-        "-select_streams", "a:0",  # Select the first audio stream
-        "-show_entries", "stream=bit_rate",
-        "-of", "json",
-        input_path
-    ]
     try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
-        audio_info = json.loads(result.stdout)
-        bit_rate = audio_info["streams"][0]["bit_rate"]
-        return round(float(bit_rate) / 1000) if bit_rate else 0  # Convert to kbps
-    except Exception as e:
+        audio = probe_media(input_path).audio
+    except ProbeError as e:
         print(f"Error fetching audio bitrate: {e}")
         return None
+    if audio is None:
+        print("Error fetching audio bitrate: no audio stream")
+        return None
+    return audio.bit_rate_kbps or 0
+
+
+def generate_output_filename(input_video, target_size, custom_name=None, output_dir=None):
+    """
+    Generates an output filename based on user input or defaults to original filename with compression details.
+    Preserves the original file extension.
+    :param target_size: Target size in MB as a number or text; 10, 10.0 and "10" all name the file "..._10MB...".
+    """
+    filename, ext = os.path.splitext(os.path.basename(input_video))
+    try:
+        target_size = f"{float(target_size):g}"  # Every entry point (CLI float, default int, GUI text) agrees
+    except (TypeError, ValueError):
+        pass
+
+    # Ensure custom name has an extension (preserve original extension)
+    if custom_name and not os.path.splitext(custom_name)[1]:
+        custom_name += ext  
+
+    # Use custom name or auto-generate filename
+    output_filename = custom_name if custom_name else f"{filename}_{target_size}MB_compressed{ext}"
+
+    # Use selected output directory or default to input file's directory
+    output_folder = output_dir or os.path.dirname(input_video)
+
+    return os.path.join(output_folder, output_filename)
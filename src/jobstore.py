@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.cache import CACHE_DIR, content_fingerprint
+from src.compressor import compress_video, CompressionResult
+from src.encoders import HARDWARE_ENCODERS
+from src.helpers import generate_output_filename
+from src.metrics import JsonLinesHook, MetricsAggregator, add_hook, serve_prometheus
+
+JOB_STATES = ("queued", "probing", "pass1", "pass2", "done", "failed")
+RUNNING_STATES = ("probing", "pass1", "pass2")
+DEFAULT_JOB_DB = os.path.join(CACHE_DIR, "jobs.sqlite3")
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 30.0  # Seconds before the first retry; doubles with every further failure
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    target_size_mb REAL NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    encoder TEXT,
+    output_size INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_attempt_at);
+"""
+
+
+def job_dedup_key(input_path, target_size_mb, params):
+    """
+    Jobs are the same if the input has the same contents and the compression parameters match,
+    wherever the file lives.
+    """
+    identity = json.dumps([content_fingerprint(input_path), target_size_mb, params], sort_keys=True)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    SQLite record of compression jobs and their progress (queued -> probing -> pass1 -> pass2 -> done/failed).
+    Every state change is committed immediately, so after a crash or reboot the store knows exactly
+    which jobs finished; jobs caught mid-encode are put back in the queue by recover().
+    """
+
+    def __init__(self, path=DEFAULT_JOB_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # A committed state survives power loss
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._conn.close()
+
+    def add_job(self, input_path, output_path, target_size_mb, **params):
+        """
+        Queue a job unless the same input/parameters are already in the store.
+        :param params: compress_video keyword arguments (codec, use_gpu, use_two_pass, ...).
+        :return: (job id, True if newly added).
+        """
+        key = job_dedup_key(input_path, target_size_mb, params)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (dedup_key, input_path, output_path, target_size_mb, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, os.path.abspath(input_path), os.path.abspath(output_path), target_size_mb,
+                 json.dumps(params, sort_keys=True), now, now),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+            row = self._conn.execute("SELECT id FROM jobs WHERE dedup_key = ?", (key,)).fetchone()
+            return row["id"], False
+
+    def update(self, job_id, **fields):
+        """ Set columns of a job (state, error, ...) and commit. """
+        if "state" in fields and fields["state"] not in JOB_STATES:
+            raise ValueError(f"unknown job state: {fields['state']}")
+        if "params" in fields:
+            fields["params"] = json.dumps(fields["params"], sort_keys=True)
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def jobs(self, states=None):
+        """ All jobs, optionally only those in the given states, oldest first. """
+        query = "SELECT * FROM jobs"
+        args = ()
+        if states:
+            query += f" WHERE state IN ({', '.join('?' * len(states))})"
+            args = tuple(states)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def recover(self):
+        """
+        Requeue jobs that were running when the previous process died.
+        :return: Number of jobs requeued.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET state = 'queued', updated_at = ? WHERE state IN ({', '.join('?' * len(RUNNING_STATES))})",
+                (time.time(), *RUNNING_STATES),
+            )
+            return cursor.rowcount
+
+    def claim_next(self):
+        """
+        Atomically take the oldest queued job whose retry time has come, marking it as probing.
+        :return: Job dict, or None if nothing is runnable now.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'queued' AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row:
+                    self._conn.execute("UPDATE jobs SET state = 'probing', updated_at = ? WHERE id = ?", (now, row["id"]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row, state="probing") if row else None
+
+    def next_retry_delay(self):
+        """ Seconds until the earliest queued job becomes runnable, or None if none are queued. """
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt_at) AS at FROM jobs WHERE state = 'queued'").fetchone()
+        return None if row["at"] is None else max(0.0, row["at"] - time.time())
+
+    @staticmethod
+    def _to_dict(row, **overrides):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job.update(overrides)
+        return job
+
+
+class JobRunner:
+    """
+    Work through a JobStore with a fixed number of workers.
+    Failed jobs are retried with exponential backoff; a job that failed on a hardware encoder is
+    retried on the CPU encoder.
+    """
+
+    def __init__(self, store, workers=1, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=DEFAULT_BACKOFF, log=print):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.log = log
+
+    def _report(self, message):
+        if self.log:
+            self.log(message)
+
+    def run_job(self, job):
+        """ Compress one claimed job and record the outcome. """
+        job_id = job["id"]
+        params = dict(job["params"])
+        try:
+            result = compress_video(
+                job["input_path"], job["output_path"], job["target_size_mb"], log=None,
+                on_stage=lambda stage: self.store.update(job_id, state=stage), **params,
+            )
+        except Exception as e:  # Never leave a job stuck in a running state
+            result = CompressionResult(input_path=job["input_path"], output_path=job["output_path"], error=str(e))
+        attempts = job["attempts"] + 1
+        if result.success:
+            self.store.update(job_id, state="done", attempts=attempts, encoder=result.encoder,
+                              output_size=result.output_size, error=None)
+            self._report(f"[{job_id}] done: {job['output_path']}")
+            return result
+
+        if attempts >= self.max_attempts:
+            self.store.update(job_id, state="failed", attempts=attempts, encoder=result.encoder, error=result.error)
+            self._report(f"[{job_id}] failed after {attempts} attempts: {result.error}")
+            return result
+
+        if result.encoder in HARDWARE_ENCODERS and params.get("use_gpu", True):
+            params["use_gpu"] = False  # Driver/session problems are common; the CPU encoder is the safe fallback
+            self._report(f"[{job_id}] {result.encoder} failed; retrying on the CPU encoder")
+        delay = self.backoff * 2 ** (attempts - 1)
+        self.store.update(job_id, state="queued", attempts=attempts, encoder=result.encoder, error=result.error,
+                          params=params, next_attempt_at=time.time() + delay)
+        self._report(f"[{job_id}] attempt {attempts} failed ({result.error}); retrying in {delay:.0f}s")
+        return result
+
+    def run(self):
+        """
+        Recover interrupted jobs, then run until nothing is queued (waiting out retry backoffs).
+        """
+        recovered = self.store.recover()
+        if recovered:
+            self._report(f"Resuming {recovered} interrupted job(s)")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job") as pool:
+            running = set()
+            while True:
+                while len(running) < self.workers:
+                    job = self.store.claim_next()
+                    if job is None:
+                        break
+                    self._report(f"[{job['id']}] starting {job['input_path']}")
+                    running.add(pool.submit(self.run_job, job))
+                # With a free worker, wake up when the next backed-off job becomes due
+                delay = self.store.next_retry_delay() if len(running) < self.workers else None
+                if not running:
+                    if delay is None:
+                        return
+                    time.sleep(delay)
+                    continue
+                _, running = wait(running, timeout=delay, return_when=FIRST_COMPLETED)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent, resumable compression job queue.")
+    parser.add_argument("--db", default=DEFAULT_JOB_DB, help="Job database (default: cache/jobs.sqlite3)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Queue videos")
+    add_parser.add_argument("inputs", nargs="+")
+    add_parser.add_argument("--target-size", type=float, default=10)
+    add_parser.add_argument("--output-dir", default=None)
+    add_parser.add_argument("--codec", default=None, choices=("h264", "h265"),
+                            help="Output codec (default h265; an input that already fits may be kept as it is)")
+    add_parser.add_argument("--no-gpu", action="store_true")
+    add_parser.add_argument("--single-pass", action="store_true")
+
+    run_parser = subparsers.add_parser("run", help="Run queued and interrupted jobs")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    run_parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF)
+    run_parser.add_argument("--metrics-jsonl", default=None, help="Append per-job metrics to this JSON lines file")
+    run_parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+
+    subparsers.add_parser("list", help="Show all jobs")
+    args = parser.parse_args(argv)
+
+    store = JobStore(args.db)
+    try:
+        if args.command == "add":
+            params = {"codec": args.codec, "use_gpu": not args.no_gpu, "use_two_pass": not args.single_pass}
+            for input_path in args.inputs:
+                output_path = generate_output_filename(input_path, args.target_size, output_dir=args.output_dir)
+                try:
+                    job_id, added = store.add_job(input_path, output_path, args.target_size, **params)
+                except OSError as e:
+                    print(f"Skipping {input_path}: {e}")
+                    continue
+                print(f"[{job_id}] {'queued' if added else 'already known'}: {input_path}")
+        elif args.command == "run":
+            if args.metrics_jsonl:
+                add_hook(JsonLinesHook(args.metrics_jsonl))
+            if args.metrics_port is not None:
+                aggregator = MetricsAggregator()
+                add_hook(aggregator)
+                serve_prometheus(aggregator, args.metrics_port)
+                print(f"Serving metrics on :{args.metrics_port}/metrics")
+            JobRunner(store, workers=args.workers, max_attempts=args.max_attempts, backoff=args.backoff).run()
+        else:
+            for job in store.jobs():
+                print(f"[{job['id']}] {job['state']:<7} attempts={job['attempts']} {job['input_path']} -> {job['output_path']}"
+                      + (f"  ({job['error']})" if job["error"] else ""))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
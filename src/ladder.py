@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# Output heights (short side for portrait video) tried from highest to lowest
+RESOLUTION_LADDER = (2160, 1440, 1080, 720, 540, 480, 360, 240)
+HALF_RATE_MIN_FPS = 48  # Sources at or above this may be halved (60 -> 30, 50 -> 25)
+# Lowest bits per pixel (per frame) worth spending before dropping a rung; newer codecs need fewer
+MIN_BITS_PER_PIXEL = {
+    "h264": 0.06,
+    "hevc": 0.04,
+    "av1": 0.03,
+}
+
+
+@dataclass
+class Rung:
+    width: int
+    height: int
+    fps: Optional[float]
+
+
+def codec_family(encoder):
+    if "265" in encoder or "hevc" in encoder:
+        return "hevc"
+    if "av1" in encoder:
+        return "av1"
+    return "h264"
+
+
+def bits_per_pixel(video_bitrate_kbps, width, height, fps):
+    """ Video bits available per pixel per frame. """
+    return video_bitrate_kbps * 1000 / (width * height * (fps or 30))
+
+
+def _even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+
+def scaled_rung(width, height, short_side, out_fps):
+    """ Rung with the short side scaled to `short_side`, keeping the aspect ratio. """
+    factor = short_side / min(width, height)
+    return Rung(_even(width * factor), _even(height * factor), out_fps)
+
+
+def candidate_rungs(width, height, fps):
+    """
+    Every output rung at or below the source, best first. Never upscales.
+    High framerates are halved before the resolution drops: at low budgets, fewer sharper frames
+    look better than many blurry ones.
+    """
+    short = min(width, height)
+    heights = [short] + [h for h in RESOLUTION_LADDER if h < short]
+    rates = [fps]
+    if fps and fps >= HALF_RATE_MIN_FPS:
+        rates.append(fps / 2)
+    return [scaled_rung(width, height, h, rate) for h in heights for rate in rates]
+
+
+def choose_rung(width, height, fps, video_bitrate_kbps, encoder, resolution=None, framerate=None):
+    """
+    Highest resolution/framerate rung the bitrate can feed above the codec's bits-per-pixel floor.
+    :param resolution: Explicit output height (short side) overriding the automatic choice.
+    :param framerate: Explicit output framerate overriding the automatic choice.
+    :return: Rung, or None if the source should be encoded as-is.
+    """
+    if not width or not height:
+        return None
+    short = min(width, height)
+    if resolution or framerate:
+        out_short = min(resolution or short, short)
+        out_fps = min(framerate, fps) if framerate and fps else (framerate or fps)
+        rung = scaled_rung(width, height, out_short, out_fps)
+    else:
+        floor = MIN_BITS_PER_PIXEL[codec_family(encoder)]
+        rungs = candidate_rungs(width, height, fps)
+        rung = next(
+            (r for r in rungs if bits_per_pixel(video_bitrate_kbps, r.width, r.height, r.fps) >= floor),
+            rungs[-1],  # Even the lowest rung is starved; it's still the best use of the bits
+        )
+    if (rung.width, rung.height) == (width, height) and rung.fps == fps:
+        return None
+    return rung
+
+
+def ladder_filters(rung, width, height, fps):
+    """
+    ffmpeg video filter chain moving the source to a rung; the fps filter runs first so dropped
+    frames are never scaled.
+    :return: Filter string, or None if nothing changes.
+    """
+    if rung is None:
+        return None
+    filters = []
+    if rung.fps and fps and rung.fps < fps:
+        filters.append(f"fps={rung.fps:g}")
+    if (rung.width, rung.height) != (width, height):
+        filters.append(f"scale={rung.width}:{rung.height}")
+    return ",".join(filters) or None
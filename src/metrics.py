@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+MB = 1024 * 1024
+QUANTILES = (0.5, 0.9, 0.99)
+WINDOW = 1000  # Recent samples per stage kept for percentiles
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+@dataclass
+class Span:
+    name: str  # Stage: encoder_detection, cache_lookup, probing, analysis, sampling, pass1, pass2, finalize, ...
+    job_id: str
+    start: float  # Unix time
+    seconds: float = 0.0  # Wall time
+    cpu_seconds: float = 0.0  # User + system time of ffmpeg processes run in this stage
+    peak_rss_bytes: int = 0  # Largest resident set of those processes
+    processes: int = 0
+
+
+@dataclass
+class JobMetrics:
+    job_id: str
+    input_path: str
+    output_path: str
+    start: float  # Unix time
+    target_bytes: int
+    input_bytes: Optional[int] = None
+    output_bytes: Optional[int] = None
+    size_ratio: Optional[float] = None  # Achieved output size / target size
+    seconds: float = 0.0
+    success: bool = False
+    cache_hit: bool = False
+    encoder: Optional[str] = None
+    error: Optional[str] = None
+    spans: List[Span] = field(default_factory=list)
+
+    def stage_seconds(self):
+        """ Wall time per stage name, summed over repeats (corrective re-encodes run pass 2 again). """
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.seconds
+        return totals
+
+
+class MetricsHook:
+    """
+    Receives metrics as jobs run. Subclass it and register an instance with add_hook().
+    Called from the threads running the jobs; hooks must be thread-safe and quick.
+    """
+
+    def on_span(self, span):
+        """ A stage of a job finished. """
+
+    def on_job(self, job):
+        """ A job finished; job is a JobMetrics with all its spans. """
+
+
+_hooks = []
+_hooks_lock = threading.Lock()
+_current = threading.local()
+
+
+def add_hook(hook):
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _emit(method, value):
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            getattr(hook, method)(value)
+        except Exception as e:  # A broken exporter must never fail an encode
+            print(f"Metrics hook {type(hook).__name__} failed: {e}")
+
+
+class JobRecorder:
+    """ Collects the spans of one job. Stages follow each other: starting one ends the previous. """
+
+    def __init__(self, input_path, output_path, target_size_mb):
+        self.job = JobMetrics(
+            job_id=uuid.uuid4().hex[:12], input_path=input_path, output_path=output_path, start=time.time(),
+            target_bytes=int(target_size_mb * MB),
+        )
+        try:
+            self.job.input_bytes = os.path.getsize(input_path)
+        except (OSError, TypeError):
+            pass
+        self._started = time.perf_counter()
+        self._span = None
+        self._span_started = None
+        self._lock = threading.Lock()  # Worker threads of one job (see bind_job) report processes concurrently
+
+    def stage(self, name):
+        with self._lock:
+            self._close_span()
+            self._span = Span(name=name, job_id=self.job.job_id, start=time.time())
+            self._span_started = time.perf_counter()
+
+    def record_process(self, rusage):
+        """ Charge a finished subprocess's CPU time and memory to the running stage. """
+        with self._lock:
+            if self._span is None or rusage is None:
+                return
+            self._span.cpu_seconds += rusage.ru_utime + rusage.ru_stime
+            self._span.peak_rss_bytes = max(self._span.peak_rss_bytes, rusage.ru_maxrss * _MAXRSS_SCALE)
+            self._span.processes += 1
+
+    def _close_span(self):
+        if self._span is None:
+            return
+        self._span.seconds = time.perf_counter() - self._span_started
+        self.job.spans.append(self._span)
+        _emit("on_span", self._span)
+        self._span = None
+
+    def finish(self, result=None, error=None):
+        """
+        Close the job and hand it to the hooks.
+        :param result: CompressionResult the job returned.
+        :param error: Exception the job raised instead of returning (counted as a failure).
+        """
+        with self._lock:
+            self._close_span()
+        job = self.job
+        job.seconds = time.perf_counter() - self._started
+        if result is not None:
+            job.success = result.success
+            job.cache_hit = result.cache_hit
+            job.encoder = result.encoder
+            job.error = result.error
+            job.output_bytes = result.output_size
+            if result.output_size and job.target_bytes:
+                job.size_ratio = result.output_size / job.target_bytes
+        else:
+            job.error = f"{type(error).__name__}: {error}"
+        _emit("on_job", job)
+
+
+def mark_stage(name):
+    """ Start a named stage in the job running on this thread (no-op outside a job). """
+    recorder = getattr(_current, "recorder", None)
+    if recorder is not None:
+        recorder.stage(name)
+
+
+def record_process(rusage):
+    """ Attribute a finished subprocess (os.wait4 rusage) to the current stage of this thread's job. """
+    recorder = getattr(_current, "recorder", None)
+    if recorder is not None:
+        recorder.record_process(rusage)
+
+
+def bind_job(func):
+    """
+    Wrap func so that, on whichever thread it runs (e.g. a pool worker), its subprocesses are charged to the
+    job running on this thread.
+    """
+    recorder = getattr(_current, "recorder", None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_current, "recorder", None)
+        _current.recorder = recorder
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.recorder = outer
+
+    return wrapper
+
+
+def instrument_job(func):
+    """
+    Decorator recording a compression function (taking input_path, output_path and target_size_mb and
+    returning a CompressionResult) as one job. Stages inside it are marked with mark_stage().
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = signature.bind(*args, **kwargs).arguments
+        recorder = JobRecorder(arguments["input_path"], arguments["output_path"], arguments["target_size_mb"])
+        outer = getattr(_current, "recorder", None)
+        _current.recorder = recorder
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            recorder.finish(error=e)  # Crashed jobs count as failures too
+            raise
+        finally:
+            _current.recorder = outer
+        recorder.finish(result)
+        return result
+
+    return wrapper
+
+
+class JsonLinesHook(MetricsHook):
+    """ Appends one JSON object per finished job (spans included) to a file or stream. """
+
+    def __init__(self, path=None, stream=None):
+        self.path = path
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def on_job(self, job):
+        line = json.dumps(asdict(job), sort_keys=True) + "\n"
+        with self._lock:
+            if self.stream is not None:
+                self.stream.write(line)
+                self.stream.flush()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+
+def percentile(values, q):
+    """ Linear-interpolated percentile of a list of numbers (q in 0-1). """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class _StageStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.recent = deque(maxlen=WINDOW)
+
+
+class MetricsAggregator(MetricsHook):
+    """
+    In-memory aggregate of all jobs: counters, per-stage percentiles over the recent WINDOW samples,
+    and size accuracy. Feeds the batch summary and the Prometheus exporter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageStats] = {}
+        self.jobs = {"success": 0, "failed": 0, "cache_hit": 0}
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.job_seconds_total = 0.0
+        self._job_seconds = deque(maxlen=WINDOW)
+        self._size_ratios = deque(maxlen=WINDOW)
+
+    def on_span(self, span):
+        with self._lock:
+            stats = self._stages.setdefault(span.name, _StageStats())
+            stats.count += 1
+            stats.seconds += span.seconds
+            stats.cpu_seconds += span.cpu_seconds
+            stats.peak_rss_bytes = max(stats.peak_rss_bytes, span.peak_rss_bytes)
+            stats.recent.append(span.seconds)
+
+    def on_job(self, job):
+        with self._lock:
+            self.jobs["cache_hit" if job.cache_hit else "success" if job.success else "failed"] += 1
+            self.input_bytes += job.input_bytes or 0
+            self.output_bytes += job.output_bytes or 0
+            self.job_seconds_total += job.seconds
+            self._job_seconds.append(job.seconds)
+            if job.size_ratio is not None and job.success and not job.cache_hit:
+                self._size_ratios.append(job.size_ratio)
+
+    def summary(self):
+        """ :return: JSON-serializable dict of counters and p50/p90/p99 per stage. """
+        with self._lock:
+            stages = {
+                name: dict(
+                    count=stats.count, seconds=round(stats.seconds, 3), cpu_seconds=round(stats.cpu_seconds, 3),
+                    peak_rss_bytes=stats.peak_rss_bytes,
+                    **{f"p{int(q * 100)}": round(percentile(list(stats.recent), q), 3) for q in QUANTILES},
+                )
+                for name, stats in self._stages.items()
+            }
+            job_seconds, ratios = list(self._job_seconds), list(self._size_ratios)
+            summary = {"jobs": dict(self.jobs), "input_bytes": self.input_bytes, "output_bytes": self.output_bytes}
+        for name, values in (("job_seconds", job_seconds), ("size_ratio", ratios)):
+            summary[name] = {f"p{int(q * 100)}": values and round(percentile(values, q), 3) for q in QUANTILES}
+        summary["stages"] = stages
+        return summary
+
+    def prometheus_text(self):
+        """ All metrics in the Prometheus text exposition format. """
+        with self._lock:
+            stages = sorted(
+                (name, stats.count, stats.seconds, stats.cpu_seconds, stats.peak_rss_bytes, list(stats.recent))
+                for name, stats in self._stages.items()
+            )
+            jobs = dict(self.jobs)
+            input_bytes, output_bytes, job_seconds_total = self.input_bytes, self.output_bytes, self.job_seconds_total
+            job_seconds, ratios = list(self._job_seconds), list(self._size_ratios)
+
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, value, **labels):
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+            value = value if isinstance(value, int) else round(value, 6)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        def quantiles(name, values, total, count, **labels):
+            for q in QUANTILES:
+                if values:
+                    sample(name, percentile(values, q), quantile=f"{q:g}", **labels)
+            sample(f"{name}_sum", total, **labels)
+            sample(f"{name}_count", count, **labels)
+
+        header("compressor_jobs_total", "counter", "Finished compression jobs by outcome.")
+        for status, count in sorted(jobs.items()):
+            sample("compressor_jobs_total", count, status=status)
+        header("compressor_input_bytes_total", "counter", "Bytes of input video processed.")
+        sample("compressor_input_bytes_total", input_bytes)
+        header("compressor_output_bytes_total", "counter", "Bytes of compressed output written.")
+        sample("compressor_output_bytes_total", output_bytes)
+        header("compressor_job_seconds", "summary", "Wall time per job; quantiles over recent jobs.")
+        quantiles("compressor_job_seconds", job_seconds, job_seconds_total, sum(jobs.values()))
+        header("compressor_size_ratio", "summary", "Achieved output size over target size; quantiles over recent encodes.")
+        quantiles("compressor_size_ratio", ratios, sum(ratios), len(ratios))
+        header("compressor_stage_seconds", "summary", "Wall time per stage; quantiles over recent spans.")
+        for name, count, seconds, _, _, recent in stages:
+            quantiles("compressor_stage_seconds", recent, seconds, count, stage=name)
+        header("compressor_stage_cpu_seconds_total", "counter", "CPU time of ffmpeg processes per stage.")
+        for name, _, _, cpu_seconds, _, _ in stages:
+            sample("compressor_stage_cpu_seconds_total", cpu_seconds, stage=name)
+        header("compressor_stage_peak_rss_bytes", "gauge", "Largest ffmpeg resident set seen per stage.")
+        for name, _, _, _, peak_rss_bytes, _ in stages:
+            sample("compressor_stage_peak_rss_bytes", peak_rss_bytes, stage=name)
+        return "\n".join(lines) + "\n"
+
+
+def write_prometheus(aggregator, path):
+    """ Write the metrics to a file for node_exporter's textfile collector (atomic rename). """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(aggregator.prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(aggregator, port, host=""):
+    """
+    Serve the metrics over HTTP at /metrics from a daemon thread, for long-running workers.
+    :return: The HTTP server; call shutdown() to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = aggregator.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
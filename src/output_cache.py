@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+
+from src.cache import CACHE_DIR, DiskCache, content_fingerprint, link_or_copy
+
+OUTPUT_CACHE_DIR = os.path.join(CACHE_DIR, "outputs")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GiB of cached outputs
+_STATS_KEY = "stats"
+
+
+def output_cache_key(input_path, target_size_mb, container, plan):
+    """
+    Cache key for a finished output: content fingerprint of the input (size plus first/last MB,
+    so a moved or copied clip still hits), target size, container and every setting that shapes the encode.
+    :param plan: Dict of requested encode settings (codec, use_gpu, two_pass, preset, resolution, ...).
+    """
+    identity = json.dumps([content_fingerprint(input_path), target_size_mb, container, plan], sort_keys=True)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def _format_mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class OutputCache:
+    """
+    Content-addressed store of finished compression outputs.
+    Re-submitting a clip with the same target and settings returns the earlier output as a hardlink
+    (or copy) instead of encoding it again. Outputs beyond max_bytes are evicted least recently used first.
+    """
+
+    def __init__(self, directory=OUTPUT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = DiskCache(os.path.join(directory, "index.json"))  # key -> entry, in LRU order
+        self._stats = DiskCache(os.path.join(directory, "stats.json"), max_entries=1)
+        self._lock = threading.Lock()
+
+    def _file(self, key, entry):
+        return os.path.join(self.directory, key + entry["ext"])
+
+    def _count(self, hits=0, misses=0, bytes_saved=0, seconds_saved=0.0):
+        with self._lock:
+            stats = self._stats.get(_STATS_KEY) or {"hits": 0, "misses": 0, "bytes_saved": 0, "seconds_saved": 0.0}
+            stats["hits"] += hits
+            stats["misses"] += misses
+            stats["bytes_saved"] += bytes_saved
+            stats["seconds_saved"] += seconds_saved
+            self._stats.put(_STATS_KEY, stats)
+
+    def lookup(self, key, output_path):
+        """
+        Materialize a cached output at output_path.
+        :return: The stored result fields (encoder, bitrates, ...), or None on a miss.
+        """
+        entry = self._index.get(key)
+        if entry is not None:
+            cached_path = self._file(key, entry)
+            try:
+                if os.path.getsize(cached_path) != entry["size"]:
+                    raise OSError("cached output was modified")
+                link_or_copy(cached_path, output_path)
+            except OSError:
+                self._discard(key, entry)  # Deleted or edited behind our back
+                entry = None
+        if entry is None:
+            self._count(misses=1)
+            return None
+        self._count(hits=1, bytes_saved=entry["size"], seconds_saved=entry["result"].get("elapsed", 0.0))
+        return entry["result"]
+
+    def store(self, key, output_path, result_fields):
+        """
+        Keep a finished output under a key. Hardlinked where possible, so it costs no extra space
+        until the original is deleted.
+        :param result_fields: JSON-serializable result details returned by later lookups.
+        """
+        entry = {"ext": os.path.splitext(output_path)[1], "result": result_fields}
+        try:
+            entry["size"] = os.path.getsize(output_path)
+            if entry["size"] > self.max_bytes:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            link_or_copy(output_path, self._file(key, entry))
+        except OSError as e:
+            print(f"Error caching output {output_path}: {e}")
+            return
+        self._index.put(key, entry)
+        self.evict()
+
+    def _discard(self, key, entry):
+        self._index.delete(key)
+        try:
+            os.remove(self._file(key, entry))
+        except OSError:
+            pass
+
+    def total_bytes(self):
+        return sum(entry["size"] for _, entry in self._index.items())
+
+    def evict(self):
+        """ Drop least recently used outputs until the cache fits in max_bytes. """
+        entries = self._index.items()  # Oldest first
+        total = sum(entry["size"] for _, entry in entries)
+        for key, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self._discard(key, entry)
+            total -= entry["size"]
+
+    def clear(self):
+        for key, entry in self._index.items():
+            self._discard(key, entry)
+
+    def stats(self):
+        """ :return: Dict with entry count, cached bytes, hits, misses, hit rate, bytes and seconds saved. """
+        stats = dict(self._stats.get(_STATS_KEY) or {"hits": 0, "misses": 0, "bytes_saved": 0, "seconds_saved": 0.0})
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(
+            entries=len(self._index),
+            cached_bytes=self.total_bytes(),
+            max_bytes=self.max_bytes,
+            hit_rate=stats["hits"] / lookups if lookups else 0.0,
+        )
+        return stats
+
+
+default_output_cache = OutputCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the compressed-output cache.")
+    parser.add_argument("command", choices=("stats", "clear"))
+    parser.add_argument("--json", action="store_true", help="Print stats as JSON")
+    args = parser.parse_args(argv)
+
+    cache = default_output_cache
+    if args.command == "clear":
+        cache.clear()
+        print("Output cache cleared.")
+        return 0
+    stats = cache.stats()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return 0
+    print(f"Entries:       {stats['entries']}")
+    print(f"Cached:        {_format_mb(stats['cached_bytes'])} of {_format_mb(stats['max_bytes'])}")
+    print(f"Hits/misses:   {stats['hits']}/{stats['misses']} ({stats['hit_rate']:.1%} hit rate)")
+    print(f"Bytes saved:   {_format_mb(stats['bytes_saved'])}")
+    print(f"Encode saved:  {stats['seconds_saved']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
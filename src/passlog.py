@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+from src.cache import CACHE_DIR, file_fingerprint, link_or_copy
+
+PASSLOG_DIR = os.path.join(CACHE_DIR, "passlogs")
+# Encoders whose pass-1 statistics stay valid for a second pass at a different bitrate
+REUSABLE_PASSLOG_ENCODERS = ("libx264", "libx265")
+# Bitrate options don't change what pass 1 measures, so they are left out of the cache key
+_BITRATE_OPTIONS = ("-b:v", "-maxrate", "-bufsize")
+MARKER_SUFFIX = ".complete"
+
+
+def passlog_key(input_path, encoder, video_args, filters=None, ranges=None):
+    """
+    Cache key for pass-1 statistics: input fingerprint, encoder, encoder options (preset etc.), filter chain
+    and the encoded time ranges, if any.
+    """
+    options = []
+    skip = False
+    for arg in video_args:
+        if skip:
+            skip = False
+            continue
+        if arg in _BITRATE_OPTIONS:
+            skip = True
+            continue
+        options.append(arg)
+    identity = [file_fingerprint(input_path), encoder, options, filters or ""]
+    if ranges:
+        identity.append([list(time_range) for time_range in ranges])
+    identity = json.dumps(identity)
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+class PassLogCache:
+    """
+    Managed directory of two-pass statistics.
+    Every job writes its stats under its own prefix, so concurrent encodes never share files.
+    Completed pass-1 stats are published under a key, letting a later encode of the same clip
+    (e.g. re-targeted to a different size) skip pass 1. Old entries are evicted automatically.
+    """
+
+    def __init__(self, directory=PASSLOG_DIR, max_entries=200, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    @staticmethod
+    def is_reusable(encoder):
+        return encoder in REUSABLE_PASSLOG_ENCODERS
+
+    def new_job_prefix(self, key):
+        """ Fresh -passlogfile prefix for one job. """
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{key}.job-{uuid.uuid4().hex[:12]}")
+
+    def _job_files(self, job_prefix):
+        directory, base = os.path.split(job_prefix)
+        if not os.path.isdir(directory):
+            return []
+        return [name[len(base):] for name in os.listdir(directory) if name.startswith(base)]
+
+    def checkout(self, key, job_prefix):
+        """
+        Link published stats for a key into a job's prefix.
+        :return: True if pass 1 can be skipped.
+        """
+        final_prefix = os.path.join(self.directory, key)
+        marker = final_prefix + MARKER_SUFFIX
+        try:
+            with open(marker, "r", encoding="utf-8") as f:
+                suffixes = json.load(f)
+            for suffix in suffixes:
+                link_or_copy(final_prefix + suffix, job_prefix + suffix)
+            os.utime(marker)  # Mark as recently used for eviction
+            return bool(suffixes)
+        except (OSError, ValueError):
+            self.release(job_prefix)
+            return False
+
+    def publish(self, key, job_prefix):
+        """
+        Publish a job's completed pass-1 stats under the key. The job keeps its own copy.
+        """
+        suffixes = self._job_files(job_prefix)
+        if not suffixes:
+            return
+        final_prefix = os.path.join(self.directory, key)
+        try:
+            for suffix in suffixes:
+                link_or_copy(job_prefix + suffix, final_prefix + suffix)
+            tmp_marker = f"{final_prefix}{MARKER_SUFFIX}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_marker, "w", encoding="utf-8") as f:
+                json.dump(suffixes, f)
+            os.replace(tmp_marker, final_prefix + MARKER_SUFFIX)
+        except OSError as e:
+            print(f"Error caching two-pass statistics: {e}")
+        self.evict()
+
+    def release(self, job_prefix):
+        """ Delete a job's own stats files. """
+        for suffix in self._job_files(job_prefix):
+            try:
+                os.remove(job_prefix + suffix)
+            except OSError:
+                pass
+
+    def evict(self):
+        """
+        Drop published stats beyond max_entries (least recently used first) or older than max_age,
+        and job files abandoned by crashed encodes.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        now = time.time()
+        markers = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if name.endswith(MARKER_SUFFIX):
+                markers.append((mtime, name[:-len(MARKER_SUFFIX)]))
+            elif ".job-" in name and now - mtime > self.max_age:
+                self._remove(path)
+
+        markers.sort(reverse=True)
+        stale = [key for i, (mtime, key) in enumerate(markers) if i >= self.max_entries or now - mtime > self.max_age]
+        for key in stale:
+            self._remove(os.path.join(self.directory, key + MARKER_SUFFIX))  # Unpublish first
+            for name in names:
+                if name.startswith(key) and ".job-" not in name:
+                    self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+default_passlog_cache = PassLogCache()
@@ -0,0 +1,21 @@
+import os
+import shutil
+
+FFMPEG_DIR = "ffmpeg_bin"  # Directory the bundled FFMPEG binaries are installed to
+
+
+def find_binary(name):
+    """
+    Locate an FFMPEG tool, preferring the bundled copy in FFMPEG_DIR over one on PATH.
+    :param name: Tool name without extension, e.g. "ffmpeg" or "ffprobe".
+    :return: Path to the executable (the bare name if it cannot be found).
+    """
+    exe_name = f"{name}.exe" if os.name == "nt" else name
+    bundled = os.path.join(FFMPEG_DIR, exe_name)
+    if os.path.exists(bundled):
+        return bundled
+    return shutil.which(name) or bundled
+
+
+FFMPEG_PATH = find_binary("ffmpeg")
+FFPROBE_PATH = find_binary("ffprobe")
@@ -0,0 +1,192 @@
+import os
+import math
+import shutil
+import argparse
+import tempfile
+from dataclasses import dataclass
+
+from src.runner import run_ffmpeg
+
+# Encoders with a constant-quality mode: (option, sample quality values, valid range)
+QUALITY_SETTINGS = {
+    "libx264": ("-crf", (20, 27, 34), (0, 51)),
+    "libx265": ("-crf", (22, 29, 36), (0, 51)),
+    "h264_nvenc": ("-cq", (22, 29, 36), (0, 51)),
+    "hevc_nvenc": ("-cq", (24, 31, 38), (0, 51)),
+}
+SAMPLE_COUNT = 5
+SAMPLE_SECONDS = 2.0
+MIN_PREDICTIVE_DURATION = 30  # Below this, the samples cost about as much as a first pass
+MAXRATE_FACTOR = 1.5  # VBV cap relative to the target bitrate
+BUFSIZE_FACTOR = 2.0
+
+
+def supports_predictive(encoder):
+    return encoder in QUALITY_SETTINGS
+
+
+def quality_video_args(encoder, quality, video_bitrate_kbps, preset=None):
+    """
+    Constant-quality video encoder arguments, capped by a VBV buffer around the target bitrate.
+    :param quality: CRF/CQ value.
+    :param video_bitrate_kbps: Target bitrate for the VBV cap; None for an uncapped encode.
+    :param preset: Encoder preset (use the same one as the bitrate mode for comparable output).
+    """
+    option = QUALITY_SETTINGS[encoder][0]
+    args = ["-c:v", encoder]
+    if encoder.endswith("_nvenc"):
+        args += ["-rc", "vbr", "-b:v", "0"]  # NVENC needs -b:v 0 for pure CQ
+    args += [option, f"{quality:g}"]
+    if video_bitrate_kbps:
+        args += [
+            "-maxrate", f"{int(video_bitrate_kbps * MAXRATE_FACTOR)}k",
+            "-bufsize", f"{int(video_bitrate_kbps * BUFSIZE_FACTOR)}k",
+        ]
+    if preset:
+        args += ["-preset", preset]
+    return args
+
+
+def sample_times(duration, count=SAMPLE_COUNT, length=SAMPLE_SECONDS):
+    """
+    Start times of `count` samples spread evenly over the timeline (centred in equal slices).
+    """
+    count = max(1, min(count, int(duration // length)))
+    slice_length = duration / count
+    return [max(0.0, slice_length * (i + 0.5) - length / 2) for i in range(count)]
+
+
+def build_sample_command(ffmpeg_path, input_path, encoder, qualities, times, sample_paths, preset=None,
+                         length=SAMPLE_SECONDS, video_filters=None):
+    """
+    One ffmpeg command that joins the samples and encodes them at every quality value.
+    Each sample is seeked on input (-ss before -i), so nothing outside the samples is decoded.
+    :param video_filters: Filter chain the final encode will use, so samples are measured at the output size.
+    """
+    cmd = [ffmpeg_path, "-hide_banner", "-nostats"]
+    for start in times:
+        cmd += ["-ss", f"{start:.3f}", "-t", f"{length:g}", "-i", input_path]
+    inputs = "".join(f"[{i}:v:0]" for i in range(len(times)))
+    labels = "".join(f"[q{i}]" for i in range(len(qualities)))
+    chain = f"concat=n={len(times)}:v=1:a=0" + (f",{video_filters}" if video_filters else "")
+    cmd += ["-filter_complex", f"{inputs}{chain},split={len(qualities)}{labels}"]
+    for i, (quality, sample_path) in enumerate(zip(qualities, sample_paths)):
+        # No VBV cap on samples: the curve should describe what the content costs at each quality
+        args = quality_video_args(encoder, quality, None, preset)
+        cmd += ["-map", f"[q{i}]"] + args + ["-an", "-y", sample_path]
+    return cmd
+
+
+@dataclass
+class QualityCurve:
+    """
+    Fitted ln(video kbps) = intercept + slope * quality for one clip and encoder.
+    """
+    encoder: str
+    intercept: float
+    slope: float
+
+    def bitrate_at(self, quality):
+        return math.exp(self.intercept + self.slope * quality)
+
+    def quality_for(self, video_bitrate_kbps):
+        """ Quality value expected to produce the bitrate, clamped to the encoder's range and rounded to 0.5. """
+        low, high = QUALITY_SETTINGS[self.encoder][2]
+        quality = (math.log(max(1, video_bitrate_kbps)) - self.intercept) / self.slope
+        return min(max(round(quality * 2) / 2, low), high)
+
+
+def fit_quality_curve(encoder, points):
+    """
+    Least-squares fit of ln(kbps) against quality.
+    :param points: [(quality, kbps), ...]
+    :return: QualityCurve, or None if the samples don't show bitrate falling as quality rises.
+    """
+    points = [(q, math.log(kbps)) for q, kbps in points if kbps > 0]
+    if len(points) < 2:
+        return None
+    mean_q = sum(q for q, _ in points) / len(points)
+    mean_r = sum(r for _, r in points) / len(points)
+    spread = sum((q - mean_q) ** 2 for q, _ in points)
+    if not spread:
+        return None
+    slope = sum((q - mean_q) * (r - mean_r) for q, r in points) / spread
+    if slope >= 0:
+        return None  # e.g. a static clip that comes out the same size at every quality
+    return QualityCurve(encoder=encoder, intercept=mean_r - slope * mean_q, slope=slope)
+
+
+def measure_quality_curve(ffmpeg_path, input_path, encoder, duration, preset=None, video_filters=None, cancel_token=None,
+                          log=None):
+    """
+    Encode short samples of the input at several quality values and fit the size/quality curve.
+    :return: QualityCurve, or None if the fit is unusable.
+    :raises subprocess.CalledProcessError: If the sample encode fails.
+    :raises EncodeCancelled: If the token was cancelled.
+    """
+    qualities = QUALITY_SETTINGS[encoder][1]
+    times = sample_times(duration)
+    workdir = tempfile.mkdtemp(prefix=".samples-")
+    try:
+        sample_paths = [os.path.join(workdir, f"sample_{quality}.mkv") for quality in qualities]
+        cmd = build_sample_command(
+            ffmpeg_path, input_path, encoder, qualities, times, sample_paths, preset, video_filters=video_filters
+        )
+        if log:
+            log(f"Encoding {len(times)} samples at {encoder} quality {', '.join(map(str, qualities))}")
+        sample_seconds = len(times) * SAMPLE_SECONDS
+        run_ffmpeg(cmd, duration=sample_seconds, cancel_token=cancel_token)
+        points = []
+        for quality, sample_path in zip(qualities, sample_paths):
+            if os.path.exists(sample_path):
+                points.append((quality, os.path.getsize(sample_path) * 8 / 1000 / sample_seconds))
+        return fit_quality_curve(encoder, points)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def benchmark_against_two_pass(input_path, target_size_mb, codec="h264", use_gpu=False, log=None):
+    """
+    Compress the same input with two-pass and predictive mode and compare wall time and size error.
+    Both runs use a fresh pass-log cache, no output cache and a single attempt, so neither benefits from earlier
+    runs, and their encode times go to a throwaway throughput store instead of the one the estimator reads.
+    :return: Dict of {mode: {"elapsed", "size_mb", "error_pct", "success"}}.
+    """
+    from src.compressor import compress_video
+    from src.passlog import PassLogCache
+    from src.rate_control import RateController, MB
+    from src.throughput import ThroughputStore
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix=".predictor-bench-")
+    try:
+        for mode in ("two_pass", "predictive"):
+            output_path = os.path.join(workdir, f"{mode}{os.path.splitext(input_path)[1] or '.mp4'}")
+            result = compress_video(
+                input_path, output_path, target_size_mb, use_gpu=use_gpu, use_two_pass=mode == "two_pass",
+                codec=codec, log=log, use_predictive=mode == "predictive", allow_fast_paths=False,
+                rate_controller=RateController(max_attempts=1, stats_path=os.path.join(workdir, f"{mode}.json")),
+                passlog_cache=PassLogCache(directory=os.path.join(workdir, "passlogs")), use_output_cache=False,
+                throughput_store=ThroughputStore(os.path.join(workdir, "throughput.json")),
+            )
+            size_mb = (result.output_size or 0) / MB
+            results[mode] = {
+                "elapsed": round(result.elapsed, 2),
+                "size_mb": round(size_mb, 3),
+                "error_pct": round((size_mb - target_size_mb) / target_size_mb * 100, 2),
+                "success": result.success,
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark predictive CRF mode against two-pass encoding.")
+    parser.add_argument("input")
+    parser.add_argument("target_size_mb", type=float)
+    parser.add_argument("--codec", default="h264", choices=("h264", "h265"))
+    parser.add_argument("--gpu", action="store_true")
+    args = parser.parse_args()
+    for mode, stats in benchmark_against_two_pass(args.input, args.target_size_mb, args.codec, args.gpu).items():
+        print(f"{mode:>10}: {stats['elapsed']:7.2f}s  {stats['size_mb']:8.3f} MB  ({stats['error_pct']:+.2f}% vs target)")
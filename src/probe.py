@@ -0,0 +1,266 @@
+import os
+import json
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+from src.cache import CACHE_DIR, DiskCache, file_fingerprint
+from src.paths import FFPROBE_PATH
+
+PROBE_CACHE_VERSION = 1  # Bump when the MediaInfo layout changes to invalidate old entries
+_probe_cache = DiskCache(os.path.join(CACHE_DIR, "probe_cache.json"), max_entries=20000)
+
+
+class ProbeError(Exception):
+    """ Raised when ffprobe cannot read a file. """
+
+
+@dataclass
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: Optional[str] = None
+    profile: Optional[str] = None
+    bit_rate_kbps: Optional[int] = None
+    duration: Optional[float] = None
+    # Video
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    pix_fmt: Optional[str] = None
+    nb_frames: Optional[int] = None
+    has_b_frames: Optional[int] = None
+    # Audio
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+
+@dataclass
+class MediaInfo:
+    path: str
+    size: int
+    duration: float
+    format_name: Optional[str] = None
+    bit_rate_kbps: Optional[int] = None
+    start_time: float = 0.0
+    streams: List[StreamInfo] = field(default_factory=list)
+    keyframes: Optional[List[float]] = None  # Keyframe timestamps, filled in on demand
+    complexity: Optional[List[List[float]]] = None  # [start, end, score] per segment, filled in on demand
+
+    @property
+    def video(self):
+        """ First video stream, ignoring attached pictures such as cover art. """
+        return next((s for s in self.streams if s.codec_type == "video" and s.width), None)
+
+    @property
+    def audio(self):
+        return next((s for s in self.streams if s.codec_type == "audio"), None)
+
+    @property
+    def width(self):
+        return self.video.width if self.video else None
+
+    @property
+    def height(self):
+        return self.video.height if self.video else None
+
+    @property
+    def fps(self):
+        return self.video.fps if self.video else None
+
+    @property
+    def video_codec(self):
+        return self.video.codec_name if self.video else None
+
+    @property
+    def audio_codec(self):
+        return self.audio.codec_name if self.audio else None
+
+    @property
+    def audio_bitrate_kbps(self):
+        return self.audio.bit_rate_kbps if self.audio else None
+
+    @property
+    def video_bitrate_kbps(self):
+        """ Video bitrate, derived from the container bitrate when the stream does not report one. """
+        if not self.video:
+            return None
+        if self.video.bit_rate_kbps:
+            return self.video.bit_rate_kbps
+        if self.bit_rate_kbps:
+            other = sum(s.bit_rate_kbps or 0 for s in self.streams if s is not self.video)
+            return max(0, self.bit_rate_kbps - other)
+        return None
+
+    @property
+    def resolution(self):
+        return f"{self.width}x{self.height}" if self.video else None
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["streams"] = [StreamInfo(**s) for s in data.get("streams", [])]
+        return cls(**data)
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate(rate):
+    """ Parse an ffprobe frame rate such as "60000/1001". """
+    try:
+        num, den = rate.split("/")
+        return round(int(num) / int(den), 3) if int(den) else None
+    except (AttributeError, ValueError):
+        return _to_float(rate)
+
+
+def _parse_stream(stream):
+    bit_rate = _to_int(stream.get("bit_rate"))
+    if bit_rate is None:
+        # Matroska stores per-stream bitrates as tags
+        tags = stream.get("tags") or {}
+        bit_rate = _to_int(tags.get("BPS") or tags.get("BPS-eng"))
+    fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+    return StreamInfo(
+        index=stream.get("index", 0),
+        codec_type=stream.get("codec_type", "unknown"),
+        codec_name=stream.get("codec_name"),
+        profile=stream.get("profile"),
+        bit_rate_kbps=round(bit_rate / 1000) if bit_rate is not None else None,
+        duration=_to_float(stream.get("duration")),
+        width=stream.get("width"),
+        height=stream.get("height"),
+        fps=fps if stream.get("codec_type") == "video" else None,
+        pix_fmt=stream.get("pix_fmt"),
+        nb_frames=_to_int(stream.get("nb_frames")),
+        has_b_frames=stream.get("has_b_frames"),
+        sample_rate=_to_int(stream.get("sample_rate")),
+        channels=stream.get("channels"),
+    )
+
+
+def parse_ffprobe_output(input_path, probe_output):
+    """
+    Build a MediaInfo from `ffprobe -show_format -show_streams -of json` output.
+    """
+    data = json.loads(probe_output)
+    fmt = data.get("format") or {}
+    streams = [_parse_stream(s) for s in data.get("streams", [])]
+    duration = _to_float(fmt.get("duration"))
+    if duration is None:
+        duration = max((s.duration or 0 for s in streams), default=0)
+    bit_rate = _to_int(fmt.get("bit_rate"))
+    return MediaInfo(
+        path=os.path.abspath(input_path),
+        size=_to_int(fmt.get("size")) or os.path.getsize(input_path),
+        duration=duration,
+        format_name=fmt.get("format_name"),
+        bit_rate_kbps=round(bit_rate / 1000) if bit_rate is not None else None,
+        start_time=_to_float(fmt.get("start_time")) or 0.0,
+        streams=streams,
+    )
+
+
+def _cache_key(input_path):
+    return f"v{PROBE_CACHE_VERSION}|{file_fingerprint(input_path)}"
+
+
+def probe_media(input_path, ffprobe_path=None, use_cache=True):
+    """
+    Probe a media file with a single ffprobe call and return its metadata.
+    Results are cached on disk keyed by path, size and mtime, so unchanged files are never probed twice.
+    :param input_path: Path to the media file.
+    :param ffprobe_path: ffprobe executable (defaults to the bundled/PATH one).
+    :param use_cache: Read and write the on-disk probe cache.
+    :return: MediaInfo for the file.
+    :raises ProbeError: If the file is missing or ffprobe cannot read it.
+    """
+    try:
+        key = _cache_key(input_path)
+    except OSError as e:
+        raise ProbeError(f"Cannot read '{input_path}': {e}") from e
+
+    if use_cache:
+        cached = _probe_cache.get(key)
+        if cached is not None:
+            return MediaInfo.from_dict(cached)
+
+    cmd = [
+        ffprobe_path or FFPROBE_PATH,
+        "-v", "error",
+        "-show_format",
+        "-show_streams",
+        "-of", "json",
+        input_path
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
+        info = parse_ffprobe_output(input_path, result.stdout)
+    except subprocess.CalledProcessError as e:
+        raise ProbeError(f"ffprobe failed on '{input_path}': {e.stderr.strip() or e}") from e
+    except (OSError, ValueError, TypeError) as e:
+        raise ProbeError(f"Unable to probe '{input_path}': {e}") from e
+
+    if use_cache:
+        _probe_cache.put(key, info.to_dict())
+    return info
+
+
+def store_media_info(info):
+    """
+    Write an updated MediaInfo (e.g. with keyframes filled in) back to the probe cache.
+    """
+    try:
+        _probe_cache.put(_cache_key(info.path), info.to_dict())
+    except OSError:
+        pass  # File vanished; nothing worth caching
+
+
+def probe_keyframes(info, ffprobe_path=None):
+    """
+    Keyframe timestamps of the first video stream, read from packet flags (demux only, no decoding).
+    The list is stored on the MediaInfo and written back to the probe cache.
+    :param info: MediaInfo from probe_media().
+    :return: Sorted list of keyframe times in seconds, relative to the start of the file.
+    :raises ProbeError: If ffprobe fails.
+    """
+    if info.keyframes is not None:
+        return info.keyframes
+
+    cmd = [
+        ffprobe_path or FFPROBE_PATH,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        info.path
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        raise ProbeError(f"Unable to read keyframes of '{info.path}': {e}") from e
+
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        time_value = _to_float(pts_time)
+        if "K" in flags and time_value is not None:
+            keyframes.add(round(time_value - info.start_time, 6))
+    info.keyframes = sorted(keyframes)
+    store_media_info(info)
+    return info.keyframes
@@ -0,0 +1,91 @@
+MIN_RANGE_SECONDS = 0.1  # Shorter ranges are dropped; ffmpeg can't cut much below a frame
+
+
+def parse_timestamp(text):
+    """
+    Parse "90", "1:30", "1:30.5" or "0:01:30" into seconds.
+    :raises ValueError: If the text isn't a timestamp.
+    """
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(part.strip() for part in parts):
+        raise ValueError(f"Invalid timestamp: {text!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"Invalid timestamp: {text!r}")
+    return seconds
+
+
+def format_timestamp(seconds):
+    """ Format seconds as "m:ss" (with tenths unless whole), a form parse_timestamp() reads back. """
+    minutes, seconds = divmod(seconds, 60)
+    if seconds == int(seconds):
+        return f"{int(minutes)}:{int(seconds):02d}"
+    return f"{int(minutes)}:{seconds:04.1f}"
+
+
+def parse_ranges(text):
+    """
+    Parse "start-end" ranges separated by commas, e.g. "0:10-0:30, 1:00-1:20". An empty end ("5:00-")
+    runs to the end of the video.
+    :return: List of (start, end or None) in seconds.
+    :raises ValueError: If a range can't be parsed.
+    """
+    ranges = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        start, sep, end = item.partition("-")
+        if not sep:
+            raise ValueError(f"Invalid range (expected start-end): {item.strip()!r}")
+        ranges.append((parse_timestamp(start) if start.strip() else 0.0, parse_timestamp(end) if end.strip() else None))
+    return ranges
+
+
+def normalize_ranges(ranges, duration):
+    """
+    Clamp ranges to the video and drop empty ones. Ranges keep their order; they are joined as given.
+    :param ranges: Iterable of (start, end) in seconds; end may be None for the end of the video.
+    :param duration: Video duration in seconds.
+    :return: List of (start, end) floats.
+    :raises ValueError: If no range selects any video.
+    """
+    normalized = []
+    for start, end in ranges:
+        start = max(0.0, float(start or 0.0))
+        end = duration if end is None else min(duration, float(end))
+        if end - start >= MIN_RANGE_SECONDS:
+            normalized.append((start, end))
+    if not normalized:
+        raise ValueError("the selected range is empty or outside the video")
+    return normalized
+
+
+def selected_duration(ranges):
+    return sum(end - start for start, end in ranges)
+
+
+def range_input_args(input_path, ranges):
+    """
+    Input options opening the file once per range, each with input-side seeking: ffmpeg jumps to the
+    keyframe before the start and discards the few frames up to it, so nothing earlier is decoded.
+    """
+    args = []
+    for start, end in ranges:
+        args += ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", input_path]
+    return args
+
+
+def concat_filter(count, with_audio, video_filters=None):
+    """
+    Filter graph joining `count` range inputs into one stream, followed by the output filters.
+    :return: (filter graph, -map arguments for its outputs).
+    """
+    streams = "".join(f"[{i}:v:0]" + (f"[{i}:a:0]" if with_audio else "") for i in range(count))
+    graph = f"{streams}concat=n={count}:v=1:a={int(with_audio)}[v]" + ("[a]" if with_audio else "")
+    video_label = "[v]"
+    if video_filters:
+        graph += f";[v]{video_filters}[vout]"
+        video_label = "[vout]"
+    return graph, ["-map", video_label] + (["-map", "[a]"] if with_audio else [])
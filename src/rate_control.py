@@ -0,0 +1,182 @@
+import os
+import math
+import threading
+
+from src.cache import CACHE_DIR, DiskCache
+from src.probe import probe_media, ProbeError
+
+MB = 1024 * 1024
+
+# Mux overhead priors: fixed bytes (headers, moov/cues) plus bytes per second (sample tables, cluster headers)
+CONTAINER_OVERHEAD = {
+    "mp4": (48 * 1024, 1200),
+    "matroska": (16 * 1024, 2500),
+    "default": (64 * 1024, 2500),
+}
+# Prior spread of (actual / requested) video bytes before anything has been measured
+PRIOR_RATIO_STDDEV = {"two_pass": 0.03, "single_pass": 0.10, "predictive": 0.12}
+PRIOR_WEIGHT = 3  # Prior counts as this many observations
+# Ratios outside this range mean the content, not the encoder, decided the size (e.g. a static clip
+# that can't use its bitrate); they are not learned from, and corrections are clamped to it
+RATIO_RANGE = (0.5, 2.0)
+
+
+def rate_mode(two_pass, predictive=False):
+    """ Rate-control mode name used to key learned statistics. """
+    if predictive:
+        return "predictive"
+    return "two_pass" if two_pass else "single_pass"
+
+
+def container_for(output_path):
+    """ Container family of an output file, from its extension. """
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext in (".mp4", ".m4v", ".mov"):
+        return "mp4"
+    if ext in (".mkv", ".webm"):
+        return "matroska"
+    return ext.lstrip(".") or "default"
+
+
+class _RunningStats:
+    """ Welford mean/variance, stored as a plain dict so it can live in a JSON cache. """
+
+    @staticmethod
+    def add(stats, value):
+        stats = dict(stats or {"n": 0, "mean": 0.0, "m2": 0.0})
+        stats["n"] += 1
+        delta = value - stats["mean"]
+        stats["mean"] += delta / stats["n"]
+        stats["m2"] += delta * (value - stats["mean"])
+        return stats
+
+    @staticmethod
+    def stddev(stats):
+        return math.sqrt(stats["m2"] / (stats["n"] - 1)) if stats and stats["n"] > 1 else None
+
+
+class RateController:
+    """
+    Target-size rate control with a learned error model.
+    Predicts mux overhead per container and the size error of each encoder, plans the video bitrate
+    from them, and after each encode corrects the bitrate if the output missed the target.
+    Every measurement is persisted so later predictions tighten.
+    """
+
+    def __init__(self, tolerance=0.05, max_attempts=2, stats_path=None):
+        """
+        :param tolerance: Accept outputs between target * (1 - tolerance) and target.
+        :param max_attempts: Total encodes allowed per job, including the first.
+        :param stats_path: JSON file holding the learned statistics.
+        """
+        self.tolerance = tolerance
+        self.max_attempts = max(1, max_attempts)
+        self._stats = DiskCache(stats_path or os.path.join(CACHE_DIR, "rate_stats.json"), max_entries=1000)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encoder_key(encoder, container, mode):
+        return f"ratio|{encoder}|{container}|{mode}"
+
+    @staticmethod
+    def _overhead_key(container):
+        return f"overhead|{container}"
+
+    def predict_overhead_bytes(self, container, duration):
+        """ Expected container overhead for a file of this duration. """
+        base, per_second_prior = CONTAINER_OVERHEAD.get(container, CONTAINER_OVERHEAD["default"])
+        learned = self._stats.get(self._overhead_key(container))
+        per_second = per_second_prior
+        if learned:
+            # Blend the learned rate with the prior, weighted by how much we've seen
+            per_second = (per_second_prior * PRIOR_WEIGHT + learned["mean"] * learned["n"]) / (PRIOR_WEIGHT + learned["n"])
+        return base + per_second * duration
+
+    def expected_ratio(self, encoder, container, mode):
+        """
+        Conservative estimate of actual / requested video bytes: mean plus one standard deviation.
+        """
+        prior_std = PRIOR_RATIO_STDDEV.get(mode, PRIOR_RATIO_STDDEV["single_pass"])
+        learned = self._stats.get(self._encoder_key(encoder, container, mode))
+        if not learned:
+            return 1.0 + prior_std
+        n = learned["n"]
+        mean = (1.0 * PRIOR_WEIGHT + learned["mean"] * n) / (PRIOR_WEIGHT + n)
+        std = _RunningStats.stddev(learned)
+        std = prior_std if std is None else (prior_std * PRIOR_WEIGHT + std * n) / (PRIOR_WEIGHT + n)
+        return max(0.5, mean + std)
+
+    def _video_budget_bytes(self, target_bytes, duration, audio_bitrate_kbps, container):
+        # Aim for the middle of the tolerance band rather than the edge
+        aim = target_bytes * (1 - self.tolerance / 2)
+        audio_bytes = audio_bitrate_kbps * 1000 / 8 * duration
+        return aim - audio_bytes - self.predict_overhead_bytes(container, duration)
+
+    def plan_video_bitrate(self, target_size_mb, duration, audio_bitrate_kbps, encoder, container, mode):
+        """
+        :param mode: Rate-control mode from rate_mode().
+        :return: Video bitrate in kbps expected to land the output inside the tolerance band.
+        """
+        budget = self._video_budget_bytes(target_size_mb * MB, duration, audio_bitrate_kbps, container)
+        kbps = budget * 8 / 1000 / duration / self.expected_ratio(encoder, container, mode)
+        return max(1, int(kbps))
+
+    def within_target(self, actual_bytes, target_size_mb):
+        target_bytes = target_size_mb * MB
+        return target_bytes * (1 - self.tolerance) <= actual_bytes <= target_bytes
+
+    def should_retry(self, actual_bytes, target_size_mb, observed_ratio):
+        """
+        Whether a corrective re-encode is worth it. Overshoots always are; undershoots only when the
+        encoder could have used more bits (a content-limited clip would come out the same size).
+        """
+        if self.within_target(actual_bytes, target_size_mb):
+            return False
+        return actual_bytes > target_size_mb * MB or observed_ratio >= RATIO_RANGE[0]
+
+    def observe(self, output_path, requested_kbps, duration, audio_bitrate_kbps, encoder, container, mode):
+        """
+        Measure a finished output and record the encoder's size error and the container overhead.
+        Audio is measured from the output's own streams where they report a bitrate (a copied source track
+        can be far below the planned budget); audio_bitrate_kbps is only the fallback.
+        :param audio_bitrate_kbps: Bitrate of the audio in the output (the source's if it was copied).
+        :return: Observed actual / requested video bytes ratio.
+        """
+        actual_bytes = os.path.getsize(output_path)
+        requested_video_bytes = requested_kbps * 1000 / 8 * duration
+        audio_bytes = audio_bitrate_kbps * 1000 / 8 * duration
+        overhead_bytes = self.predict_overhead_bytes(container, duration)
+
+        try:
+            info = probe_media(output_path, use_cache=False)
+            stream_bytes = sum((s.bit_rate_kbps or 0) * 1000 / 8 * (s.duration or duration) for s in info.streams)
+            audio_streams = [s for s in info.streams if s.codec_type == "audio"]
+            if audio_streams and all(s.bit_rate_kbps for s in audio_streams):
+                audio_bytes = sum(s.bit_rate_kbps * 1000 / 8 * (s.duration or duration) for s in audio_streams)
+            video = info.video
+            if video and video.bit_rate_kbps and stream_bytes:
+                # Streams report their own bitrates, so overhead and video size can be measured directly
+                overhead_bytes = max(0.0, actual_bytes - stream_bytes)
+                base, _ = CONTAINER_OVERHEAD.get(container, CONTAINER_OVERHEAD["default"])
+                with self._lock:
+                    key = self._overhead_key(container)
+                    per_second = max(0.0, overhead_bytes - base) / duration
+                    self._stats.put(key, _RunningStats.add(self._stats.get(key), per_second))
+        except ProbeError:
+            pass
+
+        video_bytes = max(1.0, actual_bytes - audio_bytes - overhead_bytes)
+        ratio = video_bytes / requested_video_bytes
+        if RATIO_RANGE[0] <= ratio <= RATIO_RANGE[1]:
+            with self._lock:
+                key = self._encoder_key(encoder, container, mode)
+                self._stats.put(key, _RunningStats.add(self._stats.get(key), ratio))
+        return ratio
+
+    def correct_bitrate(self, target_size_mb, duration, audio_bitrate_kbps, container, observed_ratio):
+        """
+        Bitrate for a re-encode, scaled by the error this clip actually showed.
+        """
+        ratio = min(max(observed_ratio, RATIO_RANGE[0]), RATIO_RANGE[1])
+        budget = self._video_budget_bytes(target_size_mb * MB, duration, audio_bitrate_kbps, container)
+        return max(1, int(budget * 8 / 1000 / duration / ratio))
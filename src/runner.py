@@ -0,0 +1,266 @@
+import os
+import time
+import signal
+import weakref
+import threading
+import subprocess
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from src.metrics import record_process
+
+TWO_PASS_WEIGHTS = (0.35, 0.65)  # Share of total work per pass; pass 1 runs faster (no audio, fast first pass)
+
+
+@dataclass
+class ProgressEvent:
+    out_time: float  # Seconds of output encoded so far in the current pass
+    fps: Optional[float] = None
+    speed: Optional[float] = None  # Multiple of realtime
+    total_size: Optional[int] = None  # Bytes written so far
+    bitrate_kbps: Optional[float] = None
+    pass_index: int = 0  # 0-based index of the running pass
+    pass_count: int = 1
+    progress: float = 0.0  # Overall 0-1 across all passes
+    eta: Optional[float] = None  # Estimated seconds remaining across all passes
+    done: bool = False  # Final event of the current pass
+
+
+class EncodeCancelled(Exception):
+    """ Raised when an encode is stopped through its CancelToken. """
+
+
+class CancelToken:
+    """
+    Shared cancellation flag for an encode.
+    cancel() may be called from any thread; it terminates the whole process tree of any running ffmpeg.
+    :param parent: Optional CancelToken whose cancellation also cancels this one (but not the other way round),
+        so part of an encode can be stopped on its own.
+    """
+
+    def __init__(self, parent=None):
+        self._cancelled = threading.Event()
+        self._processes = set()
+        self._children = weakref.WeakSet()
+        self._lock = threading.Lock()
+        if parent is not None:
+            with parent._lock:
+                parent._children.add(self)
+                cancelled = parent.cancelled
+            if cancelled:
+                self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def register(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self.cancelled
+        if cancelled:
+            kill_process_tree(process)  # Cancelled while the process was starting
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            processes = list(self._processes)
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+        for process in processes:
+            kill_process_tree(process)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise EncodeCancelled()
+
+
+def kill_process_tree(process, grace=3.0):
+    """
+    Terminate a process started by popen_ffmpeg() together with its children.
+    Escalates to a hard kill if it hasn't exited after `grace` seconds.
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            return
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass  # Already gone
+
+
+def popen_ffmpeg(cmd, **kwargs):
+    """
+    Start an ffmpeg process in its own process group, so it can be killed as a tree.
+    """
+    if os.name == "nt":
+        kwargs["creationflags"] = kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(cmd, **kwargs)
+
+
+def wait_process(process):
+    """
+    Wait for a process started by popen_ffmpeg() and report its CPU time and peak memory to the metrics
+    of the current job. Uses os.wait4 where available; elsewhere it's a plain wait().
+    :return: The exit code.
+    """
+    if process.returncode is not None or not hasattr(os, "wait4"):
+        return process.wait()
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:  # Already reaped by kill_process_tree()
+        return process.wait()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    record_process(rusage)
+    return process.returncode
+
+
+def pass_weights(pass_count):
+    """ Weight of each pass in the overall 0-1 progress value. """
+    return TWO_PASS_WEIGHTS if pass_count == 2 else tuple([1.0 / pass_count] * pass_count)
+
+
+def _parse_number(value, suffix=""):
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A" before the first frame is written
+
+
+def parse_progress(lines):
+    """
+    Group `-progress` key=value lines into one dict per report.
+    ffmpeg ends each report with a "progress=continue" or "progress=end" line.
+    """
+    block = {}
+    for line in lines:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value
+        if key == "progress":
+            yield block
+            block = {}
+
+
+def _event_from_block(block, duration, pass_index, pass_count):
+    # out_time_us is in microseconds; older builds only have out_time_ms, which is also microseconds
+    out_time_us = _parse_number(block.get("out_time_us")) or _parse_number(block.get("out_time_ms")) or 0
+    out_time = max(0.0, out_time_us / 1_000_000)
+    speed = _parse_number(block.get("speed"), "x")
+    total_size = _parse_number(block.get("total_size"))
+    done = block.get("progress") == "end"
+
+    weights = pass_weights(pass_count)
+    pass_fraction = 1.0 if done else (min(1.0, out_time / duration) if duration else 0.0)
+    progress = sum(weights[:pass_index]) + weights[pass_index] * pass_fraction
+
+    eta = None
+    if duration and speed:
+        remaining_passes = pass_count - pass_index - 1
+        eta = (max(0.0, duration - out_time) + remaining_passes * duration) / speed
+
+    return ProgressEvent(
+        out_time=out_time,
+        fps=_parse_number(block.get("fps")),
+        speed=speed,
+        total_size=int(total_size) if total_size is not None else None,
+        bitrate_kbps=_parse_number(block.get("bitrate"), "kbits/s"),
+        pass_index=pass_index,
+        pass_count=pass_count,
+        progress=min(1.0, progress),
+        eta=eta,
+        done=done,
+    )
+
+
+def stream_ffmpeg(cmd, duration=None, pass_index=0, pass_count=1, cancel_token=None):
+    """
+    Run an FFMPEG command and yield ProgressEvents as it encodes.
+    Adds `-progress pipe:1` to the command; stderr is drained in the background and kept for error reports.
+    :param duration: Output duration in seconds, used for the 0-1 progress value and ETA.
+    :param pass_index: 0-based pass this command is, for two-pass weighting.
+    :param pass_count: Total number of passes in the encode.
+    :param cancel_token: Optional CancelToken that can stop the process from another thread.
+    :raises subprocess.CalledProcessError: If ffmpeg exits with an error (stderr attached).
+    :raises EncodeCancelled: If the token was cancelled.
+    """
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + [arg for arg in cmd[1:] if arg != "-nostats"]
+    process = popen_ffmpeg(
+        cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
+    )
+    if cancel_token:
+        cancel_token.register(process)
+    stderr_tail = deque(maxlen=50)
+    stderr_thread = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+    stderr_thread.start()
+    try:
+        for block in parse_progress(process.stdout):
+            yield _event_from_block(block, duration, pass_index, pass_count)
+    finally:
+        process.stdout.close()
+        returncode = wait_process(process)
+        stderr_thread.join()
+        process.stderr.close()
+        if cancel_token:
+            cancel_token.unregister(process)
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr="".join(stderr_tail))
+
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, pass_index=0, pass_count=1, cancel_token=None):
+    """
+    Run an FFMPEG command to completion, delivering ProgressEvents to a callback.
+    :param on_progress: Optional callable(ProgressEvent), called from the calling thread.
+    :param cancel_token: Optional CancelToken that can stop the process from another thread.
+    :return: Wall time in seconds.
+    :raises subprocess.CalledProcessError: If ffmpeg exits with an error.
+    :raises EncodeCancelled: If the token was cancelled.
+    """
+    start = time.perf_counter()
+    events = stream_ffmpeg(cmd, duration=duration, pass_index=pass_index, pass_count=pass_count, cancel_token=cancel_token)
+    for event in events:
+        if on_progress:
+            on_progress(event)
+    return time.perf_counter() - start
+
+
+def format_progress(event):
+    """ One-line human readable progress, e.g. for a CLI status line. """
+    text = f"{event.progress * 100:5.1f}%"
+    if event.pass_count > 1:
+        text += f" (pass {event.pass_index + 1}/{event.pass_count})"
+    if event.fps:
+        text += f"  {event.fps:.0f} fps"
+    if event.speed:
+        text += f"  {event.speed:.2f}x"
+    if event.eta is not None:
+        minutes, seconds = divmod(int(event.eta), 60)
+        text += f"  ETA {minutes}:{seconds:02d}"
+    return text
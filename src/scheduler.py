@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import heapq
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.compressor import CompressionResult, supports_two_pass
+from src.encoders import (
+    CPU_ENCODER_FALLBACK, DEFAULT_CODEC, GPU_ENCODER_PREFERENCE, encoder_class, get_encoder_capabilities,
+)
+from src.probe import probe_media, ProbeError
+from src.ranges import normalize_ranges, selected_duration
+from src.rate_control import rate_mode
+from src.throughput import SMOOTHING, ThroughputStore, default_throughput_store
+
+# Concurrent ffmpeg processes per encoder class.
+# x264/x265 already use several threads each; consumer GPUs cap the number of hardware sessions.
+DEFAULT_LIMITS = {
+    "cpu": max(1, (os.cpu_count() or 4) // 4),
+    "nvenc": 3,
+    "amf": 2,
+    "qsv": 2,
+}
+
+
+def job_megapixels(job):
+    """
+    Work in a job: source pixels per second of video times the (selected) duration, in megapixels.
+    Downscaled outputs encode fewer pixels, but all encoders see the same job, so the comparison holds.
+    """
+    try:
+        info = probe_media(job.input_path)
+        duration = info.duration or 0
+        if getattr(job, "ranges", None) and duration:
+            duration = selected_duration(normalize_ranges(job.ranges, duration))
+    except (ProbeError, ValueError):
+        return 0.0  # Unreadable inputs and empty ranges fail fast inside compress_video
+    return (info.width or 0) * (info.height or 0) * (info.fps or 30) * duration / 1e6
+
+
+class ThroughputScheduler:
+    """
+    Spread a batch over every usable encoder at once, so hardware sessions and the CPU drain the queue together.
+    Each job goes to the encoder expected to finish it soonest, counting the wait for a free session.
+    Expected times come from a live throughput estimate per encoder (megapixels per second, i.e. fps times
+    frame size), seeded from the ThroughputStore and updated as every job finishes.
+    """
+
+    def __init__(self, run_job, limits=None, encoders=None, throughput_store=None, ffmpeg_path=None,
+                 megapixels=job_megapixels, on_assign=None, clock=time.monotonic):
+        """
+        :param run_job: Callable(job, encoder) -> CompressionResult, called from worker threads.
+        :param limits: Dict of encoder class ("cpu", "nvenc", "amf", "qsv") -> concurrent sessions.
+        :param encoders: Encoders that may be used; defaults to the working ones from the capability
+            registry plus libx264/libx265.
+        :param throughput_store: Source of the starting estimates (defaults to this machine's measurements).
+        :param megapixels: Callable(job) -> amount of work in the job.
+        :param on_assign: Optional callable(job, encoder, expected_seconds) told when a job starts.
+        :param clock: Time source; a simulation can pass its own.
+        """
+        self.run_job = run_job
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.encoders = encoders
+        self.throughput_store = throughput_store or default_throughput_store
+        self.ffmpeg_path = ffmpeg_path
+        self.megapixels = megapixels
+        self.on_assign = on_assign
+        self.clock = clock
+        self._rates = {}  # (encoder, mode) -> live Mpx/s
+        self._work = {}  # id(job) -> megapixels
+
+    def _available(self):
+        if self.encoders is None:
+            working = get_encoder_capabilities(self.ffmpeg_path).working
+            self.encoders = [encoder for encoder in working if encoder_class(encoder) != "cpu"]
+            self.encoders += list(CPU_ENCODER_FALLBACK.values())
+        return self.encoders
+
+    def candidates(self, job):
+        """ Encoders that can run a job: the codec's hardware encoders (if allowed) and its CPU encoder. """
+        available = self._available()
+        codec = job.codec or DEFAULT_CODEC
+        encoders = GPU_ENCODER_PREFERENCE.get(codec, []) if job.use_gpu else []
+        encoders = encoders + [CPU_ENCODER_FALLBACK.get(codec, "libx264")]
+        return [
+            encoder for encoder in encoders
+            if encoder in available and self.limits.get(encoder_class(encoder), 1) > 0
+        ]
+
+    @staticmethod
+    def mode(job, encoder):
+        return rate_mode(job.use_two_pass and supports_two_pass(encoder), getattr(job, "use_predictive", False))
+
+    def rate(self, encoder, mode):
+        """ Live Mpx/s estimate for an encoder and rate-control mode. """
+        rate = self._rates.get((encoder, mode))
+        return rate if rate else self.throughput_store.rate(encoder, mode)
+
+    def observe(self, encoder, mode, megapixels, seconds):
+        """ Fold a finished job into the live estimate. The first one replaces a prior outright. """
+        if megapixels <= 0 or seconds <= 0:
+            return
+        rate = megapixels / seconds
+        previous = self._rates.get((encoder, mode)) or self.throughput_store.measured(encoder, mode)
+        self._rates[(encoder, mode)] = previous * (1 - SMOOTHING) + rate * SMOOTHING if previous else rate
+
+    def run(self, jobs):
+        """
+        Run jobs to completion.
+        :return: List of CompressionResult, in the order of jobs.
+        """
+        jobs = list(jobs)
+        with ThreadPoolExecutor(max_workers=8) as probe_pool:
+            self._work = dict(zip(map(id, jobs), probe_pool.map(self.megapixels, jobs)))
+        pending = sorted(jobs, key=lambda job: self._work[id(job)], reverse=True)  # Longest first
+        results = {}
+        for job in list(pending):
+            if not self.candidates(job):
+                pending.remove(job)
+                results[id(job)] = CompressionResult(job.input_path, job.output_path, error="No encoder available")
+
+        classes = {encoder_class(encoder) for job in pending for encoder in self.candidates(job)}
+        workers = sum(self.limits.get(name, 1) for name in classes) or 1
+        running = {}  # future -> (job, encoder, mode, started, expected end)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler") as pool:
+            while pending or running:
+                for job, encoder, expected in self._plan(pending, running):
+                    pending.remove(job)
+                    if self.on_assign:
+                        self.on_assign(job, encoder, expected)
+                    now = self.clock()
+                    future = pool.submit(self.run_job, job, encoder)
+                    running[future] = (job, encoder, self.mode(job, encoder), now, now + expected)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, encoder, mode, started, _ = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = CompressionResult(job.input_path, job.output_path, error=f"Unexpected error: {e}")
+                    if result.success and not result.cache_hit and result.encoder == encoder:
+                        self.observe(encoder, mode, self._work[id(job)], self.clock() - started)
+                    results[id(job)] = result
+        return [results[id(job)] for job in jobs]
+
+    def _plan(self, pending, running):
+        """
+        List-schedule the queue onto the encoders' sessions by earliest finish time.
+        Jobs planned behind others on a busy device push that device's free time back, so later jobs see
+        the real wait and go to a slower but idle encoder when it would finish them sooner.
+        :return: (job, encoder, expected seconds) for the jobs that should start now.
+        """
+        now = self.clock()
+        slots = {}  # Encoder class -> heap of times its sessions come free
+        for job, encoder, _, _, end in running.values():
+            slots.setdefault(encoder_class(encoder), []).append(max(now, end))
+        for name in self.limits:
+            busy = slots.setdefault(name, [])
+            busy.extend([now] * max(0, self.limits[name] - len(busy)))
+            heapq.heapify(busy)
+
+        starts = []
+        for job in pending:
+            best = None
+            for encoder in self.candidates(job):
+                seconds = self.expected_seconds(job, encoder)
+                free_at = slots[encoder_class(encoder)][0]
+                if best is None or free_at + seconds < best[0]:
+                    best = (free_at + seconds, free_at, encoder, seconds)
+            finish, free_at, encoder, seconds = best
+            heapq.heapreplace(slots[encoder_class(encoder)], finish)
+            if free_at <= now:
+                starts.append((job, encoder, seconds))
+        return starts
+
+    def expected_seconds(self, job, encoder):
+        """ Expected wall time of a job on an encoder, from the live estimate. """
+        return self._work.get(id(job), 0.0) / self.rate(encoder, self.mode(job, encoder))
+
+
+def simulated_run_job(speeds, megapixels, clock, seed=None, jitter=0.1):
+    """
+    Stub run_job for trying the scheduler without a GPU: each "encode" sleeps as long as a device with the
+    given speed would take.
+    :param speeds: Dict of encoder -> true Mpx/s of the simulated device.
+    :param megapixels: Callable(job) -> work in the job.
+    :param clock: Simulated clock; its seconds are what the sleep stands for.
+    :param jitter: Random +-fraction applied to every job's speed.
+    """
+    rng = random.Random(seed)
+
+    def run_job(job, encoder):
+        speed = speeds[encoder] * rng.uniform(1 - jitter, 1 + jitter)
+        start = clock()
+        target = start + megapixels(job) / speed
+        while clock() < target:
+            time.sleep(0.001)
+        return CompressionResult(job.input_path, job.output_path, success=True, encoder=encoder,
+                                 target_met=True, elapsed=clock() - start)
+
+    return run_job
+
+
+def _parse_pairs(pairs, convert):
+    parsed = {}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        parsed[name] = convert(value)
+    return parsed
+
+
+def simulate(speeds, limits, job_count, seed=None, time_scale=0.001, log=print):
+    """
+    Schedule a random batch of 1080p30 clips onto simulated encoders, once with every encoder and once with
+    only the one select_encoder() would pick, and report both makespans.
+    Starting estimates are the built-in priors, so the live estimate has to find the real speeds.
+    :return: (makespan with all encoders, makespan with the preferred encoder only), in simulated seconds.
+    """
+    from src.batch import BatchJob
+
+    rng = random.Random(seed)
+    encoders = list(speeds)
+    codec = "h265" if any(encoder in GPU_ENCODER_PREFERENCE["h265"] + ["libx265"] for encoder in encoders) else "h264"
+    jobs = [BatchJob(f"clip{i:03d}.mp4", f"clip{i:03d}_compressed.mp4", 10, codec=codec) for i in range(job_count)]
+    work = {id(job): 1920 * 1080 * 30 * rng.uniform(10, 300) / 1e6 for job in jobs}  # 10 s to 5 min each
+    megapixels = lambda job: work[id(job)]
+    clock = lambda: time.monotonic() / time_scale
+
+    def run(allowed):
+        counts = {}
+
+        def on_assign(job, encoder, expected):
+            counts[encoder] = counts.get(encoder, 0) + 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = ThroughputScheduler(
+                simulated_run_job(speeds, megapixels, clock, seed=seed), limits=limits, encoders=allowed,
+                throughput_store=ThroughputStore(os.path.join(tmp, "throughput.json")), megapixels=megapixels,
+                on_assign=on_assign, clock=clock,
+            )
+            start = clock()
+            scheduler.run(jobs)
+            return clock() - start, counts
+
+    preferred = next((encoder for encoder in GPU_ENCODER_PREFERENCE[codec] if encoder in encoders),
+                     CPU_ENCODER_FALLBACK[codec])
+    single, _ = run([preferred])
+    makespan, counts = run(encoders)
+    log(f"{job_count} jobs, {sum(work.values()):.0f} Mpx")
+    for encoder in encoders:
+        log(f"  {encoder:<12} {speeds[encoder]:7.0f} Mpx/s  {counts.get(encoder, 0):3d} jobs")
+    log(f"Makespan with {preferred} only: {single:8.1f}s")
+    log(f"Makespan with all encoders:{'':{max(0, len(preferred) - 11)}} {makespan:8.1f}s "
+        f"({(1 - makespan / single) if single else 0:.0%} faster)")
+    return makespan, single
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Try the GPU/CPU scheduler on simulated encoders.")
+    parser.add_argument("command", choices=("simulate",))
+    parser.add_argument("--encoder", action="append", default=None, metavar="NAME=MPX_PER_S",
+                        help="Simulated encoder and its speed (repeatable; default hevc_nvenc=900 libx265=150)")
+    parser.add_argument("--limit", action="append", default=[], metavar="CLASS=N",
+                        help="Session limit per encoder class, e.g. nvenc=2 or cpu=3 (repeatable)")
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=0.001, help="Real seconds per simulated second")
+    args = parser.parse_args(argv)
+
+    speeds = _parse_pairs(args.encoder or ["hevc_nvenc=900", "libx265=150"], float)
+    limits = _parse_pairs(args.limit, int)
+    simulate(speeds, limits, args.jobs, seed=args.seed, time_scale=args.time_scale)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
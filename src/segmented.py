@@ -0,0 +1,270 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
+
+from src.compressor import (
+    CompressionResult, default_rate_controller, encoder_video_args, partial_output_path, plan_bitrates, remove_partial_outputs, NULL_OUTPUT,
+    _stderr_tail,
+)
+from src.encoders import HARDWARE_ENCODERS, select_encoder
+from src.metrics import bind_job, mark_stage
+from src.paths import FFMPEG_PATH
+from src.probe import probe_media, probe_keyframes, ProbeError
+from src.rate_control import container_for
+from src.runner import CancelToken, EncodeCancelled, run_ffmpeg
+
+MIN_SEGMENT_SECONDS = 10  # Shorter chunks cost more in keyframe/lookahead overhead than they gain
+AV_SYNC_TOLERANCE = 0.25  # Max allowed difference between audio and video stream durations, in seconds
+
+
+def choose_split_points(keyframes, duration, segments, min_length=MIN_SEGMENT_SECONDS):
+    """
+    Pick keyframes that cut the timeline into roughly equal chunks.
+    :param keyframes: Sorted keyframe times in seconds.
+    :param duration: Total duration in seconds.
+    :param segments: Desired number of chunks.
+    :return: Chunk boundaries [0, k1, ..., duration], every chunk at least min_length long.
+    """
+    boundaries = [0.0]
+    for i in range(1, segments):
+        ideal = duration * i / segments
+        nearest = min(keyframes, key=lambda k: abs(k - ideal), default=None)
+        if nearest is None:
+            break
+        if nearest - boundaries[-1] >= min_length and duration - nearest >= min_length:
+            boundaries.append(nearest)
+    boundaries.append(duration)
+    return boundaries
+
+
+def _encode_chunk(ffmpeg_path, input_path, chunk_path, start, end, half_frame, encoder, video_bitrate_kbps, use_two_pass,
+                  threads, workdir, length=None, on_progress=None, cancel_token=None):
+    """
+    Encode one keyframe-aligned chunk of video (no audio).
+    Cut points sit half a frame before each keyframe, so every frame lands in exactly one chunk.
+    :param end: Chunk end in seconds, or None for the end of the video.
+    :param length: Chunk duration in seconds, for progress reporting.
+    :raises subprocess.CalledProcessError: If ffmpeg fails.
+    :raises EncodeCancelled: If the token was cancelled.
+    """
+    seek = []
+    if start > 0:
+        seek += ["-ss", f"{max(0.0, start - half_frame):.6f}"]
+    if end is not None:
+        seek += ["-to", f"{end - half_frame:.6f}"]
+    base = [ffmpeg_path, "-hide_banner", "-nostats"] + seek + ["-i", input_path, "-an"]
+    video_args = encoder_video_args(encoder, video_bitrate_kbps) + ["-threads", str(threads)]
+
+    if use_two_pass:
+        passlog = os.path.join(workdir, os.path.splitext(os.path.basename(chunk_path))[0])
+        commands = [
+            base + video_args + ["-pass", "1", "-passlogfile", passlog, "-f", "null", NULL_OUTPUT],
+            base + video_args + ["-pass", "2", "-passlogfile", passlog, "-y", chunk_path],
+        ]
+    else:
+        commands = [base + video_args + ["-y", chunk_path]]
+
+    for pass_index, cmd in enumerate(commands):
+        run_ffmpeg(cmd, duration=length, on_progress=on_progress, pass_index=pass_index,
+                   pass_count=len(commands), cancel_token=cancel_token)
+
+
+def verify_output(output_path, target_size_mb, source_duration):
+    """
+    Check a joined output for A/V sync and size.
+    :return: List of problems found (empty if the file is fine).
+    """
+    problems = []
+    size = os.path.getsize(output_path)
+    if size > target_size_mb * 1024 * 1024:
+        problems.append(f"output is {size / (1024 * 1024):.2f} MB, over the {target_size_mb} MB target")
+
+    info = probe_media(output_path, use_cache=False)
+    video_duration = info.video.duration if info.video else None
+    audio_duration = info.audio.duration if info.audio else None
+    if video_duration and audio_duration and abs(video_duration - audio_duration) > AV_SYNC_TOLERANCE:
+        problems.append(f"audio/video out of sync: video {video_duration:.3f}s vs audio {audio_duration:.3f}s")
+    if video_duration and abs(video_duration - source_duration) > AV_SYNC_TOLERANCE:
+        problems.append(f"video duration {video_duration:.3f}s differs from source {source_duration:.3f}s")
+    return problems
+
+
+def compress_video_segmented(input_path, output_path, target_size_mb, use_two_pass=True, codec="h265", segments=None,
+                             log=print, on_progress=None, cancel_token=None, encoder=None):
+    """
+    Compress a long video by encoding keyframe-aligned chunks in parallel CPU encoder processes.
+    Each chunk is encoded at the same bitrate from plan_bitrates, so chunks share the size budget
+    in proportion to their length. Audio is encoded once, and the chunks are joined losslessly
+    with the concat demuxer.
+    :param segments: Number of chunks (defaults to a quarter of the CPU cores).
+    :param log: Callable receiving progress messages (print by default).
+    :param on_progress: Optional callable(ProgressEvent) receiving the combined progress of all chunks
+        (called from the chunk worker threads, one at a time).
+    :param cancel_token: Optional CancelToken; cancelling kills every chunk encode and removes partial files.
+    :param encoder: CPU encoder to use instead of selecting one from codec (hardware encoders are ignored).
+    :return: CompressionResult; error is set if verification of the joined file fails.
+    """
+    ffmpeg_path = FFMPEG_PATH
+    start_time = time.perf_counter()
+    result = CompressionResult(input_path=input_path, output_path=output_path)
+    work_path = partial_output_path(output_path)
+
+    def report(message):
+        result.messages.append(message)
+        if log:
+            log(message)
+
+    def fail(message):
+        report(message)
+        result.error = message
+        result.elapsed = time.perf_counter() - start_time
+        return result
+
+    mark_stage("probing")
+    try:
+        media_info = probe_media(input_path)
+        keyframes = probe_keyframes(media_info)
+    except ProbeError as e:
+        return fail(f"Error probing input: {e}")
+    duration = media_info.duration
+    if not duration:
+        return fail("Unable to fetch video duration. Exiting.")
+
+    mark_stage("planning")
+    if not encoder or encoder in HARDWARE_ENCODERS:
+        encoder = select_encoder(codec, use_gpu=False)  # Segmenting only pays off for CPU encoders
+    video_bitrate_kbps, audio_bitrate_kbps = plan_bitrates(
+        media_info, target_size_mb, log=report, encoder=encoder, container=container_for(output_path),
+        two_pass=use_two_pass,
+    )
+    result.encoder = encoder
+    result.video_bitrate_kbps = video_bitrate_kbps
+    result.audio_bitrate_kbps = audio_bitrate_kbps
+
+    cpu_count = os.cpu_count() or 4
+    boundaries = choose_split_points(keyframes, duration, segments or max(2, cpu_count // 4))
+    chunk_count = len(boundaries) - 1
+    threads = max(1, cpu_count // chunk_count)
+    half_frame = 0.5 / (media_info.fps or 30)
+    report(f"Encoding {chunk_count} chunks with {encoder} at {video_bitrate_kbps}k, {threads} threads each")
+
+    # Chunks encode side by side; their progress is combined into one value weighted by chunk length,
+    # and the slowest chunk sets the ETA
+    progress_lock = threading.Lock()
+    chunk_progress = [0.0] * chunk_count
+    chunk_etas = [None] * chunk_count
+
+    def chunk_progress_callback(index):
+        if not on_progress:
+            return None
+
+        def callback(event):
+            with progress_lock:
+                chunk_progress[index] = event.progress
+                chunk_etas[index] = 0.0 if event.done and event.pass_index == event.pass_count - 1 else event.eta
+                progress = sum(fraction * (boundaries[i + 1] - boundaries[i]) / duration
+                               for i, fraction in enumerate(chunk_progress))
+                etas = [eta for eta in chunk_etas if eta is not None]
+                on_progress(replace(
+                    event, out_time=progress * duration, pass_index=0, pass_count=1, progress=min(1.0, progress),
+                    eta=max(etas) if etas else None, done=progress >= 1.0,
+                ))
+        return callback
+
+    mark_stage("pass1")
+    try:
+        workdir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(output_path)))
+    except OSError as e:
+        return fail(f"Error creating the segment folder: {e}")
+    try:
+        chunk_paths = [os.path.join(workdir, f"chunk_{i:03d}.mp4") for i in range(chunk_count)]
+        audio_path = os.path.join(workdir, "audio.m4a") if media_info.audio else None
+
+        # The first chunk or audio encode that fails stops its siblings through chunk_token instead of
+        # leaving them to run to the end; cancelling the caller's token stops them too
+        chunk_token = CancelToken(parent=cancel_token)
+        with ThreadPoolExecutor(max_workers=chunk_count + 1) as pool:
+            futures = []
+            for i, chunk_path in enumerate(chunk_paths):
+                end = boundaries[i + 1] if i + 1 < chunk_count else None
+                futures.append(pool.submit(
+                    bind_job(_encode_chunk), ffmpeg_path, input_path, chunk_path, boundaries[i], end, half_frame,
+                    encoder, video_bitrate_kbps, use_two_pass, threads, workdir,
+                    length=boundaries[i + 1] - boundaries[i], on_progress=chunk_progress_callback(i), cancel_token=chunk_token,
+                ))
+            if audio_path:
+                audio_cmd = [
+                    ffmpeg_path, "-hide_banner", "-nostats", "-i", input_path,
+                    "-vn", "-c:a", "aac", "-b:a", f"{audio_bitrate_kbps}k", "-y", audio_path,
+                ]
+                futures.append(pool.submit(bind_job(run_ffmpeg), audio_cmd, duration=duration, cancel_token=chunk_token))
+            error = None
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except EncodeCancelled:
+                    if error is None and cancel_token and cancel_token.cancelled:
+                        result.cancelled = True
+                        error = "Compression cancelled."
+                except subprocess.CalledProcessError as e:
+                    if error is None:
+                        error = f"Error during segment encoding: {e} {_stderr_tail(e.stderr)}".rstrip()
+                        chunk_token.cancel()
+                except OSError as e:
+                    if error is None:
+                        error = f"Error running FFMPEG: {e}"
+                        chunk_token.cancel()
+        if error:
+            return fail(error)
+
+        # Join the chunks with the concat demuxer (stream copy, no re-encode) and mux the audio back in.
+        # The joined file only replaces output_path once it has passed verification.
+        mark_stage("finalize")
+        list_path = os.path.join(workdir, "chunks.txt")
+        concat_cmd = [ffmpeg_path, "-hide_banner", "-nostats", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            concat_cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        concat_cmd += ["-c", "copy", "-y", work_path]
+        try:
+            with open(list_path, "w", encoding="utf-8") as f:
+                for chunk_path in chunk_paths:
+                    f.write(f"file '{os.path.basename(chunk_path)}'\n")
+            run_ffmpeg(concat_cmd, duration=duration, cancel_token=cancel_token)
+            result.output_size = os.path.getsize(work_path)
+        except EncodeCancelled:
+            remove_partial_outputs(work_path)
+            result.cancelled = True
+            return fail("Compression cancelled.")
+        except subprocess.CalledProcessError as e:
+            remove_partial_outputs(work_path)
+            return fail(f"Error joining segments: {e} {_stderr_tail(e.stderr)}".rstrip())
+        except OSError as e:
+            remove_partial_outputs(work_path)
+            return fail(f"Error joining segments: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        problems = verify_output(work_path, target_size_mb, duration)
+    except (ProbeError, OSError) as e:
+        problems = [f"unable to verify output: {e}"]
+    if problems:
+        remove_partial_outputs(work_path)
+        return fail(f"Segmented output failed verification: {'; '.join(problems)}")
+    try:
+        os.replace(work_path, output_path)
+    except OSError as e:
+        remove_partial_outputs(work_path)
+        return fail(f"Error moving output into place: {e}")
+
+    result.attempts = 1
+    result.target_met = default_rate_controller.within_target(result.output_size, target_size_mb)
+    result.success = True
+    result.elapsed = time.perf_counter() - start_time
+    report(f"Compressed {input_path} to {output_path} successfully in {chunk_count} segments.")
+    return result
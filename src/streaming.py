@@ -0,0 +1,325 @@
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+from src.compressor import (
+    CompressionResult, build_ffmpeg_commands, compress_video, default_rate_controller, supports_two_pass,
+)
+from src.encoders import select_encoder
+from src.fast_path import AUDIO_MAX_SHARE, DEFAULT_AUDIO_KBPS, MIN_AUDIO_KBPS
+from src.paths import FFMPEG_PATH
+from src.rate_control import rate_mode, MB
+from src.runner import CancelToken, kill_process_tree, popen_ffmpeg
+
+CHUNK_SIZE = 64 * 1024  # Feeder/reader buffer; with the two OS pipe buffers this bounds memory per stream
+PEEK_SIZE = 64 * 1024  # Bytes inspected to tell whether an MP4 input can be read front to back
+STREAM_FORMATS = {
+    # Fragmented MP4: an empty moov up front and a moof per keyframe, so nothing has to be patched at the end
+    "mp4": ["-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"],
+    "matroska": ["-f", "matroska"],  # Written front to back when the output can't seek
+}
+SPOOL_EXTENSIONS = {"mp4": ".mp4", "matroska": ".mkv"}
+
+
+class StreamError(Exception):
+    """ Raised by CompressedStream.read() when the encode failed. """
+
+
+def mp4_needs_seeking(prefix):
+    """
+    Whether an MP4/MOV input has its moov index after the media data (the usual layout without faststart),
+    which ffmpeg can only read from a seekable file.
+    :param prefix: First bytes of the input.
+    :return: True if mdat comes before moov; False if moov comes first or this doesn't look like MP4.
+    """
+    offset = 0
+    while offset + 8 <= len(prefix):
+        size = int.from_bytes(prefix[offset:offset + 4], "big")
+        box = prefix[offset + 4:offset + 8]
+        if offset == 0 and box not in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+            return False  # Not an ISO media file
+        if box == b"moov":
+            return False
+        if box == b"mdat":
+            return True
+        if size == 1:
+            if offset + 16 > len(prefix):
+                break
+            size = int.from_bytes(prefix[offset + 8:offset + 16], "big")
+        if size < 8:
+            break  # Box runs to the end of the file, or garbage
+        offset += size
+    return False
+
+
+def stream_audio_kbps(target_size_mb, duration):
+    """ Audio budget without a probe: the default bitrate, capped at the usual share of the total. """
+    total_kbps = target_size_mb * MB * 8 / 1000 / duration
+    return max(MIN_AUDIO_KBPS, min(DEFAULT_AUDIO_KBPS, int(total_kbps * AUDIO_MAX_SHARE)))
+
+
+def build_stream_command(ffmpeg_path, encoder, video_bitrate_kbps, audio_bitrate_kbps, container, preset=None):
+    """
+    Single-pass encode from stdin to stdout in a streamable container.
+    The first audio stream is optional, so inputs without audio need no probe.
+    """
+    cmd = build_ffmpeg_commands(
+        ffmpeg_path, "pipe:0", "pipe:1", encoder, video_bitrate_kbps, audio_bitrate_kbps, False, preset=preset
+    )[0]
+    return cmd[:-2] + ["-map", "0:v:0", "-map", "0:a:0?"] + STREAM_FORMATS[container] + ["-y", "pipe:1"]
+
+
+def _source_reader(source):
+    """ read(n) for a binary file object or a raw file descriptor. """
+    if isinstance(source, int):
+        return lambda size: os.read(source, size)
+    return source.read
+
+
+class CompressedStream(io.RawIOBase):
+    """
+    Readable stream of a compressed video, produced by compress_stream().
+    Reading pulls encoded bytes as ffmpeg writes them; not reading stalls ffmpeg and, through it, the
+    reads from the input. After EOF, `result` describes the encode. close() stops an unfinished encode.
+    """
+
+    def __init__(self, read_source, target_size_mb, duration, container, options, spool, spool_dir, log, ffmpeg_path):
+        super().__init__()
+        self.result = CompressionResult(input_path="<stream>", output_path="<stream>", encoder=options["encoder"])
+        self._read_source = read_source
+        self._target_size_mb = target_size_mb
+        self._start = time.perf_counter()
+        self._log = log
+        self._bytes_out = 0
+        self._finished = False
+        self._feed_error = None
+        self._stderr_tail = deque(maxlen=50)
+        self._process = None
+        self._reader = None
+        self._spool_dir = None
+        self._ready = threading.Event()  # Output is readable (at once when piping, after the encode when spooling)
+        self._cancel_token = CancelToken()
+        prefix = self._peek()
+        if container == "mp4" and not spool and mp4_needs_seeking(prefix):
+            self._report("Input MP4 has its index at the end; spooling it to disk.")
+            spool = True
+        if spool:
+            self._spool_dir = tempfile.mkdtemp(prefix="stream-", dir=spool_dir)
+            self._worker = threading.Thread(
+                target=self._spool_and_compress, args=(prefix, target_size_mb, container, options), daemon=True
+            )
+        else:
+            self._worker = threading.Thread(target=self._feed, args=(prefix,), daemon=True)
+            self._start_pipe(target_size_mb, duration, container, options, ffmpeg_path)
+        self._worker.start()
+
+    def _peek(self):
+        """ Read up to PEEK_SIZE bytes (pipes may return less per read); they are fed to ffmpeg first. """
+        chunks, size = [], 0
+        while size < PEEK_SIZE:
+            chunk = self._read_source(PEEK_SIZE - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks)
+
+    def _report(self, message):
+        self.result.messages.append(message)
+        if self._log:
+            self._log(message)
+
+    def _start_pipe(self, target_size_mb, duration, container, options, ffmpeg_path):
+        encoder = options["encoder"]
+        audio_kbps = stream_audio_kbps(target_size_mb, duration)
+        video_kbps = default_rate_controller.plan_video_bitrate(
+            target_size_mb, duration, audio_kbps, encoder, container, rate_mode(False)
+        )
+        self.result.video_bitrate_kbps, self.result.audio_bitrate_kbps = video_kbps, audio_kbps
+        cmd = build_stream_command(ffmpeg_path, encoder, video_kbps, audio_kbps, container, options["preset"])
+        self._report(f"Streaming with {encoder} at {video_kbps} kbps video, {audio_kbps} kbps audio")
+        self._process = popen_ffmpeg(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     bufsize=0)
+        self._reader = self._process.stdout
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+        self._ready.set()
+
+    def _drain_stderr(self):
+        with self._process.stderr:
+            for line in self._process.stderr:
+                self._stderr_tail.append(line.decode("utf-8", "replace"))
+
+    def _feed(self, prefix):
+        """ Copy the source into ffmpeg's stdin; blocking writes are the backpressure. """
+        stdin = self._process.stdin
+        try:
+            chunk = prefix
+            while chunk:
+                view = memoryview(chunk)
+                while view:
+                    view = view[stdin.write(view):]  # Unbuffered pipe; a write may be partial
+                chunk = self._read_source(CHUNK_SIZE)
+        except (BrokenPipeError, ValueError):
+            pass  # ffmpeg exited or the stream was closed; its exit status tells what happened
+        except Exception as e:
+            self._feed_error = e  # The source failed; stop the encode rather than emit a truncated video
+            kill_process_tree(self._process)
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def _spool_and_compress(self, prefix, target_size_mb, container, options):
+        """ Two-pass or unknown duration: write the input to disk, compress it, then serve the output file. """
+        input_path = os.path.join(self._spool_dir, "input")
+        output_path = os.path.join(self._spool_dir, "output" + SPOOL_EXTENSIONS[container])
+        try:
+            with open(input_path, "wb") as f:
+                chunk = prefix
+                while chunk and not self._cancel_token.cancelled:
+                    f.write(chunk)
+                    chunk = self._read_source(CHUNK_SIZE)
+            if not self._cancel_token.cancelled:
+                result = compress_video(input_path, output_path, target_size_mb, log=self._log,
+                                        cancel_token=self._cancel_token, use_output_cache=False, **options)
+                result.input_path = result.output_path = "<stream>"
+                result.messages = self.result.messages + result.messages
+                self.result = result
+                if result.success:
+                    self._reader = open(output_path, "rb")
+        except Exception as e:
+            self._feed_error = e  # Reading the source or writing the spool file failed
+        finally:
+            self._ready.set()  # Never leave a reader waiting
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        self._ready.wait()
+        if self._reader is None:
+            return self._finish()
+        count = self._reader.readinto(buffer)
+        if not count:
+            return self._finish()
+        self._bytes_out += count
+        return count
+
+    def _finish(self):
+        """ EOF: settle the result, raising if the encode failed. """
+        if not self._finished:
+            self._finished = True
+            self._worker.join()
+            if self._feed_error is not None:
+                self.result.success = False
+                self.result.error = f"Error reading input: {self._feed_error}"
+            if self._process is not None:
+                returncode = self._process.wait()
+                self.result.output_size = self._bytes_out
+                self.result.attempts = 1
+                self.result.elapsed = time.perf_counter() - self._start
+                if returncode != 0 and self.result.error is None:
+                    stderr = "".join(self._stderr_tail)[-2000:]
+                    self.result.error = f"Error during streaming compression: exit status {returncode} {stderr}".rstrip()
+                elif self.result.error is None:
+                    self.result.success = True
+                    self.result.target_met = default_rate_controller.within_target(
+                        self._bytes_out, self._target_size_mb
+                    )
+            if self.result.error and self._log and (self._process is not None or self._feed_error is not None):
+                self._log(self.result.error)  # compress_video already reported its own errors
+        if not self.result.success:
+            raise StreamError(self.result.error or "Compression failed")
+        return 0
+
+    def close(self):
+        if self.closed:
+            return
+        self._cancel_token.cancel()
+        if self._process is not None:
+            kill_process_tree(self._process)
+            self._process.stdout.close()
+            self._process.wait()
+        self._worker.join()
+        if self._reader is not None and self._reader is not getattr(self._process, "stdout", None):
+            self._reader.close()
+        if self._spool_dir:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+        super().close()
+
+
+def compress_stream(source, target_size_mb, duration=None, container="mp4", codec="h265", use_gpu=True,
+                    use_two_pass=False, preset=None, spool=None, spool_dir=None, log=print, ffmpeg_path=None):
+    """
+    Compress a video read from a stream, returning the output as a stream.
+    With a known duration and a single pass, input and output are piped straight through ffmpeg: encoded
+    bytes can be read while the input is still arriving, in a fragmented MP4 or Matroska container, and
+    memory stays bounded because nothing is read from the source faster than the output is consumed.
+    Otherwise (two-pass, unknown duration, or an MP4 with its index at the end) the input is spooled to a
+    temporary file and compressed by compress_video() with all its features; the output then streams
+    from disk. Temporary files are removed when the returned stream is closed.
+    :param source: Readable binary file object or file descriptor.
+    :param duration: Input duration in seconds, needed to size the bitrate without probing.
+    :param container: "mp4" (fragmented) or "matroska".
+    :param use_two_pass: Two-pass encoding; needs the whole input, so it implies spooling.
+    :param spool: Force (True) or forbid (False) spooling; None decides automatically.
+    :param spool_dir: Directory for spooled files (default: the system temp directory).
+    :return: CompressedStream; read it to EOF, then check its result.
+    """
+    if container not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported streaming container: {container}")
+    ffmpeg_path = ffmpeg_path or FFMPEG_PATH
+    encoder = select_encoder(codec, use_gpu=use_gpu, ffmpeg_path=ffmpeg_path)
+    two_pass = use_two_pass and supports_two_pass(encoder)
+    if spool is None:
+        spool = two_pass or not duration
+    elif not spool and not duration:
+        raise ValueError("Streaming without spooling needs the input duration")
+    options = {"codec": codec, "use_gpu": use_gpu, "use_two_pass": use_two_pass, "preset": preset, "encoder": encoder}
+    return CompressedStream(_source_reader(source), target_size_mb, duration, container, options, spool, spool_dir,
+                            log, ffmpeg_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compress a video from stdin to stdout. Logs go to stderr.",
+    )
+    parser.add_argument("-t", "--target-size", type=float, default=10, help="Target size in MB (default 10)")
+    parser.add_argument("-d", "--duration", type=float, default=None,
+                        help="Input duration in seconds; without it the input is spooled to disk")
+    parser.add_argument("-f", "--format", default="mp4", choices=sorted(STREAM_FORMATS))
+    parser.add_argument("--codec", default="h265", choices=("h264", "h265"))
+    parser.add_argument("--no-gpu", action="store_true", help="Only use CPU encoders")
+    parser.add_argument("--two-pass", action="store_true", help="Two-pass encoding (spools the input)")
+    parser.add_argument("--spool", action="store_true", help="Always spool the input to disk")
+    parser.add_argument("--spool-dir", default=None)
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    stream = compress_stream(
+        sys.stdin.buffer, args.target_size, duration=args.duration, container=args.format, codec=args.codec,
+        use_gpu=not args.no_gpu, use_two_pass=args.two_pass, spool=True if args.spool else None,
+        spool_dir=args.spool_dir, log=log,
+    )
+    try:
+        with stream:
+            shutil.copyfileobj(stream, sys.stdout.buffer, CHUNK_SIZE)
+            sys.stdout.buffer.flush()
+    except StreamError:
+        return 1
+    log(f"Wrote {stream.result.output_size} bytes ({'on' if stream.result.target_met else 'off'} target).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
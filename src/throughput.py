@@ -0,0 +1,70 @@
+import os
+import threading
+
+from src.cache import CACHE_DIR, DiskCache
+from src.encoders import encoder_class
+
+# Starting guesses for whole-encode throughput, in megapixels of output video per wall-clock second
+# (a 1080p30 clip is ~62 Mpx per second of video). Replaced by measurements as soon as they exist.
+PRIOR_MPIX_PER_SECOND = {
+    "cpu": 120.0,
+    "nvenc": 600.0,
+    "amf": 400.0,
+    "qsv": 400.0,
+}
+HEVC_PRIOR_FACTOR = 0.3  # x265 is several times slower than x264 at the same preset
+TWO_PASS_PRIOR_FACTOR = 0.6  # Pass 1 is cheaper than pass 2, so two passes take well under twice as long
+SMOOTHING = 0.3  # Weight of a new measurement in the moving average
+
+
+class ThroughputStore:
+    """
+    Measured encode throughput of this machine per encoder and rate-control mode.
+    compress_video records every encode; the estimator turns it into expected encode times.
+    """
+
+    def __init__(self, path=None):
+        self._cache = DiskCache(path or os.path.join(CACHE_DIR, "throughput.json"), max_entries=200)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(encoder, mode):
+        return f"{encoder}|{mode}"
+
+    def record(self, encoder, mode, megapixels, seconds):
+        """
+        :param megapixels: Output pixels encoded (width * height * frames / 1e6).
+        :param seconds: Wall time of the encode, all passes included.
+        """
+        if megapixels <= 0 or seconds <= 0:
+            return
+        rate = megapixels / seconds
+        with self._lock:
+            key = self._key(encoder, mode)
+            entry = self._cache.get(key)
+            if entry:
+                rate = entry["rate"] * (1 - SMOOTHING) + rate * SMOOTHING
+            self._cache.put(key, {"rate": rate, "n": (entry["n"] if entry else 0) + 1})
+
+    def measured(self, encoder, mode):
+        """ Measured Mpx/s, or None if this encoder/mode hasn't run on this machine yet. """
+        entry = self._cache.get(self._key(encoder, mode))
+        return entry["rate"] if entry else None
+
+    def rate(self, encoder, mode):
+        """ Expected Mpx/s: the measurement if there is one, otherwise a prior. """
+        measured = self.measured(encoder, mode)
+        if measured:
+            return measured
+        rate = PRIOR_MPIX_PER_SECOND[encoder_class(encoder)]
+        if encoder == "libx265":
+            rate *= HEVC_PRIOR_FACTOR
+        if mode == "two_pass":
+            rate *= TWO_PASS_PRIOR_FACTOR
+        return rate
+
+    def estimate_seconds(self, encoder, mode, megapixels):
+        return megapixels / self.rate(encoder, mode)
+
+
+default_throughput_store = ThroughputStore()
@@ -0,0 +1,103 @@
+import os
+import time
+import hashlib
+import subprocess
+
+from src.cache import CACHE_DIR, file_fingerprint
+from src.paths import FFMPEG_PATH
+
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_WIDTH = 320  # Decoded frames are scaled down to this before encoding the JPEG
+THUMBNAIL_POSITION = 0.1  # Share of the duration to seek into; skips black intro frames
+MAX_THUMBNAILS = 500  # Files kept on disk; least recently used are evicted
+
+
+class ThumbnailError(Exception):
+    """ Raised when a frame can't be extracted from a video. """
+
+
+def thumbnail_timestamp(duration):
+    """ Default preview position for a clip of this duration, in seconds. """
+    return round((duration or 0) * THUMBNAIL_POSITION, 3)
+
+
+def thumbnail_path(input_path, timestamp, width=THUMBNAIL_WIDTH, directory=THUMBNAIL_DIR):
+    """
+    Cache location of a thumbnail, keyed by the file fingerprint, timestamp and width.
+    """
+    key = f"{file_fingerprint(input_path)}|{timestamp:.3f}|{width}"
+    return os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+
+def build_thumbnail_command(ffmpeg_path, input_path, timestamp, output_path, width=THUMBNAIL_WIDTH):
+    """
+    Command extracting one frame near `timestamp`.
+    -ss before -i seeks the demuxer, and -skip_frame nokey decodes only keyframes, so the
+    first keyframe at or after the position is used without decoding the GOP leading up to it.
+    """
+    return [
+        ffmpeg_path, "-hide_banner", "-nostats", "-loglevel", "error",
+        "-skip_frame", "nokey",
+        "-ss", f"{timestamp:.3f}",
+        "-i", input_path,
+        "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-frames:v", "1",
+        "-vf", f"scale={width}:-2:flags=fast_bilinear",
+        "-q:v", "4",
+        "-f", "image2", "-y", output_path,
+    ]
+
+
+def evict_thumbnails(directory=THUMBNAIL_DIR, max_files=MAX_THUMBNAILS):
+    """ Delete the least recently used thumbnails beyond max_files. """
+    try:
+        entries = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jpg")]
+    except OSError:
+        return
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    for path in entries[:len(entries) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def extract_thumbnail(input_path, timestamp=None, duration=None, width=THUMBNAIL_WIDTH, ffmpeg_path=None,
+                      directory=THUMBNAIL_DIR):
+    """
+    Path to a JPEG preview frame of the video, extracting it only if it isn't cached on disk.
+    :param timestamp: Position in seconds; defaults to thumbnail_timestamp(duration).
+    :param duration: Clip duration, used for the default position.
+    :return: Path of the cached JPEG.
+    :raises ThumbnailError: If the file is unreadable or ffmpeg can't produce a frame.
+    """
+    if timestamp is None:
+        timestamp = thumbnail_timestamp(duration)
+    try:
+        path = thumbnail_path(input_path, timestamp, width, directory)
+    except OSError as e:
+        raise ThumbnailError(str(e)) from e
+    if os.path.exists(path):
+        os.utime(path)  # Mark as recently used for eviction
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path[:-4]}.tmp-{os.getpid()}-{time.monotonic_ns()}.jpg"
+    cmd = build_thumbnail_command(ffmpeg_path or FFMPEG_PATH, input_path, timestamp, tmp_path, width)
+    try:
+        completed = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0 or not os.path.exists(tmp_path) or not os.path.getsize(tmp_path):
+            if timestamp > 0:
+                # Seeking past the last keyframe of a short clip yields nothing; fall back to the start
+                return extract_thumbnail(input_path, 0, width=width, ffmpeg_path=ffmpeg_path, directory=directory)
+            raise ThumbnailError((completed.stderr or "no frame extracted").strip())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        raise ThumbnailError(str(e)) from e
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict_thumbnails(directory)
+    return path
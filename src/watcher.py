@@ -0,0 +1,319 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.cache import file_fingerprint
+from src.compressor import compress_video
+from src.helpers import generate_output_filename
+from src.metrics import JsonLinesHook, MetricsAggregator, add_hook, serve_prometheus
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v")
+DEFAULT_SETTLE_SECONDS = 5.0  # A file must keep the same size and mtime this long before it is queued
+DEFAULT_POLL_INTERVAL = 2.0  # Directory scan interval when inotify isn't available
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class Inotify:
+    """
+    Minimal ctypes binding to Linux inotify. Raises OSError where it's unavailable.
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+
+    def add_watch(self, directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed: {os.strerror(err)}", directory)
+        self._watches[wd] = directory
+
+    def read_events(self):
+        """
+        :return: List of (mask, path) for every queued event; a path of None means the queue overflowed.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    events.append((mask, None))
+                elif wd in self._watches and name:
+                    events.append((mask, os.path.join(self._watches[wd], os.fsdecode(name))))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Watch directories and compress every video that lands in them.
+    New files are found with inotify (or by polling), queued only once their size has stopped
+    changing, and compressed by a fixed number of workers, however many files arrive at once.
+    The loop sleeps in select() between events, so an idle watcher costs no CPU.
+    """
+
+    def __init__(self, directories, target_size_mb, output_dir=None, workers=1, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True, process_existing=False, compress_options=None,
+                 log=print):
+        """
+        :param output_dir: Where outputs go (defaults to each input's own directory).
+        :param workers: Concurrent compressions (each is one ffmpeg process at a time).
+        :param process_existing: Also queue videos already in the directories at startup.
+        :param compress_options: Extra keyword arguments for compress_video (codec, use_gpu, ...).
+        :param log: Callable receiving status messages (print by default).
+        """
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.target_size_mb = target_size_mb
+        self.output_dir = output_dir
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.process_existing = process_existing
+        self.compress_options = compress_options or {}
+        self.log = log
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="watch")
+        self._pending = {}  # path -> (size, mtime_ns, unchanged since)
+        self._active = set()  # Paths queued or compressing
+        self._done = set()  # Fingerprints of files already handled
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+
+    def _report(self, message):
+        if self.log:
+            self.log(message)
+
+    def is_candidate(self, path):
+        """ Videos only; skips hidden/temporary files and our own outputs. """
+        name = os.path.basename(path)
+        base, ext = os.path.splitext(name)
+        return (
+            ext.lower() in VIDEO_EXTENSIONS
+            and not name.startswith(".")
+            and not base.endswith("_compressed")
+            and ".tmp-" not in name
+        )
+
+    def _is_done(self, path):
+        try:
+            fingerprint = file_fingerprint(path)
+        except OSError:
+            return True  # Gone
+        with self._lock:
+            return fingerprint in self._done
+
+    def observe(self, path):
+        """ Note a new or changed file; it is queued once it has settled. """
+        if not self.is_candidate(path):
+            return
+        with self._lock:
+            if path in self._active:
+                return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return  # Already moved away
+        state = (stat.st_size, stat.st_mtime_ns)
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != state:
+            self._pending[path] = state + (time.monotonic(),)
+
+    def scan(self):
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file() and entry.path not in self._pending and not self._is_done(entry.path):
+                            self.observe(entry.path)
+            except OSError as e:
+                self._report(f"Error scanning {directory}: {e}")
+
+    def check_pending(self):
+        """
+        Queue files whose size and mtime haven't changed for settle_seconds.
+        :return: Seconds until the next pending file could settle, or None if nothing is pending.
+        """
+        now = time.monotonic()
+        next_check = None
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)  # Still being written
+                remaining = self.settle_seconds
+            elif stat.st_size > 0 and now - since >= self.settle_seconds:
+                del self._pending[path]
+                self._submit(path)
+                continue
+            else:
+                remaining = max(0.0, self.settle_seconds - (now - since))
+            next_check = remaining if next_check is None else min(next_check, remaining)
+        return next_check
+
+    def _submit(self, path):
+        if self._is_done(path):
+            return
+        with self._lock:
+            self._active.add(path)
+        self._report(f"Queued {path}")
+        self._executor.submit(self._process, path)
+
+    def _process(self, path):
+        try:
+            fingerprint = file_fingerprint(path)
+            output_path = generate_output_filename(path, self.target_size_mb, output_dir=self.output_dir)
+            if os.path.exists(output_path):
+                self._report(f"Skipping {path}: {output_path} already exists")
+            else:
+                result = compress_video(path, output_path, self.target_size_mb, log=None, **self.compress_options)
+                if result.success:
+                    self._report(f"Compressed {path} -> {output_path} ({result.output_size / (1024 * 1024):.2f} MB)")
+                else:
+                    self._report(f"Failed {path}: {result.error}")
+            with self._lock:
+                self._done.add(fingerprint)
+        except Exception as e:
+            self._report(f"Error processing {path}: {e}")
+        finally:
+            with self._lock:
+                self._active.discard(path)
+
+    def stop(self):
+        """ Stop the loop from any thread (or a signal handler). Running compressions finish. """
+        self._stop.set()
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def run(self):
+        """ Watch until stop() is called, then wait for queued compressions to finish. """
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = Inotify()
+                for directory in self.directories:
+                    inotify.add_watch(directory)
+            except OSError as e:
+                self._report(f"inotify unavailable ({e}); polling every {self.poll_interval:g}s")
+                if inotify:
+                    inotify.close()
+                inotify = None
+
+        if self.process_existing or inotify is None:
+            self.scan()
+            if not self.process_existing:
+                # Polling: files present at startup are not new; only later arrivals are queued
+                for path in self._pending:
+                    try:
+                        self._done.add(file_fingerprint(path))
+                    except OSError:
+                        pass
+                self._pending.clear()
+
+        self._report(f"Watching {', '.join(self.directories)}")
+        try:
+            while not self._stop.is_set():
+                timeout = self.check_pending()
+                if inotify is None:
+                    timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+                    ready, _, _ = select.select([self._wake_r], [], [], timeout)
+                    if not ready:
+                        self.scan()
+                    continue
+
+                ready, _, _ = select.select([inotify.fd, self._wake_r], [], [], timeout)  # None = sleep until an event
+                if inotify.fd in ready:
+                    for _, path in inotify.read_events():
+                        if path is None:
+                            self.scan()  # Events were dropped; rescan to catch up
+                        else:
+                            self.observe(path)
+        finally:
+            if inotify:
+                inotify.close()
+            self._report("Stopping; waiting for running compressions to finish...")
+            self._executor.shutdown(wait=True)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress every video dropped into the watched folders.")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--target-size", type=float, default=10, help="Target size in MB (default 10)")
+    parser.add_argument("--output-dir", default=None, help="Output folder (default: next to each input)")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent compressions (default 1)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is compressed")
+    parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument("--existing", action="store_true", help="Also compress videos already in the folders")
+    parser.add_argument("--codec", default=None, choices=("h264", "h265"),
+                        help="Output codec (default h265; an input that already fits may be kept as it is)")
+    parser.add_argument("--no-gpu", action="store_true")
+    parser.add_argument("--single-pass", action="store_true")
+    parser.add_argument("--metrics-jsonl", default=None, help="Append per-job metrics to this JSON lines file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args(argv)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"not a directory: {directory}")
+    watcher = FolderWatcher(
+        args.directories, args.target_size, output_dir=args.output_dir, workers=args.workers,
+        settle_seconds=args.settle, poll_interval=args.poll_interval, use_inotify=not args.poll,
+        process_existing=args.existing,
+        compress_options={"codec": args.codec, "use_gpu": not args.no_gpu, "use_two_pass": not args.single_pass},
+    )
+    if args.metrics_jsonl:
+        add_hook(JsonLinesHook(args.metrics_jsonl))
+    if args.metrics_port is not None:
+        aggregator = MetricsAggregator()
+        add_hook(aggregator)
+        serve_prometheus(aggregator, args.metrics_port)
+        print(f"Serving metrics on :{args.metrics_port}/metrics")
+    signal.signal(signal.SIGINT, lambda signum, frame: watcher.stop())
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    watcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import cache
+from src.cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.path = os.path.join(self.workdir, "cache.json")
+
+    def test_puts_are_batched(self):
+        store = DiskCache(self.path, max_entries=100, flush_delay=60)
+        with mock.patch.object(cache, "atomic_write_json", wraps=cache.atomic_write_json) as write:
+            for i in range(500):
+                store.put(f"key{i}", i)
+            self.assertEqual(write.call_count, 0)
+            store.flush()
+            self.assertEqual(write.call_count, 1)
+            store.flush()  # Nothing changed since
+            self.assertEqual(write.call_count, 1)
+
+        reloaded = DiskCache(self.path, max_entries=100)
+        self.assertEqual(len(reloaded), 100)  # Least recently used entries were evicted
+        self.assertIsNone(reloaded.get("key0"))
+        self.assertEqual(reloaded.get("key499"), 499)
+
+    def test_delayed_write(self):
+        store = DiskCache(self.path, flush_delay=0.05)
+        store.put("a", 1)
+        store._timer.join()
+        self.assertEqual(DiskCache(self.path).get("a"), 1)
+
+    def test_write_through(self):
+        store = DiskCache(self.path, flush_delay=0)
+        store.put("a", 1)
+        self.assertEqual(DiskCache(self.path).get("a"), 1)
+
+    def test_removed_folder_is_not_recreated(self):
+        folder = os.path.join(self.workdir, "job")
+        os.mkdir(folder)
+        store = DiskCache(os.path.join(folder, "stats.json"), flush_delay=60)
+        store.put("a", 1)
+        shutil.rmtree(folder)
+        store._flush_deferred()
+        self.assertFalse(os.path.exists(folder))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import io
+import os
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import dl_ffmpeg
+from src.dl_ffmpeg import InstallError, download_ffmpeg, installed_version
+
+ETAG = '"build-1"'
+
+
+def make_archive():
+    """ A release-style zip with ffmpeg/ffprobe in a bin folder, large enough to need several download chunks. """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("ffmpeg-stub/bin/ffmpeg", os.urandom(2 * 1024 * 1024))
+        archive.writestr("ffmpeg-stub/bin/ffprobe", os.urandom(1024 * 1024))
+        archive.writestr("ffmpeg-stub/doc/README.txt", "not extracted")
+    return buffer.getvalue()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """ Serves `files` with Range/If-Range support; paths in `truncate` are cut short once. """
+    files = {}
+    truncate = set()
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("Range")))
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", ETAG) == ETAG:
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        payload = body[start:]
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.path in self.truncate:
+            self.truncate.discard(self.path)
+            payload = payload[:len(payload) // 2]  # The connection drops halfway through
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadFFmpegTest(unittest.TestCase):
+    def setUp(self):
+        self.archive = make_archive()
+        self.sha256 = hashlib.sha256(self.archive).hexdigest()
+        RangeHandler.files = {
+            "/release/ffmpeg.zip": self.archive,
+            "/release/checksums.sha256": f"{self.sha256}  ffmpeg.zip\n".encode(),
+        }
+        RangeHandler.truncate = set()
+        RangeHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/release/ffmpeg.zip"
+
+        self.install_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.install_dir, ignore_errors=True)
+        patcher = mock.patch.object(dl_ffmpeg.time, "sleep")  # No retry backoff in tests
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.messages = []
+
+    def install(self, **kwargs):
+        return download_ffmpeg(self.url, install_dir=self.install_dir, log=self.messages.append, **kwargs)
+
+    def archive_requests(self):
+        return [range_header for path, range_header in RangeHandler.requests if path == "/release/ffmpeg.zip"]
+
+    def test_installs_from_published_checksum(self):
+        version = self.install()
+        self.assertEqual(version["sha256"], self.sha256)
+        self.assertEqual(sorted(version["files"]), ["ffmpeg", "ffprobe"])
+        with zipfile.ZipFile(io.BytesIO(self.archive)) as archive:
+            expected = archive.read("ffmpeg-stub/bin/ffmpeg")
+        with open(os.path.join(self.install_dir, "ffmpeg"), "rb") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertFalse(os.path.exists(os.path.join(self.install_dir, "README.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.install_dir, ".download")))
+
+    def test_resumes_after_truncated_response(self):
+        RangeHandler.truncate = {"/release/ffmpeg.zip"}
+        version = self.install(sha256=self.sha256)
+        self.assertEqual(version["sha256"], self.sha256)
+        ranges = self.archive_requests()
+        self.assertEqual(len(ranges), 2)
+        self.assertIsNone(ranges[0])
+        self.assertTrue(ranges[1].startswith("bytes="))
+        self.assertGreater(int(ranges[1][len("bytes="):-1]), 0)  # Continued from the bytes already on disk
+        self.assertTrue(any(message.startswith("Resuming download") for message in self.messages))
+
+    def test_rejects_checksum_mismatch(self):
+        with self.assertRaises(InstallError):
+            self.install(sha256="0" * 64)
+        self.assertIsNone(installed_version(self.install_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.install_dir, "ffmpeg")))
+        self.assertFalse(os.path.exists(os.path.join(self.install_dir, ".download")))
+
+    def test_skips_download_when_version_matches(self):
+        self.install()
+        RangeHandler.requests = []
+        version = self.install()
+        self.assertEqual(version["sha256"], self.sha256)
+        self.assertEqual(self.archive_requests(), [])  # Only the checksum list was fetched
+        self.assertIn(f"FFMPEG is up to date in {self.install_dir}", self.messages)
+
+        self.install(force=True)
+        self.assertEqual(len(self.archive_requests()), 1)
+
+    def test_programming_errors_are_not_retried(self):
+        session = mock.Mock()
+        session.get.side_effect = TypeError("bad argument")
+        with self.assertRaises(TypeError):
+            dl_ffmpeg.download(session, self.url, os.path.join(self.install_dir, "ffmpeg.zip.part"), log=self.messages.append)
+        self.assertEqual(session.get.call_count, 1)
+        with self.assertRaises(TypeError):
+            dl_ffmpeg.fetch_expected_sha256(session, self.url, "ffmpeg.zip")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import encoders
+from src.cache import DiskCache
+
+# Stands in for ffmpeg: lists a few encoders, fails the hevc_nvenc test encode and logs every call
+STUB_FFMPEG = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/calls.log"
+case "$*" in
+  *-version*) echo "ffmpeg version 6.1-stub"; exit 0;;
+  *-encoders*) printf 'Encoders:\\n ------\\n V....D libx264    H.264\\n V....D libx265    H.265\\n V....D h264_nvenc NVENC H.264\\n V....D hevc_nvenc NVENC HEVC\\n V....D mpeg4      MPEG-4\\n'; exit 0;;
+  *hevc_nvenc*) echo "OpenEncodeSessionEx failed: out of memory" >&2; exit 1;;
+esac
+exit 0
+"""
+
+
+@unittest.skipUnless(os.name == "posix", "the stub ffmpeg is a shell script")
+class EncoderCapabilitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.ffmpeg = os.path.join(self.workdir, "ffmpeg")
+        self.write_stub(STUB_FFMPEG)
+        cache = DiskCache(os.path.join(self.workdir, "capabilities.json"), max_entries=16)
+        patcher = mock.patch.object(encoders, "_capability_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def write_stub(self, text):
+        with open(self.ffmpeg, "w") as f:
+            f.write(text)
+        os.chmod(self.ffmpeg, os.stat(self.ffmpeg).st_mode | stat.S_IXUSR)
+
+    def calls(self):
+        try:
+            with open(os.path.join(self.workdir, "calls.log")) as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    def test_encoders_are_probed_and_tested(self):
+        caps = encoders.get_encoder_capabilities(self.ffmpeg)
+        self.assertEqual(caps.version, "ffmpeg version 6.1-stub")
+        self.assertEqual(caps.compiled, ["libx264", "libx265", "h264_nvenc", "hevc_nvenc"])
+        self.assertEqual(caps.working, ["libx264", "libx265", "h264_nvenc"])
+        self.assertEqual(caps.failed, ["hevc_nvenc"])
+        self.assertEqual(encoders.select_encoder("h264", ffmpeg_path=self.ffmpeg), "h264_nvenc")
+        self.assertEqual(encoders.select_encoder("h265", ffmpeg_path=self.ffmpeg), "libx265")
+
+    def test_cached_per_binary(self):
+        first = encoders.get_encoder_capabilities(self.ffmpeg)
+        call_count = len(self.calls())
+        second = encoders.get_encoder_capabilities(self.ffmpeg)
+        self.assertEqual(len(self.calls()), call_count)  # Served from the cache; nothing spawned
+        self.assertEqual(first, second)
+
+        other = os.path.join(self.workdir, "other")
+        os.mkdir(other)
+        shutil.copy2(self.ffmpeg, os.path.join(other, "ffmpeg"))
+        encoders.get_encoder_capabilities(os.path.join(other, "ffmpeg"))
+        self.assertTrue(os.path.exists(os.path.join(other, "calls.log")))  # A different binary gets its own entry
+
+    def test_rebuilt_when_binary_changes(self):
+        encoders.get_encoder_capabilities(self.ffmpeg)
+        # An "upgrade" that adds a working hevc_nvenc: same path, new content and mtime
+        self.write_stub(STUB_FFMPEG.replace('  *hevc_nvenc*) echo "OpenEncodeSessionEx failed: out of memory" >&2; exit 1;;\n', ""))
+        mtime = os.stat(self.ffmpeg).st_mtime_ns + 5_000_000_000
+        os.utime(self.ffmpeg, ns=(mtime, mtime))
+        call_count = len(self.calls())
+        caps = encoders.get_encoder_capabilities(self.ffmpeg)
+        self.assertGreater(len(self.calls()), call_count)
+        self.assertIn("hevc_nvenc", caps.working)
+
+    def test_failed_encoders_retested_after_ttl(self):
+        encoders.get_encoder_capabilities(self.ffmpeg)
+        call_count = len(self.calls())
+        with mock.patch.object(encoders.time, "time", return_value=encoders.time.time() + encoders.FAILED_RETEST_SECONDS + 1):
+            caps = encoders.get_encoder_capabilities(self.ffmpeg)
+        new_calls = self.calls()[call_count:]
+        self.assertEqual(len(new_calls), 1)  # Only the failed encoder is tried again
+        self.assertIn("hevc_nvenc", new_calls[0])
+        self.assertEqual(caps.failed, ["hevc_nvenc"])
+
+        call_count = len(self.calls())
+        encoders.get_encoder_capabilities(self.ffmpeg)
+        self.assertEqual(len(self.calls()), call_count)  # Re-test time recorded; within the TTL again
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import os
+import unittest
+
+from src.helpers import generate_output_filename
+
+
+class OutputFilenameTest(unittest.TestCase):
+    def test_target_size_is_named_the_same_from_every_entry_point(self):
+        expected = os.path.join("videos", "clip_10MB_compressed.mp4")
+        # Default int, argparse float and GUI text
+        for target_size in (10, 10.0, "10"):
+            self.assertEqual(generate_output_filename(os.path.join("videos", "clip.mp4"), target_size), expected)
+        self.assertEqual(generate_output_filename("clip.mkv", 7.5), "clip_7.5MB_compressed.mkv")
+
+    def test_custom_name_keeps_extension(self):
+        self.assertEqual(generate_output_filename("clip.mp4", 10, custom_name="small", output_dir="out"),
+                         os.path.join("out", "small.mp4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src import jobstore
+from src.compressor import CompressionResult
+from src.jobstore import JobRunner, JobStore
+
+
+class StubCompressor:
+    """ compress_video stand-in: returns queued outcomes in order and records the arguments of every call. """
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, input_path, output_path, target_size_mb, log=None, on_stage=None, **params):
+        self.calls.append(params)
+        on_stage("probing")
+        on_stage("pass1")
+        success, encoder = self.outcomes.pop(0)
+        return CompressionResult(input_path=input_path, output_path=output_path, success=success, encoder=encoder,
+                                 output_size=1000 if success else None, error=None if success else f"{encoder} failed")
+
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.db = os.path.join(self.workdir, "jobs.sqlite3")
+        self.store = self.open_store()
+
+    def open_store(self):
+        store = JobStore(self.db)
+        self.addCleanup(store.close)
+        return store
+
+    def make_clip(self, name, content=b"clip"):
+        path = os.path.join(self.workdir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def add(self, input_path, **params):
+        params = dict({"codec": None, "use_gpu": True, "use_two_pass": True}, **params)
+        return self.store.add_job(input_path, input_path + ".out.mp4", 10, **params)
+
+    def test_duplicate_submit_is_deduplicated(self):
+        clip = self.make_clip("clip.mp4")
+        job_id, added = self.add(clip)
+        self.assertTrue(added)
+        self.assertEqual(self.add(clip), (job_id, False))
+        self.assertEqual(self.add(self.make_clip("copy.mp4")), (job_id, False))  # Same contents elsewhere
+
+        self.assertTrue(self.add(clip, codec="h264")[1])  # Different parameters
+        self.assertTrue(self.add(self.make_clip("other.mp4", b"other clip"))[1])  # Different contents
+        self.assertEqual(len(self.store.jobs()), 3)
+
+    def test_claim_hands_each_job_to_one_worker(self):
+        for i in range(40):
+            self.add(self.make_clip(f"clip{i}.mp4", f"clip {i}".encode()))
+        stores = [self.store, self.open_store()]  # Two connections, as if two processes shared the database
+        claimed = []
+        lock = threading.Lock()
+
+        def worker(store):
+            while True:
+                job = store.claim_next()
+                if job is None:
+                    return
+                with lock:
+                    claimed.append(job["id"])
+
+        threads = [threading.Thread(target=worker, args=(stores[i % 2],)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), [job["id"] for job in self.store.jobs()])
+        self.assertEqual({job["state"] for job in self.store.jobs()}, {"probing"})
+
+    def test_interrupted_job_is_requeued_on_reopen(self):
+        job_id, _ = self.add(self.make_clip("clip.mp4"))
+        self.store.claim_next()
+        self.store.update(job_id, state="pass2")
+        self.store.close()  # The process dies mid-encode
+
+        store = self.open_store()
+        self.assertIsNone(store.claim_next())  # Still marked running until recovered
+        stub = StubCompressor([(True, "libx265")])
+        with mock.patch.object(jobstore, "compress_video", stub):
+            JobRunner(store, log=None).run()
+        job = store.get(job_id)
+        self.assertEqual((job["state"], job["attempts"], job["encoder"]), ("done", 1, "libx265"))
+
+    def test_retry_backoff_and_cpu_fallback(self):
+        job_id, _ = self.add(self.make_clip("clip.mp4"))
+        runner = JobRunner(self.store, max_attempts=3, backoff=30, log=None)
+        stub = StubCompressor([(False, "hevc_nvenc"), (False, "libx265"), (False, "libx265")])
+        with mock.patch.object(jobstore, "compress_video", stub):
+            delays = []
+            for _ in range(3):
+                self.store.update(job_id, next_attempt_at=0)  # Skip the wait
+                start = time.time()
+                runner.run_job(self.store.claim_next())
+                job = self.store.get(job_id)
+                delays.append(round(job["next_attempt_at"] - start) if job["state"] == "queued" else None)
+
+        self.assertEqual([call["use_gpu"] for call in stub.calls], [True, False, False])  # Hardware failure -> CPU
+        self.assertEqual(delays, [30, 60, None])  # Exponential backoff, then give up
+        self.assertEqual((job["state"], job["attempts"], job["error"]), ("failed", 3, "libx265 failed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from src import metrics
+from src.metrics import MetricsAggregator, MetricsHook, add_hook, instrument_job, mark_stage, remove_hook
+
+
+class Result:
+    def __init__(self, success, output_size):
+        self.success = success
+        self.cache_hit = False
+        self.encoder = "libx264"
+        self.error = None
+        self.output_size = output_size
+
+
+class Collector(MetricsHook):
+    def __init__(self):
+        self.spans = []
+        self.jobs = []
+
+    def on_span(self, span):
+        self.spans.append(span)
+
+    def on_job(self, job):
+        self.jobs.append(job)
+
+
+class InstrumentJobTest(unittest.TestCase):
+    def setUp(self):
+        self.collector = Collector()
+        self.aggregator = MetricsAggregator()
+        for hook in (self.collector, self.aggregator):
+            add_hook(hook)
+            self.addCleanup(remove_hook, hook)
+
+    def test_finished_job(self):
+        @instrument_job
+        def compress(input_path, output_path, target_size_mb):
+            mark_stage("probing")
+            mark_stage("pass1")
+            return Result(True, 512 * 1024)
+
+        compress("in.mp4", "out.mp4", 1)
+        job, = self.collector.jobs
+        self.assertTrue(job.success)
+        self.assertEqual([span.name for span in job.spans], ["probing", "pass1"])
+        self.assertEqual(job.size_ratio, 0.5)
+        self.assertEqual(self.aggregator.jobs["success"], 1)
+
+    def test_raising_job_is_recorded_as_failed(self):
+        @instrument_job
+        def compress(input_path, output_path, target_size_mb):
+            mark_stage("pass1")
+            raise RuntimeError("encoder crashed")
+
+        with self.assertRaises(RuntimeError):
+            compress("in.mp4", "out.mp4", target_size_mb=1)
+        job, = self.collector.jobs
+        self.assertFalse(job.success)
+        self.assertEqual(job.error, "RuntimeError: encoder crashed")
+        self.assertEqual([span.name for span in job.spans], ["pass1"])  # The open span was closed
+        self.assertEqual(self.aggregator.jobs["failed"], 1)
+        self.assertIn('compressor_jobs_total{status="failed"} 1', self.aggregator.prometheus_text())
+        self.assertIsNone(getattr(metrics._current, "recorder", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
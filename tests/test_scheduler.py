@@ -0,0 +1,129 @@
+import time
+import threading
+import unittest
+
+from src.batch import BatchJob
+from src.encoders import encoder_class
+from src.scheduler import ThroughputScheduler, simulated_run_job
+
+GPU, CPU = "hevc_nvenc", "libx265"
+SPEEDS = {GPU: 100.0, CPU: 10.0}  # Mpx/s of the stub devices
+
+
+class FixedRates:
+    """ Throughput store stand-in that already knows the stub devices' true speeds. """
+
+    def __init__(self, speeds):
+        self.speeds = speeds
+
+    def rate(self, encoder, mode):
+        return self.speeds[encoder]
+
+    def measured(self, encoder, mode):
+        return self.speeds[encoder]
+
+
+def make_jobs(count):
+    return [BatchJob(f"clip{i}.mp4", f"clip{i}_compressed.mp4", 10) for i in range(count)]
+
+
+class PlanTest(unittest.TestCase):
+    """ One planning step at a frozen time: which jobs start now, and where. """
+
+    def make_scheduler(self, work, limits, speeds=SPEEDS):
+        scheduler = ThroughputScheduler(
+            lambda job, encoder: None, limits=limits, encoders=[GPU, CPU], throughput_store=FixedRates(speeds),
+            clock=lambda: 0.0,
+        )
+        scheduler._work = work
+        return scheduler
+
+    def test_earliest_finish_assignment(self):
+        big, small_a, small_b, tiny = make_jobs(4)
+        work = {id(big): 1000.0, id(small_a): 100.0, id(small_b): 100.0, id(tiny): 50.0}
+        scheduler = self.make_scheduler(work, {"nvenc": 1, "cpu": 2})
+        starts = scheduler._plan([big, small_a, small_b, tiny], {})
+        # big: 10 s on the GPU vs 100 s on a CPU session. small_a/small_b: 10 s on an idle CPU session beat
+        # waiting 10 s for the GPU and taking 1 s. tiny: the GPU frees up at 10 s and finishes it at 10.5 s,
+        # before either CPU session would (15 s), so it waits for the GPU and doesn't start now.
+        self.assertEqual(starts, [(big, GPU, 10.0), (small_a, CPU, 10.0), (small_b, CPU, 10.0)])
+
+    def test_session_limits(self):
+        jobs = make_jobs(6)
+        work = {id(job): 100.0 for job in jobs}
+        # Equally fast devices: every idle session gets a job, and no class starts more than its limit
+        scheduler = self.make_scheduler(work, {"nvenc": 2, "cpu": 1}, speeds={GPU: 100.0, CPU: 100.0})
+        starts = scheduler._plan(jobs, {})
+        counts = {}
+        for _, encoder, _ in starts:
+            counts[encoder_class(encoder)] = counts.get(encoder_class(encoder), 0) + 1
+        self.assertEqual(counts, {"nvenc": 2, "cpu": 1})
+
+    def test_busy_device_counts_its_wait(self):
+        running_job, job = make_jobs(2)
+        work = {id(running_job): 200.0, id(job): 100.0}
+        scheduler = self.make_scheduler(work, {"nvenc": 1, "cpu": 1})
+        running = {"future": (running_job, GPU, "two_pass", 0.0, 2.0)}
+        # Waiting 2 s for the GPU (done at 3 s) beats 10 s on the idle CPU: nothing starts yet
+        self.assertEqual(scheduler._plan([job], running), [])
+        running = {"future": (running_job, GPU, "two_pass", 0.0, 20.0)}
+        self.assertEqual(scheduler._plan([job], running), [(job, CPU, 10.0)])
+
+    def test_gpu_disallowed_jobs_stay_on_cpu(self):
+        job = BatchJob("clip.mp4", "clip_compressed.mp4", 10, use_gpu=False)
+        scheduler = self.make_scheduler({id(job): 1000.0}, {"nvenc": 1, "cpu": 1})
+        self.assertEqual(scheduler._plan([job], {}), [(job, CPU, 100.0)])
+
+
+class DrainTest(unittest.TestCase):
+    """ A fast stub GPU and a slow stub CPU working through a queue together. """
+
+    def test_gpu_and_cpu_drain_queue_together(self):
+        time_scale = 0.01  # Ten real milliseconds per simulated second; shorter sleeps drown in timer overhead
+        clock = lambda: time.monotonic() / time_scale
+        jobs = make_jobs(24)
+        work = {id(job): 200.0 + 40.0 * (i % 7) for i, job in enumerate(jobs)}
+        megapixels = lambda job: work[id(job)]
+        limits = {"nvenc": 1, "cpu": 2}
+        speeds = {GPU: 100.0, CPU: 25.0}
+
+        lock = threading.Lock()
+        active = {"nvenc": 0, "cpu": 0}
+        peak = dict(active)
+        stub = simulated_run_job(speeds, megapixels, clock, seed=1, jitter=0.0)
+
+        def run_job(job, encoder):
+            name = encoder_class(encoder)
+            with lock:
+                active[name] += 1
+                peak[name] = max(peak[name], active[name])
+            try:
+                return stub(job, encoder)
+            finally:
+                with lock:
+                    active[name] -= 1
+
+        assigned = {}
+        scheduler = ThroughputScheduler(
+            run_job, limits=limits, encoders=[GPU, CPU], throughput_store=FixedRates(speeds), megapixels=megapixels,
+            on_assign=lambda job, encoder, expected: assigned.__setitem__(id(job), encoder), clock=clock,
+        )
+        start = clock()
+        results = scheduler.run(jobs)
+        makespan = clock() - start
+
+        self.assertTrue(all(result.success for result in results))
+        self.assertEqual([result.input_path for result in results], [job.input_path for job in jobs])
+        self.assertEqual([result.encoder for result in results], [assigned[id(job)] for job in jobs])
+        self.assertLessEqual(peak["nvenc"], limits["nvenc"])
+        self.assertLessEqual(peak["cpu"], limits["cpu"])
+        gpu_work = sum(work[id(job)] for job in jobs if assigned[id(job)] == GPU)
+        cpu_work = sum(work.values()) - gpu_work
+        self.assertGreater(gpu_work, cpu_work)  # The fast device takes most of the work...
+        self.assertGreater(cpu_work, 0)  # ...but the CPU sessions help
+        gpu_only = sum(work.values()) / speeds[GPU]
+        self.assertLess(makespan, 0.85 * gpu_only)  # Together: 150 Mpx/s instead of 100
+
+
+if __name__ == "__main__":
+    unittest.main()
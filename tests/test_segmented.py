@@ -0,0 +1,96 @@
+import os
+import stat
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from src import metrics, segmented
+from src.runner import CancelToken
+
+# Stands in for ffmpeg: the chunk starting near 30 s fails at once; every other encode takes 30 s unless a
+# "fast" file sits next to the stub, and writes a small output
+STUB_FFMPEG = """#!/bin/sh
+for last; do :; done
+case "$*" in
+  *"-ss 29."*) echo "chunk exploded" >&2; exit 1;;
+esac
+[ -e "$(dirname "$0")/fast" ] || sleep 30
+case "$last" in /dev/null|NUL) ;; *) head -c 1000 /dev/zero > "$last";; esac
+exit 0
+"""
+
+
+@unittest.skipUnless(os.name == "posix", "the stub ffmpeg is a shell script")
+class SegmentedTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        ffmpeg = os.path.join(self.workdir, "ffmpeg")
+        with open(ffmpeg, "w") as f:
+            f.write(STUB_FFMPEG)
+        os.chmod(ffmpeg, os.stat(ffmpeg).st_mode | stat.S_IXUSR)
+
+        # A 120 s clip with keyframes every 30 s, cut into four chunks
+        info = SimpleNamespace(duration=120.0, fps=30.0, video=None, audio=SimpleNamespace(duration=None))
+        for name, value in (
+            ("FFMPEG_PATH", ffmpeg), ("probe_media", lambda *args, **kwargs: info),
+            ("probe_keyframes", lambda info: [0.0, 30.0, 60.0, 90.0]),
+            ("plan_bitrates", lambda *args, **kwargs: (1000, 128)),
+        ):
+            patcher = mock.patch.object(segmented, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.output_path = os.path.join(self.workdir, "out", "clip_compressed.mp4")
+        os.mkdir(os.path.dirname(self.output_path))
+
+    def compress(self, **kwargs):
+        return segmented.compress_video_segmented(
+            os.path.join(self.workdir, "clip.mp4"), self.output_path, 10, use_two_pass=False, segments=4,
+            encoder="libx264", log=None, **kwargs
+        )
+
+    def test_failed_chunk_stops_its_siblings(self):
+        start = time.monotonic()
+        result = self.compress()
+        self.assertLess(time.monotonic() - start, 15)  # Not the 30 s the other chunks would take
+        self.assertFalse(result.success)
+        self.assertFalse(result.cancelled)
+        self.assertIn("chunk exploded", result.error)
+        self.assertEqual(os.listdir(os.path.dirname(self.output_path)), [])  # Segment folder removed
+
+    def test_cancel_reaches_every_chunk(self):
+        token = CancelToken()
+        timer = threading.Timer(0.5, token.cancel)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.monotonic()
+        with mock.patch.object(segmented, "choose_split_points", lambda *args: [0.0, 60.0, 120.0]):
+            result = self.compress(cancel_token=token)
+        self.assertLess(time.monotonic() - start, 15)
+        self.assertTrue(result.cancelled)
+        self.assertEqual(os.listdir(os.path.dirname(self.output_path)), [])
+
+    def test_worker_processes_are_charged_to_the_job(self):
+        open(os.path.join(self.workdir, "fast"), "w").close()
+        jobs = []
+        hook = metrics.MetricsHook()
+        hook.on_job = jobs.append
+        metrics.add_hook(hook)
+        self.addCleanup(metrics.remove_hook, hook)
+        with mock.patch.object(segmented, "choose_split_points", lambda *args: [0.0, 60.0, 120.0]):
+            result = metrics.instrument_job(segmented.compress_video_segmented)(
+                os.path.join(self.workdir, "clip.mp4"), self.output_path, 10, use_two_pass=False, encoder="libx264",
+                log=None,
+            )
+        self.assertTrue(result.success, result.error)
+        spans = {span.name: span for span in jobs[0].spans}
+        self.assertEqual(spans["pass1"].processes, 3)  # Two chunks and the audio, all on pool threads
+        self.assertEqual(spans["finalize"].processes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import streaming
+from src.compressor import CompressionResult
+from src.streaming import StreamError, compress_stream
+
+# Stands in for ffmpeg: logs its arguments and "encodes" by copying stdin to stdout
+STUB_FFMPEG = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/calls.log"
+exec cat
+"""
+
+
+@unittest.skipUnless(os.name == "posix", "the stub ffmpeg is a shell script")
+class CompressStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.ffmpeg = os.path.join(self.workdir, "ffmpeg")
+        with open(self.ffmpeg, "w") as f:
+            f.write(STUB_FFMPEG)
+        os.chmod(self.ffmpeg, os.stat(self.ffmpeg).st_mode | stat.S_IXUSR)
+        self.spool_dir = os.path.join(self.workdir, "spool")
+        os.mkdir(self.spool_dir)
+        patcher = mock.patch.object(streaming, "select_encoder", lambda codec, use_gpu, ffmpeg_path: "libx264")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = os.urandom(300 * 1024)  # Several feeder chunks; not an MP4, so no seeking check applies
+
+    def calls(self):
+        with open(os.path.join(self.workdir, "calls.log")) as f:
+            return f.read().splitlines()
+
+    def compress(self, **kwargs):
+        return compress_stream(io.BytesIO(self.source), 10, spool_dir=self.spool_dir, log=None,
+                               ffmpeg_path=self.ffmpeg, **kwargs)
+
+    def copy_out(self, stream):
+        output = io.BytesIO()
+        with stream:
+            shutil.copyfileobj(stream, output)
+        return output.getvalue()
+
+    def test_pipe_writes_streamable_container(self):
+        for container, flags in (("mp4", "-movflags +frag_keyframe+empty_moov+default_base_moof -f mp4"),
+                                 ("matroska", "-f matroska")):
+            stream = self.compress(duration=60, container=container)
+            self.assertEqual(self.copy_out(stream), self.source)
+            self.assertTrue(stream.result.success)
+            self.assertEqual(stream.result.output_size, len(self.source))
+            cmd = self.calls()[-1]
+            self.assertIn("-i pipe:0", cmd)
+            self.assertTrue(cmd.endswith(f"{flags} -y pipe:1"), cmd)
+        self.assertEqual(os.listdir(self.spool_dir), [])  # Nothing touched the disk
+
+    def fake_compress_video(self, success):
+        def compress_video(input_path, output_path, target_size_mb, **kwargs):
+            with open(input_path, "rb") as f:
+                self.spooled_input = f.read()
+            self.assertEqual(os.listdir(self.spool_dir), [os.path.basename(os.path.dirname(input_path))])
+            with open(output_path, "wb") as f:
+                f.write(b"compressed")
+            return CompressionResult(input_path=input_path, output_path=output_path, success=success,
+                                     error=None if success else "encode failed")
+        return mock.patch.object(streaming, "compress_video", compress_video)
+
+    def test_two_pass_and_unknown_duration_spool(self):
+        for kwargs in ({"duration": 60, "use_two_pass": True}, {"duration": None}):
+            with self.fake_compress_video(success=True):
+                stream = self.compress(**kwargs)
+                self.assertEqual(self.copy_out(stream), b"compressed")
+            self.assertEqual(self.spooled_input, self.source)
+            self.assertTrue(stream.result.success)
+            self.assertEqual(os.listdir(self.spool_dir), [])  # Spool folder removed on close
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, "calls.log")))  # Never piped
+
+    def test_spool_removed_after_error(self):
+        with self.fake_compress_video(success=False):
+            stream = self.compress(duration=None)
+            with self.assertRaises(StreamError):
+                self.copy_out(stream)
+        self.assertEqual(stream.result.error, "encode failed")
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,19 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image
 import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.compressor import compress_video as run_compression
+from src.estimator import Estimator
+from src.cache import file_fingerprint
+from src.helpers import generate_output_filename
+from src.probe import probe_media, ProbeError
+from src.ranges import format_timestamp, parse_timestamp
+from src.runner import CancelToken, format_progress
+from src.thumbnails import extract_thumbnail, ThumbnailError
 
 class VideoCompressorGUI(ctk.CTk):
     def __init__(self):
@@ -23,12 +34,15 @@ class VideoCompressorGUI(ctk.CTk):
         self.create_nav_bar()
         self.create_main_content_frame()     # Grid container with 3 rows: top, common info, and theme buttons
         self.create_file_size_page()         # Builds file size UI into left_content_frame
-        self.create_custom_page_frame()      # Builds custom UI into left_content_frame
         self.create_common_video_info()      # Builds common video info into right_content_frame
+        self.bind_estimate_triggers()
         
-        # Start with the File Size page
+        # Start with the File Size page; the Custom page is built the first time it is shown
         self.show_file_size_page()
         self.bind_drag_and_drop()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Icons are decoration: load them once the window has painted
+        self.after_idle(self.load_nav_icons)
 
     def setup_constants(self):
         self.PADDING = 5
@@ -38,6 +52,10 @@ class VideoCompressorGUI(ctk.CTk):
         self.CORNER_RADIUS = 10
         self.FONT = ctk.CTkFont(family="Arial", size=12)
         self.THEME_OPTIONS = ["Dark", "Light", "System"]
+        self.QUEUE_POLL_MS = 100
+        self.PREVIEW_SIZE = (250, 200)
+        self.THUMBNAIL_MEMORY_ITEMS = 32  # CTkImages kept in memory for instant re-selection
+        self.ESTIMATE_DEBOUNCE_MS = 150  # Recompute estimates once typing pauses
 
     def setup_variables(self):
         # Video metadata
@@ -47,6 +65,11 @@ class VideoCompressorGUI(ctk.CTk):
         self.video_original_framerate = "N/A"
         self.video_original_bitrate = "N/A"
         self.estimated_output_size = "N/A"
+        self.estimated_encode_time = "N/A"
+        self.estimator = Estimator()
+        self.estimate_after_id = None
+        # Pages built on first use
+        self.custom_page_frame = None
         # Sidebar
         self.sidebar_expanded = False
         self.sidebar_width_narrow = 60
@@ -59,9 +82,21 @@ class VideoCompressorGUI(ctk.CTk):
         self.codec_var = tk.StringVar(value="h264")
         self.codec_options = ["h264", "h265", "av1"]
         # Additional Custom page parameters
-        self.resolution_var = tk.StringVar(value="720p")
-        self.framerate_var = tk.StringVar(value="30")
+        self.resolution_var = tk.StringVar(value="Auto")  # Auto lets the compressor pick from the bitrate budget
+        self.framerate_var = tk.StringVar(value="Auto")
         self.bitrate_var = tk.StringVar()
+        # Background compression
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compress")
+        self.ui_queue = queue.Queue()
+        self.compression_future = None
+        self.compression_running = False
+        self.cancel_token = None
+        self.queue_polling = False
+        # Metadata and preview thumbnails load on worker threads; thumbnails are cached as CTkImages (LRU)
+        # and as JPEGs on disk
+        self.preview_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview")
+        self.thumbnail_images = OrderedDict()
+        self.pending_previews = 0
 
     def create_nav_bar(self):
         self.nav_frame = ctk.CTkFrame(self, width=self.sidebar_width_narrow, corner_radius=0, fg_color="transparent")
@@ -71,7 +106,6 @@ class VideoCompressorGUI(ctk.CTk):
         self.nav_toggle_button = ctk.CTkButton(
             self.nav_frame,
             text=">",
-            image=self.load_nav_icon("nav.png"),
             width=30,
             height=30,
             command=self.toggle_sidebar
@@ -81,7 +115,6 @@ class VideoCompressorGUI(ctk.CTk):
         self.file_size_nav_button = ctk.CTkButton(
             self.nav_frame,
             text="",
-            image=self.load_nav_icon("filesize.png"),
             compound="left",
             anchor="w",
             width=50,
@@ -94,7 +127,6 @@ class VideoCompressorGUI(ctk.CTk):
         self.custom_nav_button = ctk.CTkButton(
             self.nav_frame,
             text="",
-            image=self.load_nav_icon("placeholder.png"),
             compound="left",
             anchor="w",
             width=50,
@@ -223,6 +255,20 @@ class VideoCompressorGUI(ctk.CTk):
         self.target_size_entry = ctk.CTkEntry(self.file_size_input_frame, width=self.ENTRY_WIDTH, font=self.FONT)
         self.target_size_entry.grid(row=3, column=1, padx=(0, self.PADDING), sticky="w")
 
+        self.range_label = ctk.CTkLabel(self.file_size_input_frame, text="Range (start - end)", font=self.FONT)
+        self.range_label.grid(row=4, column=0, padx=(0,5), sticky="e")
+        self.range_frame = ctk.CTkFrame(self.file_size_input_frame, fg_color="transparent")
+        self.range_frame.grid(row=4, column=1, padx=(0, self.PADDING), sticky="w")
+        range_entry_width = (self.ENTRY_WIDTH - 20) // 2
+        self.range_start_entry = ctk.CTkEntry(self.range_frame, width=range_entry_width, font=self.FONT,
+                                              placeholder_text="0:00")
+        self.range_start_entry.pack(side="left")
+        self.range_dash_label = ctk.CTkLabel(self.range_frame, text="-", width=20, font=self.FONT)
+        self.range_dash_label.pack(side="left")
+        self.range_end_entry = ctk.CTkEntry(self.range_frame, width=range_entry_width, font=self.FONT,
+                                            placeholder_text="end")
+        self.range_end_entry.pack(side="left")
+
     def create_custom_page_frame(self):
         # Build the Custom page into left_content_frame.
         self.custom_page_frame = ctk.CTkFrame(self.left_content_frame, corner_radius=0, fg_color="transparent")
@@ -284,7 +330,7 @@ class VideoCompressorGUI(ctk.CTk):
 
         self.resolution_label = ctk.CTkLabel(self.custom_input_frame, text="Resolution", font=self.FONT)
         self.resolution_label.grid(row=2, column=0, padx=(0,5), sticky="e")
-        self.resolution_options = ["720p", "1080p", "1440p"]
+        self.resolution_options = ["Auto", "480p", "720p", "1080p", "1440p"]
         self.resolution_dropdown = ctk.CTkOptionMenu(
             self.custom_input_frame,
             values=self.resolution_options,
@@ -297,7 +343,7 @@ class VideoCompressorGUI(ctk.CTk):
 
         self.framerate_label = ctk.CTkLabel(self.custom_input_frame, text="Framerate", font=self.FONT)
         self.framerate_label.grid(row=3, column=0, padx=(0,5), sticky="e")
-        self.framerate_options = ["30", "60"]
+        self.framerate_options = ["Auto", "30", "60"]
         self.framerate_dropdown = ctk.CTkOptionMenu(
             self.custom_input_frame,
             values=self.framerate_options,
@@ -333,6 +379,8 @@ class VideoCompressorGUI(ctk.CTk):
         self.length_res_fps_label.pack(anchor="w", pady=(0, 2))
         self.size_codec_bitrate_label = ctk.CTkLabel(self.video_info_frame, text="Size: N/A N/A N/A", font=self.FONT)
         self.size_codec_bitrate_label.pack(anchor="w", pady=(0, 2))
+        self.encode_time_label = ctk.CTkLabel(self.video_info_frame, text="Encode time: N/A", font=self.FONT)
+        self.encode_time_label.pack(anchor="w", pady=(0, 2))
         
         # Common info section (for compression status, etc.) is placed in the common_info_frame (row 1)
         common_info = self._create_info_section(self.common_info_frame, height=300)
@@ -368,14 +416,17 @@ class VideoCompressorGUI(ctk.CTk):
         self.sidebar_expanded = not self.sidebar_expanded
 
     def show_file_size_page(self):
-        self.custom_page_frame.grid_forget()
+        if self.custom_page_frame is not None:
+            self.custom_page_frame.grid_forget()
         self.file_size_page.grid(row=0, column=0, sticky="nsew")
-        self.update_video_info()
+        self.refresh_estimate()
 
     def show_custom_page(self):
+        if self.custom_page_frame is None:
+            self.create_custom_page_frame()
         self.file_size_page.grid_forget()
         self.custom_page_frame.grid(row=0, column=0, sticky="nsew")
-        self.update_video_info()
+        self.refresh_estimate()
 
     def update_bitrate_options(self, event=None):
         resolution = self.resolution_var.get()
@@ -398,17 +449,130 @@ class VideoCompressorGUI(ctk.CTk):
         self.bitrate_var.set("")
         self.bitrate_dropdown.configure(values=self.bitrate_options)
 
+    def custom_page_visible(self):
+        return self.custom_page_frame is not None and self.custom_page_frame.winfo_ismapped()
+
+    def get_custom_overrides(self):
+        """
+        Explicit resolution/framerate from the Custom page, if it is the page in use.
+        :return: (output height or None, framerate or None); None means the compressor chooses.
+        """
+        if not self.custom_page_visible():
+            return None, None
+        resolution = self.resolution_var.get()
+        framerate = self.framerate_var.get()
+        height = int(resolution.rstrip("p")) if resolution != "Auto" else None
+        fps = int(framerate) if framerate != "Auto" else None
+        return height, fps
+
+    def get_ranges(self):
+        """
+        Time range from the Range entries (seconds or m:ss); empty start/end mean the start/end of the video.
+        :return: [(start, end or None)], or None to compress the whole video.
+        :raises ValueError: If an entry isn't a timestamp or the range is empty.
+        """
+        start_text, end_text = self.range_start_entry.get().strip(), self.range_end_entry.get().strip()
+        if not start_text and not end_text:
+            return None
+        start = parse_timestamp(start_text) if start_text else 0.0
+        end = parse_timestamp(end_text) if end_text else None
+        if end is not None and end <= start:
+            raise ValueError("The range end must be after its start")
+        return [(start, end)]
+
+    def describe_range(self):
+        """
+        The range being encoded, for display: the entries live on the File Size page only, but apply on every page.
+        :return: "m:ss-m:ss", "invalid", or None for the whole video.
+        """
+        try:
+            ranges = self.get_ranges()
+        except ValueError:
+            return "invalid"
+        if not ranges:
+            return None
+        start, end = ranges[0]
+        return f"{format_timestamp(start)}-{format_timestamp(end) if end is not None else 'end'}"
+
     def update_video_info(self):
         if self.video_filepath:
             length_res_fps_text = f"Length: {self.video_length} ({self.video_original_resolution}) {self.video_original_framerate}"
+            range_text = self.describe_range()
+            if range_text:
+                length_res_fps_text += f" Range: {range_text}"
             chosen_codec = self.codec_var.get() if self.codec_var.get() else "N/A"
             chosen_bitrate = self.bitrate_var.get() if self.bitrate_var.get() else "N/A"
             size_codec_bitrate_text = f"Size: {self.estimated_output_size} {chosen_codec} {chosen_bitrate}"
             self.length_res_fps_label.configure(text=length_res_fps_text)
             self.size_codec_bitrate_label.configure(text=size_codec_bitrate_text)
+            self.encode_time_label.configure(text=f"Encode time: {self.estimated_encode_time}")
         else:
             self.length_res_fps_label.configure(text="Length: N/A (N/A) N/A")
             self.size_codec_bitrate_label.configure(text="Size: N/A N/A N/A")
+            self.encode_time_label.configure(text="Encode time: N/A")
+
+    def bind_estimate_triggers(self):
+        # Every control that affects the output re-runs the estimator (debounced)
+        for var in (self.codec_var, self.use_gpu_var, self.use_two_pass_var, self.resolution_var,
+                    self.framerate_var, self.bitrate_var):
+            var.trace_add("write", self.schedule_estimate)
+        for entry in (self.target_size_entry, self.range_start_entry, self.range_end_entry):
+            entry.bind("<KeyRelease>", self.schedule_estimate)
+
+    def schedule_estimate(self, *args):
+        if self.estimate_after_id is not None:
+            self.after_cancel(self.estimate_after_id)
+        self.estimate_after_id = self.after(self.ESTIMATE_DEBOUNCE_MS, self.refresh_estimate)
+
+    def refresh_estimate(self):
+        # Pure arithmetic on the already-probed MediaInfo; never touches ffmpeg
+        self.estimate_after_id = None
+        try:
+            target_size = float(self.target_size_entry.get().strip())
+        except ValueError:
+            target_size = None
+        bitrate_kbps = None
+        if not target_size and self.custom_page_visible():
+            bitrate_kbps = self.parse_bitrate_option(self.bitrate_var.get())
+        resolution, framerate = self.get_custom_overrides()
+        try:
+            ranges = self.get_ranges()
+        except ValueError:
+            self.show_estimate(None)  # N/A until the range is valid
+            return
+        estimate = self.estimator.estimate(
+            target_size_mb=target_size if target_size and target_size > 0 else None,
+            video_bitrate_kbps=bitrate_kbps,
+            codec=self.codec_var.get(),
+            use_gpu=self.use_gpu_var.get(),
+            use_two_pass=self.use_two_pass_var.get(),
+            resolution=resolution,
+            framerate=framerate,
+            ranges=ranges,
+        )
+        self.show_estimate(estimate)
+
+    def show_estimate(self, estimate):
+        if estimate is None:
+            self.estimated_output_size = "N/A"
+            self.estimated_encode_time = "N/A"
+        else:
+            fps_text = f"{estimate.fps:g}fps" if estimate.fps else ""
+            self.estimated_output_size = f"{estimate.output_size_mb:.1f}MB ({estimate.width}x{estimate.height} {fps_text})"
+            if estimate.fast_path:
+                self.estimated_encode_time = f"instant ({estimate.fast_path}, no re-encode)"
+            else:
+                minutes, seconds = divmod(int(round(estimate.encode_seconds)), 60)
+                self.estimated_encode_time = f"~{minutes}:{seconds:02d} with {estimate.encoder}"
+        self.update_video_info()
+
+    @staticmethod
+    def parse_bitrate_option(option):
+        # "High (7.5 Mbps)" -> 7500
+        try:
+            return int(float(option.split("(")[1].split()[0]) * 1000)
+        except (IndexError, ValueError):
+            return None
 
     def browse_file(self):
         filepath = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4;*.avi;*.mov")])
@@ -416,18 +580,92 @@ class VideoCompressorGUI(ctk.CTk):
             self.video_filepath = filepath
             self.update_status(f"Selected file: {filepath}")
             self.load_preview_image(filepath)
-            # For demonstration, set metadata manually
-            self.video_length = "0:34"
-            self.video_original_resolution = "2560x1440"
-            self.video_original_framerate = "60fps"
-            self.video_original_bitrate = "28Mbps"
-            self.estimated_output_size = "116.83 MB"
+            self.load_video_metadata(filepath)
+            self.update_video_info()
+
+    def load_video_metadata(self, filepath):
+        # Probing (and warming the encoder registry) happens on a worker; show_metadata applies the result
+        self.estimator.set_media(None)
+        self.estimated_output_size = "N/A"
+        self.estimated_encode_time = "N/A"
+        self.pending_previews += 1
+        self.preview_executor.submit(self.probe_video, filepath)
+        self.start_queue_polling()
+
+    def probe_video(self, filepath):
+        try:
+            self.ui_queue.put(("metadata", (filepath, self.estimator.probe(filepath), None)))
+        except ProbeError as e:
+            self.ui_queue.put(("metadata", (filepath, None, e)))
+
+    def show_metadata(self, filepath, info, error):
+        if filepath != self.video_filepath:
+            return  # A newer selection replaced this one
+        if error is not None:
+            self.update_status(f"Unable to read video metadata: {error}")
+            return
+        self.estimator.set_media(info)
+        minutes, seconds = divmod(int(round(info.duration)), 60)
+        self.video_length = f"{minutes}:{seconds:02d}"
+        self.video_original_resolution = info.resolution or "N/A"
+        self.video_original_framerate = f"{info.fps:g}fps" if info.fps else "N/A"
+        self.video_original_bitrate = f"{info.bit_rate_kbps / 1000:.1f}Mbps" if info.bit_rate_kbps else "N/A"
+        self.refresh_estimate()
 
     def load_preview_image(self, filepath):
+        try:
+            key = file_fingerprint(filepath)
+        except OSError:
+            self.show_default_preview()
+            return
+        image = self.thumbnail_images.get(key)
+        if image is not None:
+            self.thumbnail_images.move_to_end(key)
+            self.preview_image_label.configure(image=image, text="")
+            return
+        self.preview_image_label.configure(image=None, text="Loading preview...")
+        self.pending_previews += 1
+        self.preview_executor.submit(self.extract_preview, filepath, key)
+        self.start_queue_polling()
+
+    def extract_preview(self, filepath, key):
+        # Runs on a thumbnail worker: ffmpeg (or the disk cache) plus JPEG decoding stay off the Tk thread
+        from PIL import Image  # Only needed once a video is selected; keeps it out of startup
+
+        try:
+            duration = probe_media(filepath).duration
+        except ProbeError:
+            duration = 0
+        try:
+            with Image.open(extract_thumbnail(filepath, duration=duration)) as image:
+                image.load()
+                self.ui_queue.put(("thumbnail", (filepath, key, image.copy())))
+        except (ThumbnailError, OSError) as e:
+            print(f"Error extracting preview image: {e}")
+            self.ui_queue.put(("thumbnail", (filepath, key, None)))
+
+    def show_thumbnail(self, filepath, key, pil_image):
+        if pil_image is None:
+            if filepath == self.video_filepath:
+                self.show_default_preview()
+            return
+        # Fit inside the preview area, keeping the aspect ratio
+        max_width, max_height = self.PREVIEW_SIZE
+        scale = min(max_width / pil_image.width, max_height / pil_image.height)
+        image = ctk.CTkImage(pil_image, size=(int(pil_image.width * scale), int(pil_image.height * scale)))
+        self.thumbnail_images[key] = image
+        self.thumbnail_images.move_to_end(key)
+        while len(self.thumbnail_images) > self.THUMBNAIL_MEMORY_ITEMS:
+            self.thumbnail_images.popitem(last=False)
+        if filepath == self.video_filepath:  # The user may have picked another file meanwhile
+            self.preview_image_label.configure(image=image, text="")
+
+    def show_default_preview(self):
         try:
             image_path = os.path.join(os.path.dirname(__file__), "default_preview.png")
             if os.path.exists(image_path):
-                img = ctk.CTkImage(Image.open(image_path), size=(250, 200))
+                from PIL import Image
+                img = ctk.CTkImage(Image.open(image_path), size=self.PREVIEW_SIZE)
                 self.preview_image_label.configure(image=img, text="")
             else:
                 self.preview_image_label.configure(text="Preview not available")
@@ -436,27 +674,134 @@ class VideoCompressorGUI(ctk.CTk):
             self.preview_image_label.configure(text="Preview not available")
 
     def compress_video(self):
-        target_size = self.target_size_entry.get()
-        codec = self.codec_var.get()
-        use_gpu = self.use_gpu_var.get()
-        use_two_pass = self.use_two_pass_var.get()
-        self.update_status("Compressing... (Placeholder)")
-        self.update_progress(0.25)
-        self.after(1000, lambda: self.update_progress(0.5))
-        self.after(2000, lambda: self.update_progress(0.75))
-        self.after(3000, lambda: self.compression_complete())
+        if self.compression_future and not self.compression_future.done():
+            self.update_status("A compression is already running.")
+            return
+        if not self.video_filepath:
+            self.update_status("Select a video first.")
+            return
+        target_size_text = self.target_size_entry.get().strip()
+        try:
+            target_size = float(target_size_text)
+        except ValueError:
+            self.update_status("Enter a target size in MB.")
+            return
+        if target_size <= 0:
+            self.update_status("Enter a target size in MB.")
+            return
+
+        try:
+            ranges = self.get_ranges()
+        except ValueError as e:
+            self.update_status(f"Invalid range: {e}. Use seconds or m:ss.")
+            return
+
+        output_path = generate_output_filename(self.video_filepath, target_size_text)
+        resolution, framerate = self.get_custom_overrides()
+        self.cancel_token = CancelToken()
+        range_text = self.describe_range()
+        range_note = f" (range {range_text})" if range_text else ""
+        self.update_status(f"Compressing {os.path.basename(self.video_filepath)}{range_note}...")
+        self.update_progress(0)
+
+        # Run the encode on the worker thread; it only ever talks to Tk through ui_queue
+        self.compression_future = self.executor.submit(
+            run_compression,
+            input_path=self.video_filepath,
+            output_path=output_path,
+            target_size_mb=target_size,
+            use_gpu=self.use_gpu_var.get(),
+            use_two_pass=self.use_two_pass_var.get(),
+            codec=self.codec_var.get(),
+            resolution=resolution,
+            framerate=framerate,
+            ranges=ranges,
+            log=lambda message: self.ui_queue.put(("log", message)),
+            on_progress=lambda event: self.ui_queue.put(("progress", event)),
+            cancel_token=self.cancel_token,
+        )
+        self.compression_running = True
+        self.compression_future.add_done_callback(lambda future: self.ui_queue.put(("done", future)))
+        self.start_queue_polling()
+
+    def start_queue_polling(self):
+        if not self.queue_polling:
+            self.queue_polling = True
+            self.after(self.QUEUE_POLL_MS, self.process_ui_queue)
+
+    def process_ui_queue(self):
+        # Runs on the Tk thread: apply everything the workers posted since the last call
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == "log":
+                    self.append_log(payload)
+                elif kind == "progress":
+                    self.update_progress(payload.progress)
+                    self.common_status_label.configure(text=format_progress(payload))
+                elif kind == "done":
+                    self.compression_running = False
+                    self.handle_compression_result(payload)
+                elif kind == "thumbnail":
+                    self.pending_previews -= 1
+                    self.show_thumbnail(*payload)
+                elif kind == "metadata":
+                    self.pending_previews -= 1
+                    self.show_metadata(*payload)
+        except queue.Empty:
+            pass
+        # Poll only while something is in flight
+        if self.compression_running or self.pending_previews:
+            self.after(self.QUEUE_POLL_MS, self.process_ui_queue)
+        else:
+            self.queue_polling = False
+
+    def handle_compression_result(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.update_status(f"Compression failed: {e}")
+            self.update_progress(0)
+            return
+        if result.cancelled:
+            self.update_status("Compression cancelled.")
+            self.update_progress(0)
+        elif result.success:
+            self.compression_complete()
+            self.append_log(f"Saved {result.output_path} ({result.output_size / (1024 * 1024):.2f} MB)")
+        else:
+            self.update_status(result.error or "Compression failed.")
+            self.update_progress(0)
 
     def cancel_compression(self):
+        if self.compression_future and not self.compression_future.done():
+            # Kills the ffmpeg process tree; the worker cleans up partial files and reports back
+            self.cancel_token.cancel()
+            self.common_status_label.configure(text="Cancelling...")
+            return
         self.update_status("Compression cancelled.")
         self.update_progress(0)
 
+    def on_close(self):
+        if self.cancel_token:
+            self.cancel_token.cancel()
+        self.executor.shutdown(wait=False)
+        self.preview_executor.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
+
+    def append_log(self, message):
+        self.common_info_textbox.configure(state="normal")
+        self.common_info_textbox.insert(tk.END, f"\n{message}")
+        self.common_info_textbox.configure(state="disabled")
+        self.common_info_textbox.see(tk.END)
+
     def update_status(self, message):
-        self.status_label.configure(text=message)
-        self.info_textbox.configure(state="normal")
-        self.info_textbox.delete("0.0", "end")
-        self.info_textbox.insert("0.0", message)
-        self.info_textbox.configure(state="disabled")
-        self.info_textbox.see(tk.END)
+        self.common_status_label.configure(text=message)
+        self.common_info_textbox.configure(state="normal")
+        self.common_info_textbox.delete("0.0", "end")
+        self.common_info_textbox.insert("0.0", message)
+        self.common_info_textbox.configure(state="disabled")
+        self.common_info_textbox.see(tk.END)
 
         if hasattr(self, 'custom_status_label'):
             self.custom_status_label.configure(text=message)
@@ -468,7 +813,7 @@ class VideoCompressorGUI(ctk.CTk):
             self.custom_info_textbox.see(tk.END)
 
     def update_progress(self, value):
-        self.progress_bar.set(value)
+        self.common_progress_bar.set(value)
         if hasattr(self, 'custom_progress_bar'):
             self.custom_progress_bar.set(value)
 
@@ -512,14 +857,24 @@ class VideoCompressorGUI(ctk.CTk):
         except tk.TclError:
             pass
 
+    def load_nav_icons(self):
+        for button, filename in ((self.nav_toggle_button, "nav.png"), (self.file_size_nav_button, "filesize.png"),
+                                 (self.custom_nav_button, "placeholder.png")):
+            image = self.load_nav_icon(filename)
+            if image is not None:
+                button.configure(image=image)
+
     def load_nav_icon(self, filename):
-        try:
-            image_path = os.path.join(os.path.dirname(__file__), filename)
-            image = ctk.CTkImage(tk.PhotoImage(file=image_path), size=(20, 20))
-            return image
-        except tk.TclError:
+        image_path = os.path.join(os.path.dirname(__file__), filename)
+        if not os.path.exists(image_path):
             print(f"Error loading navigation icon: {filename}. Make sure it exists in the same directory.")
             return None
+        try:
+            from PIL import Image
+            return ctk.CTkImage(Image.open(image_path), size=(20, 20))
+        except OSError as e:
+            print(f"Error loading navigation icon: {filename}: {e}")
+            return None
 
 if __name__ == "__main__":
     app = VideoCompressorGUI()